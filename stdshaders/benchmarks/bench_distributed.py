@@ -0,0 +1,122 @@
+"""
+Measures how distributed compiles scale with the number of workers, all on localhost.
+
+Each combo is "compiled" by a stand-in that waits a fixed delay, in place of fxc's compile time, and
+writes a few bytes. That way the numbers show the coordinator's overhead rather than how many cores
+this machine has. On POSIX the stand-in is a shell script, since starting a Python interpreter per
+combo would make the CPU the bottleneck on small machines.
+
+Usage: python benchmarks/bench_distributed.py [-workers 1,2,4,8] [-shaders N] [-delay SECONDS]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+STDSHADERS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, STDSHADERS_DIR)
+
+from benchmarks.gen_corpus import CorpusOptions  # noqa: E402
+from benchmarks.gen_corpus import generate_corpus  # noqa: E402
+from shadercompile_utils import update_shaders  # noqa: E402
+from shadercompile_utils.distributed import Coordinator  # noqa: E402
+from shadercompile_utils.distributed import staged_sources  # noqa: E402
+
+_SLOW_COMPILER_PY = """
+import sys
+import time
+time.sleep({delay})
+with open(sys.argv[1], "wb") as out_file:
+    out_file.write(b"FXC")
+"""
+
+_SLOW_COMPILER_SH = """
+sleep {delay}
+printf FXC > "$1"
+"""
+
+
+def _write_compiler(directory, delay):
+    """:return: Command template for a stand-in compiler that takes ``delay`` seconds per combo"""
+    if os.name == 'nt':
+        path = os.path.join(directory, "slow_fxc.py")
+        with open(path, "w") as compiler_file:
+            compiler_file.write(_SLOW_COMPILER_PY.format(delay=delay))
+        return "{} {} {{output}} {{source}}".format(sys.executable, path)
+    path = os.path.join(directory, "slow_fxc.sh")
+    with open(path, "w") as compiler_file:
+        compiler_file.write(_SLOW_COMPILER_SH.format(delay=delay))
+    return "sh {} {{output}} {{source}}".format(path)
+
+
+def run(shader_list, stage_dir, compiler, workers, chunk_size):
+    """:return: ``(seconds, combos)`` to compile every combo with ``workers`` local workers"""
+    coordinator = Coordinator(staged_sources(shader_list, stage_dir), 0, chunk_size=chunk_size)
+    processes = [
+        subprocess.Popen([sys.executable, os.path.join(STDSHADERS_DIR, "buildshaders.py"),
+                          "-worker", "localhost:{}".format(coordinator.port), "-compiler", compiler, "-threads", "1"],
+                         stdout=subprocess.DEVNULL)
+        for _ in range(workers)
+    ]
+    start = time.perf_counter()
+    try:
+        results = coordinator.run(shader_list)
+    finally:
+        coordinator.close()
+        for process in processes:
+            process.wait()
+    elapsed = time.perf_counter() - start
+    failed = sum(len(result.failures) for result in results.values())
+    if failed:
+        raise RuntimeError("{} combos failed".format(failed))
+    return elapsed, sum(result.expected for result in results.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark distributed compiles on localhost.")
+    parser.add_argument('-workers', help="Comma separated worker counts", default="1,2,4,8")
+    parser.add_argument('-shaders', help="Source files in the corpus", type=int, default=5)
+    parser.add_argument('-combos', help="Combos per shader", type=int, default=4)
+    parser.add_argument('-delay', help="Seconds each combo takes to compile", type=float, default=0.1)
+    parser.add_argument('-chunk_size', help="Combos per chunk", type=int, default=4)
+    parser.add_argument('-out', help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    work_dir = os.getcwd()
+    corpus_dir = tempfile.mkdtemp(prefix="shader_corpus_")
+    try:
+        generate_corpus(corpus_dir, CorpusOptions(shaders=args.shaders, combos=args.combos, skips=2, depth=2))
+        os.chdir(corpus_dir)
+        compiler = _write_compiler(corpus_dir, args.delay)
+
+        shader_list = [shader for shader in update_shaders("corpus", ".") if shader.type == "fxc"]
+        for shader in shader_list:
+            shader.generate(False)
+        stage_dir = os.path.join(corpus_dir, "stage")
+        os.mkdir(stage_dir)
+        for name in os.listdir(corpus_dir):
+            if name.endswith((".fxc", ".h")):
+                shutil.copyfile(name, os.path.join(stage_dir, name))
+
+        rows = []
+        for workers in (int(count) for count in args.workers.split(",")):
+            seconds, combos = run(shader_list, stage_dir, compiler, workers, args.chunk_size)
+            rows.append({'workers': workers, 'combos': combos, 'seconds': seconds})
+            speedup = rows[0]['seconds'] / seconds * rows[0]['workers']
+            print("{:3} workers: {:7.2f}s for {} combos, {:5.2f}x ({:.0%} efficiency)".format(
+                workers, seconds, combos, speedup, speedup / workers), flush=True)
+    finally:
+        os.chdir(work_dir)
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, "w") as out_file:
+            json.dump(rows, out_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Measures how fast built .vcs files can be checked: memory mapped and walked by vcs_inspect, against
+reading each one whole with read_vcs. Counting combos means decompressing every LZMA block either way,
+checking just the structure doesn't.
+
+The files are written by write_vcs from random bytecode, so a share of their blocks are LZMA
+compressed like a real build's would be.
+
+Usage: python benchmarks/bench_inspect.py [-files N] [-static N] [-dynamic N] [-threads N] [-out results.json]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shadercompile_utils.vcs_file import read_vcs  # noqa: E402
+from shadercompile_utils.vcs_file import write_vcs  # noqa: E402
+from shadercompile_utils.vcs_inspect import find_vcs  # noqa: E402
+from shadercompile_utils.vcs_inspect import inspect_many  # noqa: E402
+
+
+def write_corpus(directory, files, static, dynamic, seed=0):
+    """Write ``files`` .vcs files of ``static`` x ``dynamic`` combos, about a third of them skipped."""
+    rng = random.Random(seed)
+    # A pool of bytecode shared between combos, as fxc output often is
+    pool = [bytes(rng.getrandbits(8) for _ in range(rng.randrange(64, 512))) * 4 for _ in range(64)]
+    for number in range(files):
+        bytecode = {index: rng.choice(pool) for index in range(static * dynamic) if rng.random() > 0.3}
+        write_vcs(os.path.join(directory, "shader{}.vcs".format(number)), bytecode, static * dynamic, dynamic,
+                  threads=1)
+
+
+def time_call(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark checking .vcs files.")
+    parser.add_argument('-files', type=int, default=2000)
+    parser.add_argument('-static', help="Static combos per file", type=int, default=16)
+    parser.add_argument('-dynamic', help="Dynamic combos per file", type=int, default=8)
+    parser.add_argument('-threads', type=int, default=os.cpu_count())
+    parser.add_argument('-out', help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    corpus_dir = tempfile.mkdtemp(prefix="vcs_corpus_")
+    try:
+        write_corpus(corpus_dir, args.files, args.static, args.dynamic)
+        paths = find_vcs(corpus_dir)
+        read_seconds, files = time_call(lambda: [read_vcs(path) for path in paths])
+        headers_seconds, _ = time_call(lambda: inspect_many(paths, threads=args.threads, count_combos=False))
+        inspect_seconds, infos = time_call(lambda: inspect_many(paths, threads=args.threads))
+        sizes_seconds, _ = time_call(lambda: inspect_many(paths, True, args.threads))
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    combos = sum(len(vcs.combos()) for vcs in files)
+    assert combos == sum(info.combos for info in infos) and all(info.ok for info in infos)
+    results = {
+        'files': len(paths),
+        'combos': combos,
+        'read_vcs_seconds': read_seconds,
+        'structure_seconds': headers_seconds,
+        'inspect_seconds': inspect_seconds,
+        'inspect_sizes_seconds': sizes_seconds,
+    }
+    print("{} files, {} combos".format(len(paths), combos))
+    print("  read_vcs          {:7.2f}s".format(read_seconds))
+    print("  structure only    {:7.2f}s ({:.1f}x)".format(headers_seconds, read_seconds / headers_seconds))
+    print("  count combos      {:7.2f}s ({:.1f}x)".format(inspect_seconds, read_seconds / inspect_seconds))
+    print("  combo sizes       {:7.2f}s".format(sizes_seconds))
+
+    if args.out:
+        with open(args.out, "w") as out_file:
+            json.dump(results, out_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
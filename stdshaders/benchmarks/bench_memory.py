@@ -0,0 +1,145 @@
+"""
+Measures how much memory the shader list takes, against the dict based model it replaced.
+
+The old model kept every shader in a plain object with an instance dict and every combo as a dict of
+strings, and loaded the list into a list of dicts before making any shaders. Both models are built
+from the same generated corpus and the same parsed sources; parsing is done up front so only the
+shader records and their combos are counted.
+
+Usage: python benchmarks/bench_memory.py [-shaders N] [-out results.json] [corpus flags, see gen_corpus.py]
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.gen_corpus import add_corpus_arguments  # noqa: E402
+from benchmarks.gen_corpus import corpus_options  # noqa: E402
+from benchmarks.gen_corpus import generate_corpus  # noqa: E402
+from shadercompile_utils import fxc_file  # noqa: E402
+from shadercompile_utils import update_shaders  # noqa: E402
+
+
+class _LegacyShader:
+    """The old ``BaseShader``: an instance dict and its own empty containers."""
+
+    def __init__(self, file_name, shader_name, compile_vcs=True):
+        self.file_name = os.path.basename(file_name)
+        self.file_path = os.path.dirname(file_name)
+        if self.file_path != "":
+            self.file_path += os.sep
+        self.shader_name = os.path.basename(shader_name)
+        self.type = "fxc" if ".fxc" in file_name else ""
+        self._dependencies = None
+        self.static_combos = []
+        self.dynamic_combos = []
+        self.static_defs = {}
+        self.skip_code = ""
+        self.skips = []
+        self.centroid_mask = 0
+        self.inc_file = True
+        self.compile_vcs = compile_vcs
+        self.header_code = ""
+        self.file_list_code = ""
+        self.inc_updated = False
+        self.amalgam_header = None
+        self.index_code = ""
+        self.build_options = {}
+
+
+def _legacy_load(list_name):
+    """Load the list the old way, into a list of dicts first."""
+    name_list = []
+    with open(list_name + ".txt") as list_file:
+        for line in list_file:
+            clean_line = re.sub(r"//.*$", "", line).strip().lower()
+            if ".fxc" not in clean_line:
+                continue
+            base = clean_line.replace(".fxc", "")
+            if "_ps2x" in clean_line:
+                names = [base.replace("_ps2x", "_ps20"), base.replace("_ps2x", "_ps20b")]
+            elif "_vsxx" in clean_line:
+                names = [base.replace("_vsxx", "_vs11"), base.replace("_vsxx", "_vs20")]
+            else:
+                names = [base]
+            name_list.extend({'file': clean_line, 'name': name, 'type': 'fxc'} for name in names)
+    return [_LegacyShader(entry['file'], entry['name']) for entry in name_list]
+
+
+def _legacy_combos(combos):
+    return [{'name': combo.name, 'min': str(combo.min), 'max': str(combo.max)} for combo in combos]
+
+
+def _legacy_specialize(shader):
+    static_combos, dynamic_combos, shader.static_defs, shader.skips, shader.centroid_mask = \
+        fxc_file.parse_input_file(shader.file_path + shader.file_name).specialize(shader.shader_name)
+    # Copies, as the old scanner built them from the matched text
+    shader.static_combos = _legacy_combos(static_combos)
+    shader.dynamic_combos = _legacy_combos(dynamic_combos)
+
+
+def _specialize(shader):
+    shader.static_combos, shader.dynamic_combos, shader.static_defs, shader.skips, shader.centroid_mask = \
+        fxc_file.parse_input_file(shader.file_path + shader.file_name).specialize(shader.shader_name)
+
+
+def measure(load, specialize, list_name):
+    """
+    :return: Dict of ``shaders``, and the bytes retained after loading and specializing, and the peak
+    """
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        shaders = load(list_name)
+        loaded = tracemalloc.get_traced_memory()[0] - base
+        for shader in shaders:
+            specialize(shader)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'shaders': len(shaders), 'loaded_bytes': loaded, 'retained_bytes': current - base, 'peak_bytes': peak - base}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the memory taken by the shader list.")
+    parser.add_argument('-out', help="Write results to this JSON file")
+    add_corpus_arguments(parser)
+    parser.set_defaults(shaders=3000, body_lines=10)
+    args = parser.parse_args()
+
+    work_dir = os.getcwd()
+    corpus_dir = tempfile.mkdtemp(prefix="shader_corpus_")
+    try:
+        generate_corpus(corpus_dir, corpus_options(args))
+        os.chdir(corpus_dir)
+        # Parse every source up front, the parse cache is the same for both models
+        for shader in update_shaders("corpus", "."):
+            fxc_file.parse_input_file(shader.file_path + shader.file_name)
+        results = {
+            'legacy': measure(_legacy_load, _legacy_specialize, "corpus"),
+            'compact': measure(lambda name: update_shaders(name, "."), _specialize, "corpus"),
+        }
+    finally:
+        os.chdir(work_dir)
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    print("{} shaders".format(results['compact']['shaders']))
+    for field in ('loaded_bytes', 'retained_bytes', 'peak_bytes'):
+        legacy = results['legacy'][field]
+        compact = results['compact'][field]
+        print("  {:15} {:9.2f} MB -> {:9.2f} MB ({:.0%} less)".format(
+            field.replace("_bytes", ""), legacy / (1024 * 1024), compact / (1024 * 1024), 1 - compact / legacy))
+
+    if args.out:
+        with open(args.out, "w") as out_file:
+            json.dump(results, out_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
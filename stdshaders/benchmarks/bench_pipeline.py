@@ -0,0 +1,212 @@
+"""
+Times each phase of the Python build pipeline over a generated corpus and records peak memory.
+
+Results are written as JSON so runs on different commits can be compared; ``-compare`` fails if any
+phase got slower than ``-threshold`` times the baseline.
+
+Usage: python benchmarks/bench_pipeline.py [-corpus DIR] [-out results.json] [-compare baseline.json]
+    [-repeat N] [corpus flags, see gen_corpus.py]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.gen_corpus import add_corpus_arguments  # noqa: E402
+from benchmarks.gen_corpus import corpus_options  # noqa: E402
+from benchmarks.gen_corpus import generate_corpus  # noqa: E402
+from shadercompile_utils import fxc_file  # noqa: E402
+from shadercompile_utils import include_graph  # noqa: E402
+from shadercompile_utils import update_shaders  # noqa: E402
+from shadercompile_utils.build_manifest import BuildManifest  # noqa: E402
+from shadercompile_utils.skip_eval import SkipEvaluator  # noqa: E402
+
+
+def _reset_caches():
+    """Forget everything read so far, so each run starts cold."""
+    include_graph._shared_graph = None
+    fxc_file._parsed_sources.clear()
+
+
+def _phases(list_name):
+    """
+    Yield ``(name, func)`` for each phase, in build order. Each phase gets the previous one's result.
+    """
+    yield "load", lambda _: update_shaders(list_name, ".")
+
+    def dependencies(shaders):
+        for shader in shaders:
+            shader.get_dependencies()
+        return shaders
+    yield "dependencies", dependencies
+
+    def manifest(shaders):
+        build_manifest = BuildManifest(os.path.abspath("compile_temp/buildmanifest.json"))
+        for shader in shaders:
+            build_manifest.shader_key(shader, {})
+        return shaders
+    yield "manifest", manifest
+
+    def parse(shaders):
+        for shader in shaders:
+            fxc_file.parse_input_file(shader.file_path + shader.file_name).specialize(shader.shader_name)
+        return shaders
+    yield "parse", parse
+
+    def generate(shaders):
+        for shader in shaders:
+            shader.generate(False)
+        return shaders
+    yield "generate", generate
+
+    def write(shaders):
+        for shader in shaders:
+            shader.write(False)
+        return shaders
+    yield "write", write
+
+    def count_combos(shaders):
+        for shader in shaders:
+            SkipEvaluator(shader.static_combos, shader.dynamic_combos, shader.skips).count_live()
+        return shaders
+    yield "count_combos", count_combos
+
+
+def _prepare_output():
+    shutil.rmtree("include", ignore_errors=True)
+    shutil.rmtree("compile_temp", ignore_errors=True)
+    os.makedirs("include")
+    os.makedirs("compile_temp")
+
+
+def run_once(list_name, trace_memory=False):
+    """
+    Run every phase once, from a cold start.
+
+    :return: Dict of phase name to seconds, or to peak traced bytes if ``trace_memory``
+    """
+    _reset_caches()
+    _prepare_output()
+    results = {}
+    value = None
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        for name, func in _phases(list_name):
+            if trace_memory:
+                tracemalloc.reset_peak()
+            start = time.perf_counter()
+            value = func(value)
+            elapsed = time.perf_counter() - start
+            results[name] = tracemalloc.get_traced_memory()[1] if trace_memory else elapsed
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.decode().strip()
+    except OSError:
+        return ""
+
+
+def benchmark(list_name, repeat):
+    """
+    Time every phase ``repeat`` times, keeping the fastest, then measure memory in one traced run.
+
+    :return: Dict of phase name to ``{'seconds': ..., 'peak_bytes': ...}``
+    """
+    timings = [run_once(list_name) for _ in range(repeat)]
+    memory = run_once(list_name, trace_memory=True)
+    return {
+        name: {'seconds': min(run[name] for run in timings), 'peak_bytes': memory[name]}
+        for name in timings[0]
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Print each phase against a baseline run.
+
+    :return: Names of phases slower than ``threshold`` times the baseline
+    """
+    regressions = []
+    for name, phase in results['phases'].items():
+        old = baseline['phases'].get(name)
+        if old is None or old['seconds'] == 0:
+            continue
+        ratio = phase['seconds'] / old['seconds']
+        flag = ""
+        if ratio > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("  {:14} {:8.1f} ms -> {:8.1f} ms ({:+.0%}){}".format(
+            name, old['seconds'] * 1000, phase['seconds'] * 1000, ratio - 1, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Python build pipeline.")
+    parser.add_argument('-corpus', help="Corpus directory, generated here if it has no list yet")
+    parser.add_argument('-out', help="Write results to this JSON file")
+    parser.add_argument('-compare', help="Baseline results JSON to compare against")
+    parser.add_argument('-threshold', help="Slowdown ratio that counts as a regression", type=float, default=1.25)
+    parser.add_argument('-repeat', help="Timing repetitions", type=int, default=3)
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+
+    options = corpus_options(args)
+    work_dir = os.getcwd()
+    corpus_dir = os.path.abspath(args.corpus) if args.corpus else tempfile.mkdtemp(prefix="shader_corpus_")
+    try:
+        if not os.path.isfile(os.path.join(corpus_dir, "corpus.txt")):
+            generate_corpus(corpus_dir, options)
+        os.chdir(corpus_dir)
+        phases = benchmark("corpus", max(1, args.repeat))
+    finally:
+        os.chdir(work_dir)
+        if not args.corpus:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    results = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': options.to_dict(),
+        'phases': phases,
+        'total_seconds': sum(phase['seconds'] for phase in phases.values()),
+    }
+
+    print("{} shaders, {} combos each".format(options.shaders, options.combos))
+    for name, phase in phases.items():
+        print("  {:14} {:8.1f} ms {:10.1f} MB peak".format(name, phase['seconds'] * 1000,
+                                                           phase['peak_bytes'] / (1024 * 1024)))
+    print("  {:14} {:8.1f} ms".format("total", results['total_seconds'] * 1000))
+
+    if args.out:
+        with open(args.out, "w") as out_file:
+            json.dump(results, out_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        print("Compared to {}:".format(baseline.get('commit') or args.compare))
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Slower than {:.0%} of the baseline: {}".format(args.threshold, ", ".join(regressions)))
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
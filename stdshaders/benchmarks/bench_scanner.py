@@ -0,0 +1,140 @@
+"""
+Compares the single pass combo scanner against the old find_combos/find_skips/find_centroids passes.
+
+Usage: python benchmarks/bench_scanner.py [-lines N] [-repeat N]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shadercompile_utils import fxc_file  # noqa: E402
+
+
+def _legacy_find_combos(source, shader_name):
+    static_combos = []
+    dynamic_combos = []
+    static_defs = {}
+    for i, line in enumerate(source):
+        if re.search(r"^\s*$", line):
+            continue
+        if "[XBOX]" in line:
+            source[i] = ""
+            continue
+        match = re.match(r".*_ps(\d+\w?)$", shader_name)
+        if match and re.match(r".*\[ps\d+\w?]", line.lower()) and not "[ps{}]".format(match.group(1)) in line.lower():
+            source[i] = ""
+            continue
+        match = re.match(r".*_vs(\d+\w?)$", shader_name)
+        if match and re.match(r".*\[vs\d+\w?]", line.lower()) and not "[vs{}]".format(match.group(1)) in line.lower():
+            source[i] = ""
+            continue
+        match = re.match(r".*\[=([^]]+)]", line.lower())
+        initial_value = ""
+        if match:
+            initial_value = match.group(1)
+        source[i] = line = re.sub(r"\[[^\[\]]*]", "", line)
+        match = re.match(r"^\s*//\s*STATIC\s*:\s*\"(.*)\"\s+\"(\d+)\.\.(\d+)\"", line)
+        if match:
+            static_combos.append({'name': match.group(1), 'min': match.group(2), 'max': match.group(3)})
+            static_defs[match.group(1)] = initial_value
+        match = re.match(r"^\s*//\s*DYNAMIC\s*:\s*\"(.*)\"\s+\"(\d+)\.\.(\d+)\"", line)
+        if match:
+            dynamic_combos.append({'name': match.group(1), 'min': match.group(2), 'max': match.group(3)})
+    return static_combos, dynamic_combos, static_defs
+
+
+def _legacy_find_skips(source):
+    skips = []
+    for line in source:
+        match = re.match(r"^\s*//\s*SKIP\s*:\s*(.*)$", line)
+        if match:
+            skips.append(match.group(1).strip())
+    return skips
+
+
+def _legacy_find_centroids(source):
+    centroid_mask = 0
+    for line in source:
+        match = re.match(r"^\s*//\s*CENTROID\s*:\s*TEXCOORD(\d+)$", line)
+        if match:
+            centroid_mask += 1 << int(match.group(1))
+    return centroid_mask
+
+
+def legacy_scan(lines, shader_name):
+    """The scan as it was done before: a copy of the source, then three passes over it."""
+    source = list(lines)
+    static_combos, dynamic_combos, static_defs = _legacy_find_combos(source, shader_name)
+    skips = _legacy_find_skips(source)
+    centroid_mask = _legacy_find_centroids(source)
+    return static_combos, dynamic_combos, static_defs, skips, centroid_mask
+
+
+def _as_legacy(scan):
+    """Turn the :class:`Combo` objects of a scan back into the dicts the old scanner made."""
+    def to_dicts(combos):
+        return [{'name': combo.name, 'min': str(combo.min), 'max': str(combo.max)} for combo in combos]
+
+    static_combos, dynamic_combos, static_defs, skips, centroid_mask = scan
+    return to_dicts(static_combos), to_dicts(dynamic_combos), static_defs, skips, centroid_mask
+
+
+def make_source(num_lines):
+    """A large shader: a handful of directives on top of a big block of ordinary HLSL."""
+    lines = [
+        '// STATIC: "CONVERT_TO_SRGB" "0..1" [ps20b][=g_pHardwareConfig->NeedsShaderSRGBConversion()]\n',
+        '// STATIC: "CONVERT_TO_SRGB" "0..0" [ps20][=0]\n',
+        '// STATIC: "DETAILTEXTURE" "0..1"\n',
+        '// DYNAMIC: "PIXELFOGTYPE" "0..1" [ps20]\n',
+        '// DYNAMIC: "NUM_LIGHTS" "0..4" [ps20b]\n',
+        '// DYNAMIC: "XBOX_ONLY" "0..1" [XBOX]\n',
+        '// SKIP: $DETAILTEXTURE && $NUM_LIGHTS > 2\n',
+        '// CENTROID: TEXCOORD1\n',
+    ]
+    body = [
+        'float4 g_Constants[4] : register( c0 );\n',
+        '\n',
+        '// Ordinary comment\n',
+        'float3 Lighting( float3 n, float3 l[4] ) { return saturate( dot( n, l[0] ) ); }\n',
+    ]
+    while len(lines) < num_lines:
+        lines.extend(body)
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the combo scanner.")
+    parser.add_argument('-lines', help="Lines in the generated source", type=int, default=20000)
+    parser.add_argument('-repeat', help="Timing repetitions", type=int, default=5)
+    args = parser.parse_args()
+
+    lines = tuple(make_source(args.lines))
+    targets = ["bench_ps20", "bench_ps20b"]
+
+    for target in targets:
+        expected = legacy_scan(lines, target)
+        actual = _as_legacy(fxc_file.ParsedSource(lines).specialize(target))
+        if expected != actual:
+            print("Mismatch for " + target)
+            exit(1)
+
+    # Both targets of a _ps2x shader, as _read_shader_list produces them
+    legacy = min(timeit.repeat(lambda: [legacy_scan(lines, t) for t in targets], number=1, repeat=args.repeat))
+
+    def single_pass():
+        parsed = fxc_file.ParsedSource(lines)
+        return [parsed.specialize(t) for t in targets]
+    single = min(timeit.repeat(single_pass, number=1, repeat=args.repeat))
+
+    print("{} lines, {} targets".format(len(lines), len(targets)))
+    print("  legacy:      {:8.2f} ms".format(legacy * 1000))
+    print("  single pass: {:8.2f} ms".format(single * 1000))
+    print("  speedup:     {:8.1f}x".format(legacy / single))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Generates synthetic shader projects for benchmarking the build pipeline.
+
+Every shader gets a mix of static and dynamic combos, target annotations, SKIP lines and a chain of
+includes. Headers are laid out as a deep chain plus diamonds, where two headers include the same
+shared header, so include resolution and flattening get exercised the way a real tree would.
+
+Usage: python benchmarks/gen_corpus.py -out corpus [-shaders N] [-combos N] [-skips N] [-depth N]
+"""
+import argparse
+import os
+import random
+
+# Extensions in the list, in the same proportions as stdshader_dx9_20b.txt roughly has them
+_SHADER_KINDS = ["_ps2x", "_ps2x", "_ps2x", "_vsxx", "_vsxx", "_ps30", "_vs30"]
+
+_BODY = """
+struct PS_INPUT
+{{
+\tfloat2 vTexCoord{index} : TEXCOORD0;
+\tfloat4 vColor : COLOR0;
+}};
+
+float4 Shade{index}( PS_INPUT i )
+{{
+\tfloat4 result = i.vColor;
+#if {first}
+\tresult *= 2.0f;
+#elif {second} > 1
+\tresult.rgb = saturate( result.rgb );
+#endif
+\treturn result;
+}}
+"""
+
+
+class CorpusOptions:
+    """What a generated corpus looks like."""
+
+    def __init__(self, shaders=1000, combos=12, skips=8, depth=6, diamonds=4, headers=40, body_lines=60, seed=1):
+        """
+        :param shaders: Number of source files in the list
+        :param combos: Static and dynamic combos per shader
+        :param skips: SKIP lines per shader
+        :param depth: Length of the include chain every shader pulls in
+        :param diamonds: Diamond shaped include groups per shader
+        :param headers: Size of the pool of shared headers
+        :param body_lines: Rough number of ordinary HLSL lines per file
+        :param seed: Random seed, the same options always give the same corpus
+        """
+        self.shaders = shaders
+        self.combos = combos
+        self.skips = skips
+        self.depth = depth
+        self.diamonds = diamonds
+        self.headers = headers
+        self.body_lines = body_lines
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def _body(index, names, body_lines):
+    first = names[0] if names else "0"
+    second = names[-1] if names else "0"
+    lines = []
+    while len(lines) < body_lines:
+        lines.extend(_BODY.format(index=index + len(lines), first=first, second=second).splitlines(keepends=True))
+    return lines
+
+
+def _write(path, lines):
+    with open(path, "w") as out_file:
+        out_file.writelines(lines)
+
+
+def _write_headers(out_dir, options, rand):
+    """
+    Write the shared headers: ``chain_N.h`` includes ``chain_N+1.h``, and each ``diamond_N.h`` pair
+    includes the same ``shared_N.h``.
+
+    :return: Number of diamond groups written
+    """
+    for level in range(options.depth):
+        lines = ["#ifndef CHAIN_{0}_H\n".format(level), "#define CHAIN_{0}_H\n".format(level)]
+        if level + 1 < options.depth:
+            lines.append('#include "chain_{}.h"\n'.format(level + 1))
+        lines += _body(level * 1000, [], options.body_lines // 2)
+        lines.append("#endif\n")
+        _write(os.path.join(out_dir, "chain_{}.h".format(level)), lines)
+
+    groups = max(1, options.headers // 3)
+    for group in range(groups):
+        shared = ["#ifndef SHARED_{0}_H\n".format(group), "#define SHARED_{0}_H\n".format(group)]
+        shared += _body(group * 100, [], options.body_lines // 4)
+        shared.append("#endif\n")
+        _write(os.path.join(out_dir, "shared_{}.h".format(group)), shared)
+        for side in ("a", "b"):
+            lines = ['#include "shared_{}.h"\n'.format(group)]
+            lines += _body(group * 100 + rand.randrange(50), [], options.body_lines // 4)
+            _write(os.path.join(out_dir, "diamond_{}{}.h".format(group, side)), lines)
+    return groups
+
+
+def _shader_source(index, kind, options, groups, rand):
+    names = ["COMBO_{}_{}".format(index, n) for n in range(options.combos)]
+    lines = []
+    for n, name in enumerate(names):
+        kind_name = "STATIC" if n % 2 == 0 else "DYNAMIC"
+        max_val = rand.choice([1, 1, 1, 2, 3])
+        annotation = ""
+        if kind == "_ps2x" and n % 5 == 4:
+            annotation = " [ps20b]"
+        elif kind == "_vsxx" and n % 5 == 4:
+            annotation = " [vs20]"
+        if kind_name == "STATIC" and n % 4 == 0:
+            annotation += " [=0]"
+        lines.append('// {}: "{}" "0..{}"{}\n'.format(kind_name, name, max_val, annotation))
+    for _ in range(options.skips):
+        a, b = rand.sample(names, 2) if len(names) > 1 else (names[0], names[0])
+        lines.append("// SKIP: ${} && ( ${} > {} )\n".format(a, b, rand.randrange(2)))
+    if kind.startswith("_ps"):
+        lines.append("// CENTROID: TEXCOORD{}\n".format(rand.randrange(4)))
+    lines.append('#include "chain_0.h"\n')
+    for group in rand.sample(range(groups), min(options.diamonds, groups)):
+        lines.append('#include "diamond_{}a.h"\n'.format(group))
+        lines.append('#include "diamond_{}b.h"\n'.format(group))
+    lines += _body(index, names, options.body_lines)
+    return lines
+
+
+def generate_corpus(out_dir, options, list_name="corpus"):
+    """
+    Write a corpus to ``out_dir``.
+
+    :param options: :class:`CorpusOptions`
+    :param list_name: Name of the shader list, ``list_name.txt`` is written next to the sources
+    :return: Path of the shader list, without the ``.txt``
+    """
+    rand = random.Random(options.seed)
+    os.makedirs(out_dir, exist_ok=True)
+    groups = _write_headers(out_dir, options, rand)
+    list_lines = ["// Generated by gen_corpus.py\n"]
+    for index in range(options.shaders):
+        kind = _SHADER_KINDS[index % len(_SHADER_KINDS)]
+        file_name = "bench{}{}.fxc".format(index, kind)
+        _write(os.path.join(out_dir, file_name), _shader_source(index, kind, options, groups, rand))
+        list_lines.append(file_name + "\n")
+    _write(os.path.join(out_dir, list_name + ".txt"), list_lines)
+    return os.path.join(out_dir, list_name)
+
+
+def add_corpus_arguments(parser):
+    """Add a flag for every :class:`CorpusOptions` field."""
+    defaults = CorpusOptions()
+    parser.add_argument('-shaders', help="Source files in the list", type=int, default=defaults.shaders)
+    parser.add_argument('-combos', help="Combos per shader", type=int, default=defaults.combos)
+    parser.add_argument('-skips', help="SKIP lines per shader", type=int, default=defaults.skips)
+    parser.add_argument('-depth', help="Include chain depth", type=int, default=defaults.depth)
+    parser.add_argument('-diamonds', help="Diamond includes per shader", type=int, default=defaults.diamonds)
+    parser.add_argument('-headers', help="Shared headers", type=int, default=defaults.headers)
+    parser.add_argument('-body_lines', help="HLSL lines per file", type=int, default=defaults.body_lines)
+    parser.add_argument('-seed', help="Random seed", type=int, default=defaults.seed)
+
+
+def corpus_options(args):
+    """:return: :class:`CorpusOptions` from flags added by :func:`add_corpus_arguments`"""
+    return CorpusOptions(args.shaders, args.combos, args.skips, args.depth, args.diamonds, args.headers,
+                         args.body_lines, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic shader corpus.")
+    parser.add_argument('-out', help="Output directory", required=True)
+    add_corpus_arguments(parser)
+    args = parser.parse_args()
+    list_path = generate_corpus(args.out, corpus_options(args))
+    print("Wrote {} shaders, list: {}.txt".format(args.shaders, list_path))
+
+
+if __name__ == '__main__':
+    main()
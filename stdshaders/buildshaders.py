@@ -1,11 +1,14 @@
 """Replaces buildshaders.bat"""
 import argparse
-import multiprocessing
 import os
-import shutil
 import sys
 
-import shadercompile_utils.shader_type
+from shadercompile_utils import trace
+from shadercompile_utils._build import DEFAULT_OPTIONS
+from shadercompile_utils._build import ShaderBuild
+from shadercompile_utils.distributed import Worker
+from shadercompile_utils.remote_cache import RemoteCacheServer
+from shadercompile_utils.scheduler import DEFAULT_COMMAND
 
 test_args = [
     '-shaders', 'stdshader_dx9_30',
@@ -17,111 +20,118 @@ test_args = [
 ]
 
 parser = argparse.ArgumentParser(description="Build a shader project.")
-parser.add_argument("-shaders", help="Name of a text file listing shaders to compile.")
+parser.add_argument("-shaders", help="Name of a text file listing shaders to compile. Can be given more than once "
+                                     "to build several lists together, each followed by its own flags, e.g. "
+                                     "\"sm30:force30\"", action='append')
 parser.add_argument('-game', help="gameinfo.txt directory")
 parser.add_argument('-source', help="Root SDK directory. Required if -game is specified")
 parser.add_argument('-bin_dir', help="Bin directory")
 parser.add_argument('-dx9_30', help="Use shader model 3.0", action='store_true')
 parser.add_argument('-force30', help="Force shader model 3.0", action='store_true')
 parser.add_argument('-dynamic', help="Only generate .inc files", action='store_true')
+parser.add_argument('-rebuild', help="Ignore the build manifest and rebuild every shader", action='store_true')
+parser.add_argument('-resume', help="Carry on from the checkpoints of an interrupted -compiler build, only "
+                                  "compiling combos it hadn't finished", action='store_true')
+parser.add_argument('-count_combos', help="Print how many combos of each shader survive its SKIPs", action='store_true')
+parser.add_argument('-live_combos', help="Write the live combo indices of each shader to compile_temp/livecombos",
+                    action='store_true')
+parser.add_argument('-dead_combos', help="Print combos that never change a shader's code", action='store_true')
+parser.add_argument('-collapse_dead', help="Leave combos that never change a shader's code out of filelist.txt and "
+                                           "GetIndex, so they're only compiled once", action='store_true')
+parser.add_argument('-jobs', help="Number of processes used to prep shaders", type=int,
+                    default=DEFAULT_OPTIONS['jobs'])
+parser.add_argument('-threads', help="Number of combos to compile at once", type=int,
+                    default=DEFAULT_OPTIONS['threads'])
+parser.add_argument('-compiler', help="Compile combos with this command instead of shadercompile.exe, "
+                                      "e.g. \"wine fxc.exe /T{profile} /E{entry} {defines} /Fo{output} {source}\"")
+parser.add_argument('-combo_cache', help="Directory for compiled combos, used with -compiler",
+                    default=DEFAULT_OPTIONS['combo_cache'])
+parser.add_argument('-combo_cache_size', help="Combo cache size limit in MB", type=int,
+                    default=DEFAULT_OPTIONS['combo_cache_size'])
+parser.add_argument('-dedup', help="Compile combos that preprocess to the same code only once, used with -compiler",
+                    action='store_true')
+parser.add_argument('-no_combo_cache', help="Don't use the combo cache", action='store_true')
+parser.add_argument('-remote_cache', help="Share compiled combos through the cache server at this URL, used with "
+                                       "-compiler. Combos are compiled locally whenever it's down or slow")
+parser.add_argument('-remote_cache_timeout', help="Seconds a request to the cache server may take", type=float,
+                    default=DEFAULT_OPTIONS['remote_cache_timeout'])
+parser.add_argument('-serve_cache', help="Serve -combo_cache to -remote_cache clients on this port until stopped, "
+                                         "then exit", type=int)
+parser.add_argument('-serve_cache_host', help="Interface -serve_cache listens on, anything but this machine needs "
+                                              "-cache_token", default="127.0.0.1")
+parser.add_argument('-cache_token', help="Shared secret the cache server wants for uploads, for -serve_cache and "
+                                         "-remote_cache. SHADER_CACHE_TOKEN from the environment by default",
+                    default=os.environ.get("SHADER_CACHE_TOKEN", DEFAULT_OPTIONS['cache_token']))
+parser.add_argument('-smoke', help="Compile one combo of every shader first, on every core, and stop if any fail. "
+                                   "Uses -compiler, or fxc.exe from the DirectX SDK under -source", action='store_true')
+parser.add_argument('-verify', help="Check every published .vcs holds the combos its ranges and SKIPs call for",
+                    action='store_true')
+parser.add_argument('-coordinator', help="Hand combos out to workers connecting on this port instead of compiling "
+                                         "them here", type=int)
+parser.add_argument('-coordinator_host', help="Interface -coordinator listens on, anything but this machine needs "
+                                              "-coordinator_token", default=DEFAULT_OPTIONS['coordinator_host'])
+parser.add_argument('-coordinator_token', help="Shared secret workers must send the coordinator, for -coordinator and "
+                                               "-worker. SHADER_COORDINATOR_TOKEN from the environment by default",
+                    default=os.environ.get("SHADER_COORDINATOR_TOKEN", DEFAULT_OPTIONS['coordinator_token']))
+parser.add_argument('-local_workers', help="Worker processes to start on this machine, used with -coordinator",
+                    type=int, default=0)
+parser.add_argument('-chunk_size', help="Combos handed to a worker at a time, used with -coordinator",
+                    type=int, default=DEFAULT_OPTIONS['chunk_size'])
+parser.add_argument('-worker', help="Compile combos for the coordinator at HOST:PORT, then exit. "
+                                    "Only -compiler, -threads and -coordinator_token apply")
+parser.add_argument('-watch', help="Keep running and rebuild shaders as their sources change", action='store_true')
+parser.add_argument('-watch_interval', help="Seconds between checks for changed files", type=float, default=0.25)
+parser.add_argument('-amalgamate', help="Put the index classes of every shader into this many shared headers, "
+                                        "for use in a precompiled header, and make each .inc include its one",
+                    type=int, default=DEFAULT_OPTIONS['amalgamate'])
+parser.add_argument('-history', help="Build history database, used to predict compile times",
+                    default=DEFAULT_OPTIONS['history'])
+parser.add_argument('-no_history', help="Don't record or use the build history", action='store_true')
+parser.add_argument('-budget', help="Seconds any one shader is predicted to take before the budget is exceeded",
+                    type=float)
+parser.add_argument('-budget_total', help="Seconds the whole build is predicted to take before the budget is exceeded",
+                    type=float)
+parser.add_argument('-budget_fail', help="Fail the build instead of warning when it's over budget",
+                    action='store_true')
+parser.add_argument('-trace', help="Time every build phase and shader, and write a Chrome trace to this file")
 
 
-def setup_dirs():
-    if not os.path.isdir("./compile_temp"):
-        os.mkdir("./compile_temp")
-
-    if not os.path.isdir("./compile_temp/shaders"):
-        os.mkdir("./compile_temp/shaders")
-
-    if not os.path.isdir("./compile_temp/shaders/fxc"):
-        os.mkdir("./compile_temp/shaders/fxc")
-
-    if not os.path.isdir("./compile_temp/shaders/vsh"):
-        os.mkdir("./compile_temp/shaders/vsh")
-
-    if not os.path.isdir("./compile_temp/shaders/psh"):
-        os.mkdir("./compile_temp/shaders/psh")
-
-    if not os.path.isdir("./include"):
-        os.mkdir("./include")
-
-    if os.path.isfile("./compile_temp/filelist.txt"):
-        os.remove("./compile_temp/filelist.txt")
-
 
 if __name__ == '__main__':
-    # DirectX Options
-    directx_sdk_version = "pc09.00"
-    directx_sdk_bin_dir = "/dx9sdk/utilities".replace("/", os.sep)
-    directx_force30 = False
-
     # Parse arguments and process them
     args = parser.parse_args(sys.argv[1:])
 
-    if args.dx9_30:
-        directx_sdk_version = "pc09.30"
-        directx_sdk_bin_dir = "/dx10sdk/utilities/dx9_30".replace("/", os.sep)
-    directx_force30 = args.force30
-
-    # Check for gameinfo.txt
-
-    setup_dirs()
-    bin_dir = os.path.abspath(args.bin_dir).rstrip(os.path.sep)
-    game_dir = os.path.abspath(args.game).rstrip(os.path.sep)
-    source_dir = os.path.abspath(args.source).rstrip(os.path.sep)
-    shader_list = shadercompile_utils.update_shaders(args.shaders, source_dir, directx_force30, args.dynamic)
-
-    files_to_copy = {}
-    for shader in shader_list:
-        shader.prep(args.dynamic)
-        if shader.compile_vcs and not args.dynamic:
-            files_to_copy[shader.file_path + shader.file_name] = 1
-            for dep in shader.dependencies:
-                files_to_copy[dep] = 1
-
-    if args.dynamic or not os.path.isfile("./compile_temp/filelist.txt"):
+    if args.worker:
+        coordinator_host, coordinator_port = args.worker.rsplit(":", 1)
+        Worker(coordinator_host, int(coordinator_port), args.compiler or DEFAULT_COMMAND, args.threads,
+               args.coordinator_token).run()
         exit(0)
 
-    with open("./compile_temp/uniquefilestocopy.txt", "w") as unique_txt:
-        for file in files_to_copy:
-            clean_file = os.path.basename(file)
-            unique_txt.write(clean_file + "\n")
-            shutil.copyfile(file, "compile_temp/".replace("/", os.sep) + clean_file)
-        if args.dx9_30:
-            unique_txt.write(source_dir + "/devtools/bin/d3dx9_33.dll\n".replace("/", os.sep))
-            unique_txt.write(source_dir + directx_sdk_bin_dir + "/dx_proxy.dll\n".replace("/", os.sep))
-            unique_txt.write(bin_dir + "/shadercompile.exe\n".replace("/", os.sep))
-            unique_txt.write(bin_dir + "/shadercompile_dll.dll\n".replace("/", os.sep))
-            unique_txt.write(bin_dir + "/vstdlib.dll\n".replace("/", os.sep))
-            unique_txt.write(bin_dir + "/tier0.dll\n".replace("/", os.sep))
-
-    shader_path = os.path.abspath("./compile_temp/".replace("/", os.sep))
-
-    os.chdir(bin_dir)
+    if args.serve_cache is not None:
+        try:
+            server = RemoteCacheServer(args.combo_cache, args.combo_cache_size * 1024 * 1024, args.serve_cache,
+                                       args.serve_cache_host, args.cache_token)
+        except ValueError as error:
+            parser.error(str(error))
+        print("Serving {} on port {}".format(os.path.abspath(args.combo_cache), server.port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        exit(0)
 
-    thread_count = max(1, multiprocessing.cpu_count() - 2)
+    if args.trace:
+        trace.enable()
 
-    shader_list.clear()  # Free some memory
+    options = {name: getattr(args, name) for name in DEFAULT_OPTIONS}
+    shader_build = ShaderBuild(args.shaders or [], args.game, args.source, args.bin_dir, **options)
+    result = shader_build.run()
 
-    print(
-        "shadercompile.exe "
-        "-nompi -nop4 -allowdebug "
-        "-shaderpath \"{}\" "
-        "-game \"{}\" "
-        "-threads {}"
-        "".format(shader_path, game_dir, thread_count)
-    )
-    
-    os.system(
-        "\""
-        "shadercompile.exe "
-        "-nompi -nop4 -allowdebug "
-        "-shaderpath \"{}\" "
-        "-game \"{}\" "
-        "-threads {}"
-        "\"".format(shader_path, game_dir, thread_count)
-    )
+    if args.trace:
+        trace.get_tracer().write_chrome_trace(args.trace)
+        print(trace.get_tracer().summary())
 
-    os.chdir(shader_path)
-    publish_dir = game_dir + "/shaders".replace("/", os.sep)
-    shutil.copytree("./shaders".replace("/", os.sep), publish_dir,  dirs_exist_ok=True)
+    if args.watch:
+        shader_build.watch(args.watch_interval)
+    elif not result.success:
+        exit(1)
@@ -0,0 +1,87 @@
+"""Checks built .vcs files, and compares two builds combo by combo"""
+import argparse
+import os
+import sys
+import time
+
+from shadercompile_utils._build import load_targets
+from shadercompile_utils._build import parse_target
+from shadercompile_utils.vcs_inspect import diff_builds
+from shadercompile_utils.vcs_inspect import find_vcs
+from shadercompile_utils.vcs_inspect import inspect_many
+from shadercompile_utils.vcs_inspect import verify_vcs
+
+parser = argparse.ArgumentParser(description="Check built .vcs files.")
+parser.add_argument('-dir', help="Directory of .vcs files to check, e.g. game/shaders/fxc", required=True)
+parser.add_argument('-shaders', help="Shader list to check the files against, can be given more than once and "
+                                     "take flags, as for buildshaders.py", action='append')
+parser.add_argument('-source', help="Root SDK directory, used with -shaders", default=".")
+parser.add_argument('-force30', help="Force shader model 3.0, used with -shaders", action='store_true')
+parser.add_argument('-collapse_dead', help="The files were built with -collapse_dead", action='store_true')
+parser.add_argument('-diff', help="Directory of an earlier build to compare combo sizes with")
+parser.add_argument('-top', help="Number of changed combos to list with -diff", type=int, default=20)
+parser.add_argument('-threads', help="Number of files to check at once", type=int, default=os.cpu_count())
+
+
+def check_files(infos, shader_list):
+    """
+    Print every file with problems.
+
+    :return: Number of files with problems
+    """
+    shaders = {shader.shader_name: shader for shader in shader_list or [] if shader.type == "fxc"}
+    failed = 0
+    for info in infos:
+        shader = shaders.pop(info.shader_name, None)
+        problems = verify_vcs(info, shader) if shader is not None else info.errors
+        if problems:
+            failed += 1
+            print("{}: {}".format(info.path, "; ".join(problems)))
+    for shader_name in sorted(name for name, shader in shaders.items() if shader.compile_vcs):
+        failed += 1
+        print("{}.vcs: missing".format(shader_name))
+    return failed
+
+
+def print_diff(old_infos, new_infos, top):
+    files, changes = diff_builds(old_infos, new_infos)
+    for name, (old_size, new_size) in files.items():
+        if old_size is None:
+            print("{}: new, {} KB".format(name, new_size // 1024))
+        elif new_size is None:
+            print("{}: removed".format(name))
+        elif old_size != new_size:
+            print("{}: {} KB -> {} KB ({:+d} bytes)".format(name, old_size // 1024, new_size // 1024,
+                                                            new_size - old_size))
+    grown = [change for change in changes if change.growth > 0]
+    for change in grown[:top]:
+        print("  " + str(change))
+    print("{} combos changed size, {} grew".format(len(changes), len(grown)))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args(sys.argv[1:])
+    start = time.perf_counter()
+
+    shader_list = None
+    if args.shaders:
+        shader_list = load_targets([parse_target(value, force30=args.force30) for value in args.shaders],
+                                   os.path.abspath(args.source), False)
+        for shader in shader_list:
+            shader.collapse_dead = args.collapse_dead and shader.type == "fxc"
+            shader.generate(False)
+
+    # Without a shader list or an earlier build there's nothing to hold the combos against, only
+    # check the structure then, which doesn't need any blocks decompressed
+    full = bool(args.diff or shader_list)
+    infos = inspect_many(find_vcs(args.dir), full, args.threads, full)
+    failed = check_files(infos, shader_list)
+    print("Checked {} files{}, {:.1f} MB in {:.2f}s, {} with problems".format(
+        len(infos), ", {} combos".format(sum(info.combos or 0 for info in infos)) if full else "",
+        sum(info.file_size for info in infos) / (1024 * 1024), time.perf_counter() - start, failed))
+
+    if args.diff:
+        print_diff(inspect_many(find_vcs(args.diff), True, args.threads), infos, args.top)
+
+    if failed:
+        exit(1)
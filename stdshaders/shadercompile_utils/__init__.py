@@ -1 +1,26 @@
-from ._updateshaders import update_shaders
+"""
+Shader build tools. Submodules are only imported when first used, so importing the package is cheap.
+"""
+import importlib
+
+_LAZY = {
+    'update_shaders': '._updateshaders',
+    'build': '._build',
+    'BuildResult': '._build',
+    'ShaderResult': '._build',
+    'ShaderBuild': '._build',
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,672 @@
+"""
+Builds a shader project: the whole of ``buildshaders.py``, usable from other Python code.
+
+Everything is relative to an explicit project directory rather than the working directory, which is
+never changed, so one interpreter can build any number of projects in turn.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+from . import amalgamate
+from . import fxc_file
+from . import trace
+from ._updateshaders import update_shaders
+from .build_manifest import BuildManifest
+from .combo_cache import CachedCompiler
+from .combo_cache import ComboCache
+from .combo_cache import compiler_version
+from .dead_combos import find_dead_combos
+from .distributed import Coordinator
+from .distributed import connect_host
+from .distributed import staged_sources
+from .history import BuildHistory
+from .history import check_budget
+from .history import estimate_costs
+from .history import record_vcs_times
+from .include_graph import get_graph
+from .journal import BuildJournal
+from .prep import prep_shaders
+from .scheduler import DEFAULT_COMMAND
+from .scheduler import CommandCompiler
+from .scheduler import ProgressPrinter
+from .scheduler import Scheduler
+from .scheduler import estimate_cost
+from .scheduler import quote_argument
+from .skip_eval import SkipEvaluator
+from .skip_eval import SkipSyntaxError
+from .smoke import smoke_compile
+from .sync import FileSync
+from .sync import tree_pairs
+from .vcs_file import write_shader_vcs
+from .vcs_inspect import verify_shaders
+from .watch import ShaderWatcher
+
+# Every build option and its default, the same as the buildshaders.py flag of the same name
+DEFAULT_OPTIONS = {
+    'dx9_30': False,
+    'force30': False,
+    'dynamic': False,
+    'rebuild': False,
+    'resume': False,
+    'count_combos': False,
+    'live_combos': False,
+    'dead_combos': False,
+    'collapse_dead': False,
+    'jobs': 1,
+    'threads': max(1, multiprocessing.cpu_count() - 2),
+    'compiler': None,
+    'combo_cache': "compile_temp/combocache",
+    'combo_cache_size': 2048,
+    'dedup': False,
+    'no_combo_cache': False,
+    'remote_cache': None,
+    # None for remote_cache.DEFAULT_TIMEOUT
+    'remote_cache_timeout': None,
+    'cache_token': None,
+    'smoke': False,
+    'verify': False,
+    'coordinator': None,
+    'coordinator_host': "127.0.0.1",
+    'coordinator_token': None,
+    'local_workers': 0,
+    'chunk_size': 16,
+    'amalgamate': 0,
+    'history': "compile_temp/buildhistory.db",
+    'no_history': False,
+    'budget': None,
+    'budget_total': None,
+    'budget_fail': False,
+}
+
+TARGET_FLAGS = ('dx9_30', 'force30')
+
+_BUILDSHADERS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "buildshaders.py")
+
+
+class ShaderResult:
+    """What a build did with one shader."""
+
+    def __init__(self, shader_name):
+        self.shader_name = shader_name
+        # Stale, so its .inc and filelist.txt entry were generated again
+        self.prepped = False
+        self.inc_updated = False
+        # Live combos and compiler runs, only known when compiling with a compiler command
+        self.combos = None
+        self.compiled = None
+        self.seconds = 0.0
+        # List of (combo index, compiler output)
+        self.failures = []
+        self.vcs_path = None
+
+    def __repr__(self):
+        return "ShaderResult({!r}, prepped={}, failures={})".format(self.shader_name, self.prepped, len(self.failures))
+
+
+class BuildResult:
+    """The outcome of :func:`build`."""
+
+    def __init__(self):
+        self.success = False
+        # Shader name -> ShaderResult, for every shader in the lists
+        self.shaders = {}
+        # :class:`SyncStats` of staging and publishing
+        self.sync = None
+        self.seconds = 0.0
+
+    @property
+    def failures(self):
+        """:return: List of ``(shader name, combo index, compiler output)``"""
+        return [(name, index, output) for name, result in self.shaders.items() for index, output in result.failures]
+
+    def __bool__(self):
+        return self.success
+
+
+def parse_target(value, dx9_30=False, force30=False):
+    """
+    Split a ``-shaders`` value into the list name and its flags.
+
+    :param value: ``LIST`` or ``LIST:flag,flag``
+    :param dx9_30: Default for every list
+    :param force30: Default for every list
+    :return: ``(list name, dict of flag name to bool)``
+    """
+    options = {'dx9_30': dx9_30, 'force30': force30}
+    # Only split on a colon followed by known flags, so drive letters are left alone
+    name, _, flags = value.rpartition(":")
+    if name and flags and all(flag in TARGET_FLAGS for flag in flags.split(",")):
+        for flag in flags.split(","):
+            options[flag] = True
+        return name, options
+    return value, options
+
+
+def load_targets(targets, source_dir, dynamic, work_dir=""):
+    """
+    Load several shader lists into one.
+
+    A shader name that's already in an earlier list is left out, it would produce the same files.
+    Everything is then prepped and compiled in one go, so shared headers are only parsed once and
+    shadercompile, or the scheduler, gets the whole combined list.
+
+    :param targets: List of ``(list name, flags)``, see :func:`parse_target`
+    :return: List of :class:`BaseShader`, each with its list's flags as ``build_options``
+    """
+    shader_list = []
+    seen = set()
+    for list_name, options in targets:
+        for shader in update_shaders(list_name, source_dir, options['force30'], dynamic, work_dir):
+            if shader.shader_name in seen:
+                continue
+            seen.add(shader.shader_name)
+            shader.build_options = options
+            shader_list.append(shader)
+    return shader_list
+
+
+def report_combos(shader_list, live_dir=None):
+    """Print the number of combos each shader really has, once SKIPs are taken into account."""
+    if live_dir is not None and not os.path.isdir(live_dir):
+        os.mkdir(live_dir)
+
+    total_live = 0
+    for shader in shader_list:
+        if shader.type != "fxc":
+            continue
+        try:
+            evaluator = SkipEvaluator(shader.static_combos, shader.dynamic_combos, shader.skips)
+        except SkipSyntaxError as error:
+            print("{}: can't evaluate SKIPs, counting every combo ({})".format(shader.shader_name, error))
+            total_live += fxc_file.num_combos(shader.static_combos, shader.dynamic_combos)
+            continue
+        live = evaluator.count_live()
+        total_live += live
+        print("{}: {} of {} combos".format(shader.shader_name, live, evaluator.total))
+        if evaluator.unknown_variables:
+            print("\tSKIPs use undefined combos, treated as 0: " + ", ".join(evaluator.unknown_variables))
+        if live_dir is not None:
+            evaluator.write_live_ranges(os.path.join(live_dir, shader.shader_name + ".txt"))
+    print("{} combos in total".format(total_live))
+
+
+def report_dead_combos(shader_list):
+    """Print the combos of each shader that never change its code, found or collapsed by ``generate``."""
+    total = 0
+    for shader in shader_list:
+        if shader.type != "fxc":
+            continue
+        dead = shader.dead_combos if shader.collapse_dead else find_dead_combos(shader)
+        if not dead:
+            continue
+        total += 1
+        factor = 1
+        for combo in shader.static_combos + shader.dynamic_combos:
+            if combo.name in dead:
+                factor *= combo.max - combo.min + 1
+        print("{}: {} ({}x fewer combos{})".format(
+            shader.shader_name, ", ".join("{} {}".format(name, reason) for name, reason in dead.items()), factor,
+            "" if shader.collapse_dead else " with -collapse_dead"))
+    print("{} shaders with dead combos".format(total))
+
+
+def check_costs(shader_list, history, options):
+    """
+    Predict what compiling ``shader_list`` will cost and hold it against the budget.
+
+    :return: ``(estimates, within budget)``, see :func:`estimate_costs`
+    """
+    estimates = estimate_costs(shader_list, history)
+    if options.count_combos:
+        for estimate in estimates.values():
+            if estimate.seconds is not None:
+                print("{}: predicted {:.1f}s".format(estimate.shader_name, estimate.seconds))
+    messages = check_budget(estimates, options.budget, options.budget_total)
+    for message in messages:
+        print(("ERROR: " if options.budget_fail else "WARNING: ") + message)
+    return estimates, not (messages and options.budget_fail)
+
+
+def start_local_workers(count, host, port, command, threads, token=None):
+    """
+    Start ``-worker`` processes on this machine, splitting ``threads`` between them.
+
+    :param host: Interface the coordinator listens on
+    :param token: The coordinator's token, passed on through the environment rather than the command line
+    :return: List of :class:`subprocess.Popen`
+    """
+    env = None
+    if token is not None:
+        env = dict(os.environ, SHADER_COORDINATOR_TOKEN=token)
+    return [
+        subprocess.Popen([sys.executable, _BUILDSHADERS, "-worker", "{}:{}".format(connect_host(host), port),
+                          "-compiler", command, "-threads", str(max(1, threads // count))], env=env)
+        for _ in range(count)
+    ]
+
+
+class _Options:
+    """Build options as attributes, filled in from :data:`DEFAULT_OPTIONS`."""
+
+    def __init__(self, options):
+        unknown = set(options) - set(DEFAULT_OPTIONS)
+        if unknown:
+            raise TypeError("Unknown build options: " + ", ".join(sorted(unknown)))
+        self.__dict__.update(DEFAULT_OPTIONS)
+        self.__dict__.update(options)
+
+
+class ShaderBuild:
+    """
+    One shader project: its lists, output directories and build state.
+
+    :meth:`run` builds it once; :meth:`watch` then keeps rebuilding whatever changes.
+    """
+
+    def __init__(self, shaders, game_dir, source_dir, bin_dir, work_dir="", **options):
+        """
+        :param shaders: List of shader list names, each optionally followed by flags, see :func:`parse_target`
+        :param game_dir: ``gameinfo.txt`` directory, shaders are published to its ``shaders`` directory
+        :param source_dir: Root SDK directory
+        :param bin_dir: Directory with ``shadercompile.exe``
+        :param work_dir: Project directory, holding the lists, ``include`` and ``compile_temp``. The
+            current directory by default
+        :param options: Any of :data:`DEFAULT_OPTIONS`
+        """
+        self.options = _Options(options)
+        self.work_dir = work_dir
+        self.game_dir = os.path.abspath(game_dir).rstrip(os.path.sep)
+        self.source_dir = os.path.abspath(source_dir).rstrip(os.path.sep)
+        self.bin_dir = os.path.abspath(bin_dir).rstrip(os.path.sep)
+        self.temp_dir = os.path.join(work_dir, "compile_temp")
+        self.targets = [parse_target(value, self.options.dx9_30, self.options.force30) for value in shaders]
+        self.dx9_30 = any(flags['dx9_30'] for _, flags in self.targets)
+        if self.dx9_30:
+            self.directx_sdk_bin_dir = "/dx10sdk/utilities/dx9_30".replace("/", os.sep)
+        else:
+            self.directx_sdk_bin_dir = "/dx9sdk/utilities".replace("/", os.sep)
+
+        self.shader_list = []
+        self.manifest = None
+        self.file_sync = None
+        self.remote = None
+        if self.options.remote_cache and not self.options.no_combo_cache:
+            # Imported here as it pulls in the HTTP client and server
+            from .remote_cache import DEFAULT_TIMEOUT
+            from .remote_cache import RemoteCache
+            self.remote = RemoteCache(self.options.remote_cache, self.options.remote_cache_timeout or DEFAULT_TIMEOUT,
+                                      token=self.options.cache_token)
+        # Flags that apply to every list, each shader carries its own list's flags
+        self.build_options = {}
+        if self.options.amalgamate:
+            self.build_options['amalgamate'] = self.options.amalgamate
+        if self.options.collapse_dead:
+            self.build_options['collapse_dead'] = True
+
+    def _path(self, path):
+        """:return: ``path`` relative to the project directory, unless it's absolute"""
+        return os.path.join(self.work_dir, path.replace("/", os.sep))
+
+    def setup_dirs(self):
+        for directory in ("compile_temp/shaders/fxc", "compile_temp/shaders/vsh", "compile_temp/shaders/psh",
+                          "include"):
+            os.makedirs(self._path(directory), exist_ok=True)
+        self._remove_file_list()
+
+    def _remove_file_list(self):
+        if os.path.isfile(self._path("compile_temp/filelist.txt")):
+            os.remove(self._path("compile_temp/filelist.txt"))
+
+    def load(self):
+        """Read the shader lists and set up the manifests, the first step of :meth:`run`."""
+        self.setup_dirs()
+        # Sources may have been edited since an earlier build in this process read them
+        get_graph().refresh([self.work_dir, ""] if self.work_dir else [""])
+        with trace.span("load list"):
+            self.shader_list = load_targets(self.targets, self.source_dir, self.options.dynamic, self.work_dir)
+        self.manifest = BuildManifest(os.path.abspath(self._path("compile_temp/buildmanifest.json")), self.work_dir)
+        self.file_sync = FileSync(os.path.abspath(self._path("compile_temp/syncmanifest.json")), self.options.threads)
+        if self.options.collapse_dead:
+            for shader in self.shader_list:
+                shader.collapse_dead = shader.type == "fxc"
+        amalgamate.assign_headers(self.shader_list, self.options.amalgamate)
+
+    def run(self):
+        """
+        Prep every stale shader, then stage, compile and publish them unless this is a ``dynamic`` build.
+
+        :return: :class:`BuildResult`
+        """
+        start = time.perf_counter()
+        self.load()
+        with trace.span("prep"):
+            prepped = prep_shaders(self.shader_list, self.manifest, self.build_options, self.options.dynamic,
+                                   self.options.rebuild, self.options.jobs, self.work_dir)
+        self.write_amalgamated(prepped)
+        result = self.build(self.shader_list, prepped)
+        result.seconds = time.perf_counter() - start
+        return result
+
+    def watch(self, interval=0.25):
+        """Rebuild shaders whenever their source, or anything they include, changes."""
+        watcher = ShaderWatcher(self.shader_list)
+        print("Watching {} files for changes, Ctrl+C to stop.".format(len(watcher.states)))
+        try:
+            for changed_shaders in watcher.changes(interval):
+                start = time.perf_counter()
+                self._remove_file_list()
+                try:
+                    prepped = prep_shaders(changed_shaders, self.manifest, self.build_options, self.options.dynamic,
+                                           True, work_dir=self.work_dir)
+                    self.write_amalgamated(prepped)
+                except OSError as error:
+                    # Most likely saved halfway through, the next change will pick it up
+                    print(error)
+                    continue
+                print("Regenerated {} in {:.0f} ms".format(
+                    ", ".join(shader.shader_name for shader in prepped), (time.perf_counter() - start) * 1000))
+                self.build(changed_shaders, prepped)
+        except KeyboardInterrupt:
+            pass
+
+    def write_amalgamated(self, prepped):
+        """Rebuild the shared index headers of ``amalgamate``, if it's on."""
+        if self.options.amalgamate:
+            with trace.span("amalgamate"):
+                written = amalgamate.write_amalgamated(self.shader_list, prepped, self._path("include"))
+            if written:
+                print("{} shared index headers updated.".format(written))
+
+    def build(self, shader_list, prepped):
+        """
+        Stage and compile the prepped shaders, unless this is a ``dynamic`` build.
+
+        :return: :class:`BuildResult`
+        """
+        options = self.options
+        result = BuildResult()
+        for shader in shader_list:
+            result.shaders[shader.shader_name] = ShaderResult(shader.shader_name)
+        for shader in prepped:
+            result.shaders[shader.shader_name].prepped = True
+            result.shaders[shader.shader_name].inc_updated = shader.inc_updated
+
+        if options.count_combos or options.live_combos:
+            with trace.span("count combos"):
+                report_combos(prepped, self._path("compile_temp/livecombos") if options.live_combos else None)
+        if options.dead_combos or options.collapse_dead:
+            with trace.span("dead combos"):
+                report_dead_combos(prepped)
+
+        if len(prepped) < len(shader_list):
+            print("{} of {} shaders are up to date.".format(len(shader_list) - len(prepped), len(shader_list)))
+        inc_files = [shader for shader in prepped if shader.inc_file and shader.header_code]
+        if inc_files:
+            print("{} of {} .inc files updated.".format(sum(shader.inc_updated for shader in inc_files),
+                                                        len(inc_files)))
+
+        if options.dynamic or not os.path.isfile(self._path("compile_temp/filelist.txt")):
+            self.manifest.save()
+            result.success = True
+            return result
+
+        history = None if options.no_history else BuildHistory(os.path.abspath(self._path(options.history)))
+        try:
+            estimates = {}
+            if history is not None:
+                estimates, within_budget = check_costs(prepped, history, options)
+                if not within_budget:
+                    return result
+
+            with trace.span("stage"):
+                self.stage_files(prepped)
+
+            shader_path = os.path.abspath(self.temp_dir)
+            if options.smoke and not self.smoke(prepped, shader_path, result):
+                return result
+
+            if options.resume and not (options.compiler or options.coordinator is not None):
+                print("-resume only applies to -compiler and -coordinator builds, shadercompile.exe starts over")
+            if options.compiler or options.coordinator is not None:
+                result.success = self.compile_native(prepped, shader_path, result, history, estimates)
+            else:
+                self.order_file_list(prepped, estimates)
+                result.success = self.compile_shadercompile(prepped, shader_path, history)
+        finally:
+            if history is not None:
+                history.close()
+            self.file_sync.save()
+            result.sync = self.file_sync.take_stats()
+        print(result.sync)
+        if result.success and options.verify:
+            result.success = self.verify(prepped)
+        if result.success:
+            # Only trust the new entries once the .vcs files have actually been produced
+            self.manifest.save()
+        return result
+
+    def verify(self, shader_list):
+        """
+        Check the published ``.vcs`` of every shader holds the combos its ranges and SKIPs call for.
+
+        :return: Whether every file checked out
+        """
+        with trace.span("verify"):
+            problems = verify_shaders(shader_list, os.path.join(self.game_dir, "shaders", "fxc"),
+                                      self.options.threads)
+        for shader_name, shader_problems in problems.items():
+            print("{}.vcs: {}".format(shader_name, "; ".join(shader_problems)))
+        checked = sum(shader.type == "fxc" and shader.compile_vcs for shader in shader_list)
+        print("Verified {} .vcs files, {} with problems".format(checked, len(problems)))
+        return not problems
+
+    def stage_files(self, shader_list):
+        """Copy the sources of every shader about to be compiled into compile_temp, skipping unchanged ones."""
+        files_to_copy = {}
+        for shader in shader_list:
+            if shader.compile_vcs:
+                files_to_copy[shader.file_path + shader.file_name] = 1
+                for dep in shader.dependencies:
+                    files_to_copy[dep] = 1
+
+        source_dir = self.source_dir
+        bin_dir = self.bin_dir
+        with open(self._path("compile_temp/uniquefilestocopy.txt"), "w") as unique_txt:
+            for file in files_to_copy:
+                clean_file = os.path.basename(file)
+                unique_txt.write(clean_file + "\n")
+            if self.dx9_30:
+                unique_txt.write(source_dir + "/devtools/bin/d3dx9_33.dll\n".replace("/", os.sep))
+                unique_txt.write(source_dir + self.directx_sdk_bin_dir + "/dx_proxy.dll\n".replace("/", os.sep))
+                unique_txt.write(bin_dir + "/shadercompile.exe\n".replace("/", os.sep))
+                unique_txt.write(bin_dir + "/shadercompile_dll.dll\n".replace("/", os.sep))
+                unique_txt.write(bin_dir + "/vstdlib.dll\n".replace("/", os.sep))
+                unique_txt.write(bin_dir + "/tier0.dll\n".replace("/", os.sep))
+        self.file_sync.sync(((file, os.path.join(self.temp_dir, os.path.basename(file))) for file in files_to_copy),
+                            link=True)
+
+    def order_file_list(self, shader_list, estimates):
+        """Rewrite filelist.txt so the shaders predicted to take longest are compiled first."""
+        predicted = [shader for shader in shader_list if shader.file_list_code]
+        if not all(shader.shader_name in estimates and estimates[shader.shader_name].seconds is not None
+                   for shader in predicted):
+            return
+        predicted.sort(key=lambda shader: estimates[shader.shader_name].seconds, reverse=True)
+        with open(self._path("compile_temp/filelist.txt"), "w") as file_list:
+            file_list.writelines(shader.file_list_code for shader in predicted)
+
+    def smoke_command(self):
+        """
+        :return: Command to compile with for ``smoke``: ``compiler``, or else the DirectX SDK's fxc.exe
+            shadercompile.exe builds use. ``None`` if there's neither
+        """
+        if self.options.compiler:
+            return self.options.compiler
+        fxc = self.source_dir + self.directx_sdk_bin_dir + "/fxc.exe".replace("/", os.sep)
+        if not os.path.isfile(fxc):
+            return None
+        return quote_argument(fxc) + DEFAULT_COMMAND[len("fxc.exe"):]
+
+    def smoke(self, shader_list, shader_path, build_result):
+        """
+        Compile one combo of every shader, see :func:`smoke_compile`.
+
+        :param build_result: :class:`BuildResult` the failures are added to
+        :return: Whether the full build should go ahead
+        """
+        command = self.smoke_command()
+        if command is None:
+            print("Skipping -smoke, there's no -compiler and no fxc.exe in {}{}".format(self.source_dir,
+                                                                                       self.directx_sdk_bin_dir))
+            return True
+        smoke_list = [shader for shader in shader_list if shader.type == "fxc" and shader.compile_vcs]
+        smoke_compiler = self.make_compiler(shader_path, command)[0]
+        with trace.span("smoke"):
+            failures = smoke_compile(smoke_list, smoke_compiler, multiprocessing.cpu_count())
+        if self.remote is not None:
+            smoke_compiler.flush()
+        for failure in failures:
+            build_result.shaders[failure.job.shader_name].failures.append((failure.job.combo_index, failure.output))
+        if failures:
+            print("Not starting the full build, fix the shaders above first.")
+        return not failures
+
+    def make_compiler(self, shader_path, command=None):
+        """
+        :param command: Compiler command, ``compiler`` by default
+        :return: ``(compiler, combo cache)`` for the command, the cache is ``None`` with ``no_combo_cache``
+        """
+        command = command or self.options.compiler or DEFAULT_COMMAND
+        compiler = CommandCompiler(command, shader_path)
+        combo_cache = None
+        if not self.options.no_combo_cache:
+            combo_cache = ComboCache(os.path.abspath(self._path(self.options.combo_cache)),
+                                     self.options.combo_cache_size * 1024 * 1024)
+            compiler = CachedCompiler(compiler, combo_cache, compiler_version(command), self.remote)
+        return compiler, combo_cache
+
+    def compile_native(self, shader_list, shader_path, build_result, history=None, estimates=None):
+        """
+        Compile with the :class:`Scheduler` and the ``compiler`` command.
+
+        :param build_result: :class:`BuildResult` to fill in
+        :param history: :class:`BuildHistory` to record compile times in
+        :param estimates: Predicted costs, the shaders predicted to take longest go first
+        :return: Whether every combo compiled
+        """
+        options = self.options
+        command = options.compiler or DEFAULT_COMMAND
+        compiler, combo_cache = self.make_compiler(shader_path)
+        compile_list = [shader for shader in shader_list if shader.type == "fxc" and shader.compile_vcs]
+        journal = BuildJournal(self._path("compile_temp/journal"), compiler_version(command), options.resume)
+        local_workers = []
+        if options.coordinator is not None:
+            scheduler = Coordinator(staged_sources(compile_list, shader_path), options.coordinator,
+                                    options.coordinator_host, options.chunk_size,
+                                    compiler if combo_cache is not None else None, options.dedup,
+                                    token=options.coordinator_token)
+            local_workers = start_local_workers(options.local_workers, options.coordinator_host, scheduler.port,
+                                                command, options.threads, options.coordinator_token)
+        else:
+            scheduler = Scheduler(compiler, options.threads, options.dedup)
+        cost_func = estimate_cost
+        if estimates and all(estimates[shader.shader_name].seconds is not None for shader in compile_list):
+            def cost_func(shader):
+                return estimates[shader.shader_name].seconds
+        try:
+            with trace.span("compile combos"):
+                results = scheduler.run(compile_list, ProgressPrinter(len(compile_list)), cost_func, journal)
+        finally:
+            if options.coordinator is not None:
+                scheduler.close()
+            for process in local_workers:
+                process.wait()
+            if combo_cache is not None:
+                compiler.flush()
+        for result in results.values():
+            trace.record(result.shader_name, compiled=result.compiled, compile_ms=int(result.seconds * 1000))
+            if history is not None:
+                history.record(result.shader_name, fxc_file.get_shader_type(result.shader_name), result.expected,
+                               result.compiled - result.cached, result.seconds)
+            shader_result = build_result.shaders[result.shader_name]
+            shader_result.combos = result.expected
+            shader_result.compiled = result.compiled
+            shader_result.seconds = result.seconds
+            shader_result.failures = [(failure.job.combo_index, failure.output) for failure in result.failures]
+        if combo_cache is not None:
+            print(combo_cache.summary())
+        if self.remote is not None:
+            print(self.remote.summary())
+        failed = sum(len(result.failures) for result in results.values())
+        if failed > 0:
+            print("{} combos failed to compile.".format(failed))
+            return False
+
+        for shader in compile_list:
+            vcs_path = os.path.join(shader_path, "shaders", "fxc", shader.shader_name + ".vcs")
+            with trace.span("write vcs", shader=shader.shader_name):
+                stats = write_shader_vcs(shader, results[shader.shader_name].bytecode, vcs_path, options.threads)
+            trace.record(shader.shader_name, bytes_written=stats.file_size)
+            build_result.shaders[shader.shader_name].vcs_path = vcs_path
+            journal.finish(shader.shader_name)
+            print("{}.vcs: {} combos, {} unique, {} duplicate static combos, {} KB ({} KB uncompressed)".format(
+                shader.shader_name, stats.combos, stats.unique_bytecode, stats.duplicate_static_combos,
+                stats.file_size // 1024, stats.uncompressed_size // 1024))
+        self.publish(shader_path)
+        return True
+
+    def publish(self, shader_path):
+        """Copy every changed shader into the game directory, each one replaced in a single rename."""
+        publish_dir = self.game_dir + "/shaders".replace("/", os.sep)
+        with trace.span("publish"):
+            self.file_sync.sync(tree_pairs(os.path.join(shader_path, "shaders"), publish_dir))
+
+    def compile_shadercompile(self, shader_list, shader_path, history=None):
+        """
+        Compile everything in filelist.txt with shadercompile.exe and publish the results.
+
+        :param history: :class:`BuildHistory` to record compile times in, see :func:`record_vcs_times`
+        :return: Whether shadercompile.exe succeeded
+        """
+        arguments = ["-nompi", "-nop4", "-allowdebug", "-shaderpath", shader_path, "-game", self.game_dir,
+                     "-threads", str(self.options.threads)]
+        print("shadercompile.exe " + subprocess.list2cmdline(arguments))
+
+        start_time = time.time()
+        with trace.span("shadercompile"):
+            try:
+                compile_status = subprocess.call([os.path.join(self.bin_dir, "shadercompile.exe")] + arguments,
+                                                 cwd=self.bin_dir)
+            except OSError as error:
+                print(error)
+                compile_status = -1
+
+        if history is not None:
+            record_vcs_times(history, shader_list, os.path.join(shader_path, "shaders", "fxc"), start_time,
+                             self.options.threads)
+        self.publish(shader_path)
+        return compile_status == 0
+
+
+def build(shaders, game_dir, source_dir, bin_dir, work_dir="", **options):
+    """
+    Build one or more shader lists, the same as ``buildshaders.py`` would::
+
+        result = shadercompile_utils.build(["stdshader_dx9_30:force30"], game_dir, source_dir, bin_dir,
+                                           "stdshaders", dx9_30=True, compiler=FXC_COMMAND)
+        for shader_name, combo_index, output in result.failures:
+            ...
+
+    :param shaders: List of shader list names, each optionally followed by flags, e.g. ``"sm30:force30"``
+    :param game_dir: ``gameinfo.txt`` directory
+    :param source_dir: Root SDK directory
+    :param bin_dir: Directory with ``shadercompile.exe``
+    :param work_dir: Project directory holding the lists, ``include`` and ``compile_temp``, the current
+        directory by default
+    :param options: Any of :data:`DEFAULT_OPTIONS`, named like the ``buildshaders.py`` flags
+    :return: :class:`BuildResult`
+    """
+    return ShaderBuild(shaders, game_dir, source_dir, bin_dir, work_dir, **options).run()
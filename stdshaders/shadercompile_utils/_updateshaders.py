@@ -1,11 +1,32 @@
 """updateshaders.pl"""
-# TODO: Make pythonic
+import os.path
 import re
 
 from .shader_type import DX9Shader
 from .shader_type import LegacyPixelShader
 from .shader_type import LegacyVertexShader
 
+_SHADER_CLASSES = {
+    'fxc': DX9Shader,
+    'vsh': LegacyVertexShader,
+    'psh': LegacyPixelShader,
+}
+
+# Suffixes renamed by force30, in order
+_FORCE30_RENAMES = (
+    ("_ps2x", "_ps30"),
+    ("_ps20b", "_ps30"),
+    ("_ps20", "_ps30"),
+    ("_vs20", "_vs30"),
+    ("_vsxx", "_vs30"),
+)
+
+# Suffixes that build two targets without force30
+_SPLIT_SUFFIXES = {
+    "_ps2x": ("_ps20", "_ps20b"),
+    "_vsxx": ("_vs11", "_vs20"),
+}
+
 
 def _get_shader_type(name):
     if ".fxc" in name:
@@ -22,67 +43,42 @@ def _get_shader_base(name):
     return name.replace("." + _get_shader_type(name), "")
 
 
-def _load_shader_list(project_name, force30):
-    shader_list = []
-    with open(project_name + ".txt") as shader_list_file:
+def _target_names(clean_line, shader_base, force30):
+    """:return: Output shader names built from one shader list entry"""
+    if force30:
+        for old, new in _FORCE30_RENAMES:
+            shader_base = shader_base.replace(old, new)
+        return (shader_base,)
+    for suffix, targets in _SPLIT_SUFFIXES.items():
+        if suffix in clean_line:
+            return tuple(shader_base.replace(suffix, target) for target in targets)
+    return (shader_base,)
+
+
+def _read_shader_list(project_name, force30, work_dir=""):
+    """Yield ``(file, name, type)`` for every target in a shader list, as the file is read."""
+    with open(os.path.join(work_dir, project_name + ".txt")) as shader_list_file:
         for line in shader_list_file:
             clean_line = re.sub(r"//.*$", "", line).strip().lower()
             if any(ext in clean_line for ext in ['.fxc', '.vsh', '.psh']):
-                shader_base = _get_shader_base(clean_line)
                 shader_type = _get_shader_type(clean_line)
-                if force30:
-                    shader_base = shader_base.replace("_ps2x", "_ps30")
-                    shader_base = shader_base.replace("_ps20b", "_ps30")
-                    shader_base = shader_base.replace("_ps20", "_ps30")
-                    shader_base = shader_base.replace("_vs20", "_vs30")
-                    shader_base = shader_base.replace("_vsxx", "_vs30")
-                    shader_list.append({
-                        'file': clean_line,
-                        'name': shader_base,
-                        'type': shader_type
-                    })
-                else:
-                    if "_ps2x" in clean_line:
-                        shader_list.append({
-                            'file': clean_line,
-                            'name': shader_base.replace("_ps2x", "_ps20"),
-                            'type': shader_type
-                        })
-                        shader_list.append({
-                            'file': clean_line,
-                            'name': shader_base.replace("_ps2x", "_ps20b"),
-                            'type': shader_type
-                        })
-                    elif "_vsxx" in clean_line:
-                        shader_list.append({
-                            'file': clean_line,
-                            'name': shader_base.replace("_vsxx", "_vs11"),
-                            'type': shader_type
-                        })
-                        shader_list.append({
-                            'file': clean_line,
-                            'name': shader_base.replace("_vsxx", "_vs20"),
-                            'type': shader_type
-                        })
-                    else:
-                        shader_list.append({
-                            'file': clean_line,
-                            'name': shader_base,
-                            'type': shader_type
-                        })
+                for shader_name in _target_names(clean_line, _get_shader_base(clean_line), force30):
+                    yield os.path.join(work_dir, clean_line), shader_name, shader_type
 
-    return shader_list
 
+def update_shaders(project_name, source, force30=False, dynamic=False, work_dir=""):
+    """
+    Load a shader list.
 
-def update_shaders(project_name, source, force30=False, dynamic=False):
-    name_list = _load_shader_list(project_name, force30)
+    :param project_name: List file, without the ``.txt``
+    :param work_dir: Directory the list and the paths in it are relative to, the current one by default
+    :return: List of :class:`BaseShader`
+    """
     shader_list = []
-    for shader in name_list:
-        if shader['type'] == 'fxc':
-            shader_list.append(DX9Shader(shader['file'], shader['name'], not dynamic))
-        elif shader['type'] == 'vsh':
-            shader_list.append(LegacyVertexShader(shader['file'], shader['name']))
+    for file_name, shader_name, shader_type in _read_shader_list(project_name, force30, work_dir):
+        if shader_type == 'fxc':
+            shader_list.append(DX9Shader(file_name, shader_name, not dynamic))
         else:
-            shader_list.append(LegacyPixelShader(shader['file'], shader['name']))
+            shader_list.append(_SHADER_CLASSES[shader_type](file_name, shader_name))
 
     return shader_list
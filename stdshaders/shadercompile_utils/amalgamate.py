@@ -0,0 +1,104 @@
+"""
+Puts the index classes of every shader into a few shared headers instead of one ``.inc`` each.
+
+Each shader's ``.inc`` becomes a stub including the header its classes went to, so existing C++ code
+keeps building unchanged. A precompiled header can include ``shader_indices.h`` to parse every index
+class once per project rather than once per source file. Shaders are spread over the headers by a hash
+of their name, so editing one shader only changes one header.
+"""
+import json
+import os
+import zlib
+
+from .file_utils import write_if_changed
+
+UMBRELLA_NAME = "shader_indices.h"
+MANIFEST_NAME = "shader_indices.json"
+MANIFEST_VERSION = 1
+
+_HEADER_START = "#pragma once\n// Generated by buildshaders.py -amalgamate, do not edit\n\n" \
+                "#include \"shaderlib/cshader.h\"\n\n"
+
+
+def header_name(shader_name, parts):
+    """:return: File name of the header a shader's index classes go in"""
+    return "shader_indices_{}.h".format(zlib.crc32(shader_name.encode()) % parts)
+
+
+def stub_code(header):
+    """:return: Contents of a shader's ``.inc`` when its classes live in ``header``"""
+    return "// Index classes are in {0}, see {1}\n#include \"{0}\"\n".format(header, MANIFEST_NAME)
+
+
+def _read_manifest(path):
+    """:return: Dict of header to the names of the shaders in it as of the last build, empty if unknown"""
+    try:
+        with open(path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('headers', {})
+
+
+def assign_headers(shader_list, parts):
+    """Tell every shader with index classes which header they go in, or that they get an ``.inc`` if ``parts`` is 0."""
+    for shader in shader_list:
+        if shader.type == "fxc":
+            shader.amalgam_header = header_name(shader.shader_name, parts) if parts else None
+
+
+def write_amalgamated(shader_list, prepped, include_dir="include"):
+    """
+    Write the shared headers, an umbrella header including all of them and a manifest.
+
+    Only headers holding a shader that was just prepped, or whose shaders aren't the ones listed in
+    the manifest, are rebuilt; headers left without any shaders are deleted. Shaders in rebuilt headers
+    that were up to date are generated again, which doesn't touch any files.
+
+    :param shader_list: Every shader, after :func:`assign_headers`
+    :param prepped: Shaders prepped in this build
+    :return: Number of headers whose contents changed
+    """
+    headers = {}
+    for shader in sorted(shader_list, key=lambda s: s.shader_name):
+        if shader.amalgam_header:
+            headers.setdefault(shader.amalgam_header, []).append(shader)
+    prepped_names = {shader.shader_name for shader in prepped}
+    manifest_path = os.path.join(include_dir, MANIFEST_NAME)
+    previous = _read_manifest(manifest_path)
+
+    written = 0
+    for header, members in sorted(headers.items()):
+        path = os.path.join(include_dir, header)
+        names = [shader.shader_name for shader in members]
+        if (os.path.isfile(path) and previous.get(header) == names
+                and not any(name in prepped_names for name in names)):
+            continue
+        out = [_HEADER_START]
+        for shader in members:
+            if not shader.index_code:
+                shader.generate(True)
+            out.append(shader.index_code)
+            out.append("\n\n")
+        written += write_if_changed(path, "".join(out))
+
+    for header in previous:
+        # Every shader in it was removed or moved to another header
+        if header not in headers and os.path.basename(header) == header:
+            try:
+                os.remove(os.path.join(include_dir, header))
+                written += 1
+            except OSError:
+                pass
+
+    umbrella = ["#pragma once\n// Generated by buildshaders.py -amalgamate, do not edit\n\n"]
+    umbrella.extend("#include \"{}\"\n".format(header) for header in sorted(headers))
+    write_if_changed(os.path.join(include_dir, UMBRELLA_NAME), "".join(umbrella))
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'headers': {header: [shader.shader_name for shader in members] for header, members in sorted(headers.items())},
+    }
+    write_if_changed(manifest_path, json.dumps(manifest, indent=1, sort_keys=True) + "\n")
+    return written
@@ -0,0 +1,88 @@
+"""Persistent record of what every shader was last built from."""
+import hashlib
+import json
+import os
+
+from . import fxc_file
+from .include_graph import get_graph
+
+# Bump whenever the generated .inc or filelist.txt output changes, so old manifests are ignored.
+MANIFEST_VERSION = 1
+
+
+class BuildManifest:
+    """
+    Maps shader names to a hash of their source, dependencies, target profile and build flags.
+
+    Shaders whose hash has not changed since the last successful build don't need to be prepped
+    again, and don't need to be handed to shadercompile.
+    """
+
+    def __init__(self, path, work_dir=""):
+        """
+        :param path: Manifest file, created on the first :meth:`save`
+        :param work_dir: Project directory holding ``include`` and ``compile_temp``, the current one by default
+        """
+        self.path = path
+        self.work_dir = work_dir
+        self.entries = {}
+        if os.path.isfile(path):
+            try:
+                with open(path) as manifest_file:
+                    data = json.load(manifest_file)
+                if data.get('version') == MANIFEST_VERSION:
+                    self.entries = data.get('shaders', {})
+            except (OSError, ValueError):
+                print("Ignoring unreadable build manifest: " + path)
+
+    def shader_key(self, shader, options):
+        """
+        Hash everything that affects the output of a shader.
+
+        :param shader: A :class:`BaseShader`
+        :param options: Dict of build flags, e.g. ``{'dx9_30': True, 'force30': False}``
+        :return: Hex digest
+        """
+        key = hashlib.sha1()
+        key.update(shader.shader_name.encode())
+        key.update(shader.type.encode())
+        if shader.type == "fxc":
+            key.update(fxc_file.get_shader_type(shader.shader_name).encode())
+        key.update(json.dumps(options, sort_keys=True).encode())
+        for path in [shader.file_path + shader.file_name] + shader.dependencies:
+            key.update(path.encode())
+            key.update(get_graph().get(path).digest.encode())
+        return key.hexdigest()
+
+    def is_current(self, shader, key, dynamic):
+        """
+        Check whether a shader's last build is still valid.
+
+        :param shader: A :class:`BaseShader`
+        :param key: Result of :meth:`shader_key`
+        :param dynamic: Only the ``.inc`` file is needed
+        """
+        entry = self.entries.get(shader.shader_name)
+        if entry is None or entry['key'] != key:
+            return False
+        if shader.inc_file and not os.path.isfile(os.path.join(self.work_dir, "include",
+                                                               "{}.inc".format(shader.shader_name))):
+            return False
+        if shader.compile_vcs and not dynamic:
+            vcs_path = os.path.join(self.work_dir, "compile_temp", "shaders", shader.type,
+                                    "{}.vcs".format(shader.shader_name))
+            if not entry['vcs'] or not os.path.isfile(vcs_path):
+                return False
+        return True
+
+    def update(self, shader, key, dynamic):
+        """Record that a shader has been built from ``key``."""
+        entry = self.entries.get(shader.shader_name)
+        vcs = shader.compile_vcs and not dynamic
+        if entry is not None and entry['key'] == key:
+            vcs = vcs or entry['vcs']
+        self.entries[shader.shader_name] = {'key': key, 'vcs': vcs}
+
+    def save(self):
+        with open(self.path, "w") as manifest_file:
+            json.dump({'version': MANIFEST_VERSION, 'shaders': self.entries}, manifest_file, indent=1, sort_keys=True)
@@ -0,0 +1,220 @@
+"""
+Content addressed store for compiled combos.
+
+Combos are keyed on the shader's flattened source, not on each combo's preprocessed code. The
+:class:`Preprocessor` only goes as far as ``-dedup`` needs, so a key it got wrong would hand out the
+wrong bytecode with nothing to show for it, where a source key can only ever miss; and preprocessing
+every combo would be paid on every build, warm or not. The price is that any edit to a shader or its
+includes, even to a comment, misses the cache for all of its combos.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+from .scheduler import CompileResult
+from .scheduler import split_command
+
+
+def combo_key(source_digest, defines, profile, compiler_version):
+    """
+    Hash everything that goes into compiling a single combo, see the module docs for why the source is
+    hashed whole.
+
+    :param source_digest: Hash of the shader source with every ``#include`` inlined, see :func:`scheduler.source_digest`
+    :param defines: List of ``(name, value)``
+    :param profile: Target profile, e.g. ``ps_3_0``
+    :param compiler_version: Anything that identifies the compiler, see :func:`compiler_version`
+    :return: Hex digest
+    """
+    key = hashlib.sha256()
+    for part in (source_digest, profile, compiler_version):
+        key.update(part.encode())
+        key.update(b"\0")
+    for name, value in defines:
+        key.update("{}={}\0".format(name, value).encode())
+    return key.hexdigest()
+
+
+def compiler_version(command):
+    """
+    Identify a compiler command, including the contents of any file it names.
+
+    Upgrading fxc.exe, or editing a stand-in script, changes the result and so invalidates the cache.
+
+    :param command: Compiler command template
+    """
+    version = hashlib.sha256(command.encode())
+    for argument in split_command(command):
+        path = shutil.which(argument) or argument
+        if os.path.isfile(path):
+            with open(path, "rb") as compiler_file:
+                version.update(hashlib.sha256(compiler_file.read()).digest())
+    return version.hexdigest()
+
+
+class ComboCache:
+    """
+    Compiled bytecode on disk, one file per combo, named by :func:`combo_key`.
+
+    Hits refresh a file's modification time, and the least recently used files are evicted once the
+    cache grows past ``max_size`` bytes.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        """
+        :param cache_dir: Directory for the cache, created if needed
+        :param max_size: Size cap in bytes
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.size = sum(size for _, _, size in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _entries(self):
+        """Yield ``(mtime, path, size)`` for every cached combo."""
+        for bucket in os.scandir(self.cache_dir):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    yield stat.st_mtime, entry.path, stat.st_size
+
+    def contains(self, key):
+        """:return: Whether ``key`` is cached, without counting as a hit or a miss"""
+        return os.path.isfile(self._path(key))
+
+    def get(self, key):
+        """:return: Cached bytecode, or ``None``"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as cached_file:
+                bytecode = cached_file.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return bytecode
+
+    def put(self, key, bytecode):
+        """Store bytecode, evicting old entries if the cache is over its size cap."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        with os.fdopen(handle, "wb") as temp_file:
+            temp_file.write(bytecode)
+        with self._lock:
+            # Replacing an entry, maybe one another thread just stored, only adds the difference
+            try:
+                old_size = os.path.getsize(path)
+            except OSError:
+                old_size = 0
+            os.replace(temp_path, path)
+            self.stores += 1
+            self.size += len(bytecode) - old_size
+            if self.size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        # Drop to 90% of the cap so we don't rescan the cache on every store
+        target = self.max_size * 9 // 10
+        entries = sorted(self._entries())
+        self.size = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+            self.evicted += 1
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        return "Combo cache: {} hits, {} misses ({:.0%} hit rate), {} stored, {} evicted, {:.1f} MB used".format(
+            self.hits, self.misses, self.hits / lookups if lookups else 0, self.stores, self.evicted,
+            self.size / (1024 * 1024))
+
+
+class CachedCompiler:
+    """Wraps a compiler backend, only compiling combos that aren't in a :class:`ComboCache`."""
+
+    def __init__(self, backend, cache, version, remote=None):
+        """
+        :param backend: Compiler backend, e.g. :class:`CommandCompiler`
+        :param cache: :class:`ComboCache`
+        :param version: Result of :func:`compiler_version`
+        :param remote: :class:`RemoteCache` shared with other machines, checked for anything not in
+            ``cache`` and sent everything compiled here
+        """
+        self.backend = backend
+        self.cache = cache
+        self.version = version
+        self.remote = remote
+
+    def key(self, job):
+        return combo_key(job.source_digest, job.defines, job.profile, self.version)
+
+    def prefetch(self, jobs):
+        """
+        Yield ``jobs``, first fetching the ones missing from the local cache from the remote cache, a
+        batch at a time.
+        """
+        if self.remote is None:
+            yield from jobs
+            return
+        batch = []
+        for job in jobs:
+            batch.append(job)
+            if len(batch) >= self.remote.batch_size:
+                yield from self._fetch(batch)
+                batch = []
+        yield from self._fetch(batch)
+
+    def _fetch(self, batch):
+        missing = [key for key in map(self.key, batch) if not self.cache.contains(key)]
+        if missing and self.remote.available:
+            for key, bytecode in self.remote.get_many(missing).items():
+                self.cache.put(key, bytecode)
+        return batch
+
+    def flush(self):
+        """Upload whatever is still queued for the remote cache."""
+        if self.remote is not None:
+            self.remote.flush()
+
+    def lookup(self, job):
+        """:return: A cached :class:`CompileResult`, or ``None``"""
+        bytecode = self.cache.get(self.key(job))
+        if bytecode is None:
+            return None
+        return CompileResult(job, bytecode, "", 0, 0.0, cached=True)
+
+    def store(self, result):
+        """Cache a result compiled somewhere else, if it succeeded."""
+        if result.ok and not result.cached:
+            key = self.key(result.job)
+            self.cache.put(key, result.bytecode)
+            if self.remote is not None:
+                self.remote.put(key, result.bytecode)
+
+    def compile(self, job):
+        result = self.lookup(job)
+        if result is None:
+            result = self.backend.compile(job)
+            self.store(result)
+        return result
@@ -0,0 +1,71 @@
+"""
+Finds combos that never change a shader's code, so they can be left out of its combo space.
+
+A combo is dead if, for every live combo, setting it to its minimum gives a combo that's still live
+and preprocesses to the same code. Combos the source and SKIPs never mention are found from the
+source alone; the rest are checked by preprocessing every live combo, for shaders small enough.
+"""
+from . import fxc_file
+from .preprocessor import Preprocessor
+from .scheduler import combo_defines
+from .skip_eval import SkipEvaluator
+from .skip_eval import SkipSyntaxError
+
+NOT_USED = "not used"
+ONLY_IN_SKIPS = "only used by SKIPs"
+NO_EFFECT = "no effect on any live combo"
+# Live combos a shader may have for combos the source uses to be checked
+MAX_LIVE_COMBOS = 1 << 16
+
+
+def find_dead_combos(shader, max_live_combos=MAX_LIVE_COMBOS):
+    """
+    :param shader: A :class:`DX9Shader` after ``generate``
+    :param max_live_combos: Only look for combos that are used but have no effect in shaders with at
+        most this many live combos
+    :return: Dict of dead combo name to the reason
+    """
+    try:
+        evaluator = SkipEvaluator(shader.static_combos, shader.dynamic_combos, shader.skips)
+    except SkipSyntaxError:
+        return {}
+    preprocessor = Preprocessor(fxc_file.read_input_file(shader.file_path + shader.file_name))
+    in_skips = set(evaluator.variables)
+
+    dead = {}
+    candidates = []
+    for combo in list(shader.dynamic_combos) + list(shader.static_combos):
+        if combo.count == 1:
+            continue
+        if combo.name not in preprocessor.identifiers and combo.name not in in_skips:
+            dead[combo.name] = NOT_USED
+        else:
+            candidates.append(combo)
+    if not candidates or evaluator.count_live() > max_live_combos:
+        return dead
+
+    digests = {}
+
+    def digest(index):
+        defines = combo_defines(shader, evaluator, index)
+        key = tuple(value for name, value in defines if name in preprocessor.identifiers)
+        if key not in digests:
+            digests[key] = preprocessor.digest(defines)
+        return digests[key]
+
+    def same_at_minimum(combo, index):
+        offset = (index // combo.stride) % combo.count
+        if offset == 0:
+            return True
+        base = index - offset * combo.stride
+        return not evaluator.is_skipped(base) and digest(base) == digest(index)
+
+    live = [int(index) for batch in evaluator.live_indices() for index in batch]
+    try:
+        for combo in candidates:
+            if all(same_at_minimum(combo, index) for index in live):
+                dead[combo.name] = ONLY_IN_SKIPS if combo.name not in preprocessor.identifiers else NO_EFFECT
+    except (SkipSyntaxError, IndexError):
+        # An #if the preprocessor can't evaluate, stick with what the source alone shows
+        pass
+    return dead
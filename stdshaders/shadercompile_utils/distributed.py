@@ -0,0 +1,490 @@
+"""
+Spreads combo compiles over worker processes, on this machine or others, over TCP.
+
+The coordinator splits each shader's combos into chunks and hands them to whichever workers are
+connected. Workers get a copy of the staged sources when they connect, compile their chunks with their
+own ``-compiler`` command and stream each combo's bytecode back as soon as it's done. Workers send a
+heartbeat every few seconds; one that goes quiet or disconnects has its unfinished combos handed to
+the others.
+
+Every message is a JSON header followed by an optional binary payload, each prefixed by its length.
+
+The coordinator listens on this machine only unless it's given a host. Listening anywhere else needs
+a shared token, which workers send in their ``hello``; a worker without it is turned away before it's
+sent anything.
+"""
+import hmac
+import ipaddress
+import json
+import os
+import queue
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .scheduler import CommandCompiler
+from .scheduler import CompileJob
+from .scheduler import CompileResult
+from .scheduler import Scheduler
+
+DEFAULT_PORT = 27015
+DEFAULT_CHUNK_SIZE = 16
+HEARTBEAT_INTERVAL = 1.0
+HEARTBEAT_TIMEOUT = 10.0
+# Largest message a peer may send before its hello has been accepted
+MAX_HELLO_SIZE = 64 * 1024
+
+_frame = struct.Struct("!II")
+
+
+def send_message(sock, header, payload=b""):
+    """Send a JSON header and a binary payload as one message."""
+    data = json.dumps(header).encode()
+    sock.sendall(_frame.pack(len(data), len(payload)) + data + payload)
+
+
+def _receive_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def receive_message(sock, max_header=None, max_payload=None):
+    """
+    :param max_header: Largest header accepted, in bytes
+    :param max_payload: Largest payload accepted, in bytes
+    :return: ``(header, payload)``
+    :raise ValueError: If the message is too large or its header isn't a JSON object with a ``type``
+    """
+    header_size, payload_size = _frame.unpack(_receive_exactly(sock, _frame.size))
+    if (max_header is not None and header_size > max_header) or (max_payload is not None and
+                                                                 payload_size > max_payload):
+        raise ValueError("Message too large")
+    header = json.loads(_receive_exactly(sock, header_size).decode())
+    if not isinstance(header, dict) or not isinstance(header.get('type'), str):
+        raise ValueError("Bad message header")
+    return header, _receive_exactly(sock, payload_size)
+
+
+def is_loopback(host):
+    """:return: Whether ``host`` only listens on this machine"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def connect_host(host):
+    """:return: Address to reach a server listening on ``host`` from this machine"""
+    return "localhost" if host in ("", "0.0.0.0", "::") else host
+
+
+def worker_path(work_dir, name):
+    """
+    :param name: File name sent by the coordinator
+    :return: Where ``name`` goes in a worker's ``work_dir``
+    :raise ValueError: If ``name`` would end up outside of it
+    """
+    path = os.path.normpath(os.path.join(work_dir, name))
+    if os.path.isabs(name) or os.path.dirname(path) != os.path.normpath(work_dir):
+        raise ValueError("Bad file name from the coordinator: {!r}".format(name))
+    return path
+
+
+def staged_sources(shader_list, shader_path):
+    """
+    Read the staged copy of every file the shaders need, as :func:`stage_files` laid them out.
+
+    :return: Dict of file name to contents
+    """
+    sources = {}
+    for shader in shader_list:
+        for path in [shader.file_path + shader.file_name] + shader.dependencies:
+            name = os.path.basename(path)
+            if name not in sources:
+                with open(os.path.join(shader_path, name), "rb") as source_file:
+                    sources[name] = source_file.read()
+    return sources
+
+
+class _Chunk:
+    """Combos of one shader handed to a worker together."""
+
+    def __init__(self, chunk_id, jobs):
+        self.chunk_id = chunk_id
+        # combo index -> job, until its result comes back
+        self.pending = {job.combo_index: job for job in jobs}
+
+    def to_message(self):
+        return {
+            'type': 'chunk',
+            'chunk': self.chunk_id,
+            'jobs': [{
+                'shader_name': job.shader_name,
+                'file_name': job.file_name,
+                'profile': job.profile,
+                'combo_index': job.combo_index,
+                'defines': job.defines,
+                'source_digest': job.source_digest,
+            } for job in self.pending.values()],
+        }
+
+
+class _WorkerConnection:
+    def __init__(self, worker_id, sock, address):
+        self.worker_id = worker_id
+        self.sock = sock
+        self.address = address
+        self.name = "{}:{}".format(*address[:2])
+        self.threads = 1
+        self.ready = False
+        self.refused = False
+        self.chunks = {}
+        self.last_seen = time.monotonic()
+
+    def capacity(self, chunk_size):
+        """Chunks to keep on the worker: enough for it not to run dry, few enough to share the tail evenly."""
+        return max(1, -(-self.threads * 2 // chunk_size))
+
+
+class Coordinator(Scheduler):
+    """
+    A :class:`Scheduler` that runs jobs on remote workers instead of a local thread pool.
+    """
+
+    def __init__(self, sources, port=DEFAULT_PORT, host="127.0.0.1", chunk_size=DEFAULT_CHUNK_SIZE, cache=None,
+                 dedup=False, heartbeat_timeout=HEARTBEAT_TIMEOUT, token=None):
+        """
+        :param sources: Dict of file name to contents, sent to every worker, see :func:`staged_sources`
+        :param port: Port to listen on, 0 picks a free one, see :attr:`port`
+        :param host: Interface to listen on, this machine only by default, ``""`` for all of them
+        :param chunk_size: Combos per chunk
+        :param cache: :class:`CachedCompiler` to check before sending combos out, and to store results in
+        :param dedup: Compile combos that preprocess to the same code only once
+        :param heartbeat_timeout: Seconds of silence after which a worker is considered dead
+        :param token: Shared secret workers must send, required unless ``host`` is a loopback address
+        """
+        if token is None and not is_loopback(host):
+            raise ValueError("Listening for workers beyond this machine needs a token")
+        super().__init__(None, 1, dedup)
+        self.token = token
+        self.sources = sources
+        self.chunk_size = max(1, chunk_size)
+        self.cache = cache
+        self.heartbeat_timeout = heartbeat_timeout
+        self.server = socket.create_server((host, port))
+        self.port = self.server.getsockname()[1]
+        self.events = queue.Queue()
+        self.workers = {}
+        self._next_worker_id = 0
+        self._closed = False
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def close(self):
+        """Tell every worker to exit and stop listening."""
+        self._closed = True
+        for worker in list(self.workers.values()):
+            try:
+                send_message(worker.sock, {'type': 'shutdown'})
+            except OSError:
+                pass
+            worker.sock.close()
+        self.workers.clear()
+        self.server.close()
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                sock, address = self.server.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            worker = _WorkerConnection(self._next_worker_id, sock, address)
+            self._next_worker_id += 1
+            threading.Thread(target=self._read, args=(worker,), daemon=True).start()
+
+    def _read(self, worker):
+        """Forward every message from one worker to the main loop."""
+        greeted = False
+        try:
+            # Until it's sent a hello with the right token, a peer only gets a small message and a few seconds
+            worker.sock.settimeout(self.heartbeat_timeout)
+            header, payload = receive_message(worker.sock, MAX_HELLO_SIZE, 0)
+            if header['type'] != 'hello':
+                raise ValueError("Expected a hello")
+            self.events.put((worker, header, payload))
+            if not self._authorized(header):
+                return
+            greeted = True
+            worker.sock.settimeout(None)
+            while True:
+                header, payload = receive_message(worker.sock)
+                self.events.put((worker, header, payload))
+        except (OSError, ValueError):
+            if greeted:
+                self.events.put((worker, {'type': 'lost'}, b""))
+            else:
+                worker.sock.close()
+
+    def _chunks(self, jobs, results, on_result):
+        """Split jobs into chunks of a single shader, answering anything already in the cache."""
+        chunk_id = 0
+        current = []
+        for job in jobs:
+            if self.cache is not None:
+                cached = self.cache.lookup(job)
+                if cached is not None:
+                    self.add_result(cached, results, on_result)
+                    continue
+            if current and (len(current) >= self.chunk_size or current[0].shader_name != job.shader_name):
+                yield _Chunk(chunk_id, current)
+                chunk_id += 1
+                current = []
+            current.append(job)
+        if current:
+            yield _Chunk(chunk_id, current)
+
+    def _drop(self, worker, requeue):
+        """Forget a worker, and put whatever it hadn't finished back in the queue."""
+        if self.workers.pop(worker.worker_id, None) is None:
+            return
+        print("Lost worker {}, reassigning {} combos".format(
+            worker.name, sum(len(chunk.pending) for chunk in worker.chunks.values())))
+        requeue.extendleft(chunk for chunk in worker.chunks.values() if chunk.pending)
+        worker.chunks.clear()
+        worker.sock.close()
+
+    def _authorized(self, header):
+        if self.token is None:
+            return True
+        token = header.get('token')
+        return isinstance(token, str) and hmac.compare_digest(token.encode(), self.token.encode())
+
+    def _handle(self, worker, header, payload, results, on_result, requeue):
+        if worker.refused:
+            return
+        worker.last_seen = time.monotonic()
+        kind = header['type']
+        if kind != 'hello' and worker.worker_id not in self.workers:
+            # Nothing but a hello until it's been let in
+            return
+        if kind == 'hello':
+            if not self._authorized(header):
+                worker.refused = True
+                print("Turned away worker {}, wrong token".format(worker.name))
+                send_message(worker.sock, {'type': 'refused'})
+                worker.sock.close()
+                return
+            worker.threads = max(1, header.get('threads', 1))
+            self.workers[worker.worker_id] = worker
+            send_message(worker.sock, {'type': 'sources', 'names': list(self.sources),
+                                       'sizes': [len(data) for data in self.sources.values()]},
+                         b"".join(self.sources.values()))
+            worker.ready = True
+            print("Worker {} connected, {} threads".format(worker.name, worker.threads))
+        elif kind == 'result':
+            chunk = worker.chunks.get(header['chunk'])
+            job = chunk.pending.pop(header['combo_index'], None) if chunk is not None else None
+            if job is None:
+                # Already reassigned and finished somewhere else
+                return
+            if not chunk.pending:
+                del worker.chunks[chunk.chunk_id]
+            result = CompileResult(job, payload if header['ok'] else None, header['output'], header['returncode'],
+                                   header['seconds'])
+            if self.cache is not None:
+                self.cache.store(result)
+            self.add_result(result, results, on_result)
+        elif kind == 'lost':
+            self._drop(worker, requeue)
+
+    def run_jobs(self, jobs, results, on_result=None):
+        """
+        Compile an iterable of jobs on whichever workers connect.
+
+        :param jobs: Iterable of :class:`CompileJob`
+        :param results: Dict of shader name to :class:`ShaderCompileResult`, filled in as jobs finish
+        :param on_result: Called with each :class:`CompileResult` and its :class:`ShaderCompileResult`
+        """
+        if self.cache is not None:
+            jobs = self.cache.prefetch(jobs)
+        chunks = self._chunks(jobs, results, on_result)
+        requeue = deque()
+        # Pull the first chunk now, there may be nothing left to compile once the cache has been checked
+        first = next(chunks, None)
+        exhausted = first is None
+        if first is not None:
+            requeue.append(first)
+        waiting_since = time.monotonic()
+        print("Coordinator listening on port {}".format(self.port))
+        while True:
+            for worker in list(self.workers.values()):
+                while worker.ready and len(worker.chunks) < worker.capacity(self.chunk_size):
+                    chunk = requeue.popleft() if requeue else None
+                    if chunk is None and not exhausted:
+                        chunk = next(chunks, None)
+                        exhausted = chunk is None
+                    if chunk is None:
+                        break
+                    worker.chunks[chunk.chunk_id] = chunk
+                    try:
+                        send_message(worker.sock, chunk.to_message())
+                    except OSError:
+                        self._drop(worker, requeue)
+                        break
+
+            in_flight = any(worker.chunks for worker in self.workers.values())
+            if exhausted and not requeue and not in_flight:
+                return
+            if not self.workers and time.monotonic() - waiting_since > self.heartbeat_timeout:
+                print("Waiting for workers to connect on port {}".format(self.port))
+                waiting_since = time.monotonic()
+
+            try:
+                worker, header, payload = self.events.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                worker = None
+            if worker is not None:
+                try:
+                    self._handle(worker, header, payload, results, on_result, requeue)
+                except (OSError, KeyError, TypeError, ValueError):
+                    # Gone, or sent something that makes no sense, either way it's no use
+                    self._drop(worker, requeue)
+                    worker.sock.close()
+
+            now = time.monotonic()
+            for worker in list(self.workers.values()):
+                if now - worker.last_seen > self.heartbeat_timeout:
+                    self._drop(worker, requeue)
+
+
+class Worker:
+    """Compiles chunks handed out by a :class:`Coordinator`."""
+
+    def __init__(self, host, port, command, threads=1, token=None):
+        """
+        :param host: Coordinator address
+        :param port: Coordinator port
+        :param command: Compiler command template, see :class:`CommandCompiler`
+        :param threads: Combos to compile at once
+        :param token: The coordinator's token
+        """
+        self.token = token
+        self.host = host
+        self.port = port
+        self.command = command
+        self.threads = max(1, threads)
+        self.sock = None
+        self._send_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def _send(self, header, payload=b""):
+        with self._send_lock:
+            send_message(self.sock, header, payload)
+
+    def _connect(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return socket.create_connection((self.host, self.port))
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+
+    def _heartbeat(self):
+        while not self._stopped.wait(HEARTBEAT_INTERVAL):
+            try:
+                self._send({'type': 'heartbeat'})
+            except OSError:
+                return
+
+    def _compile(self, compiler, chunk_id, job):
+        result = compiler.compile(job)
+        self._send({
+            'type': 'result',
+            'chunk': chunk_id,
+            'combo_index': job.combo_index,
+            'ok': result.ok,
+            'output': result.output,
+            'returncode': result.returncode,
+            'seconds': result.seconds,
+        }, result.bytecode if result.ok else b"")
+
+    def _compile_done(self, chunk_id, job, future):
+        """Report a combo whose compile raised rather than leave the coordinator waiting for it forever."""
+        error = future.exception()
+        if error is None:
+            return
+        try:
+            self._send({
+                'type': 'result',
+                'chunk': chunk_id,
+                'combo_index': job.combo_index,
+                'ok': False,
+                'output': "Worker {} failed: {!r}".format(socket.gethostname(), error),
+                'returncode': -1,
+                'seconds': 0.0,
+            })
+        except OSError:
+            # Lost the coordinator, it will hand the chunk to someone else
+            pass
+
+    def _submit(self, executor, compiler, work_dir, chunk_id, job):
+        # Compiled in work_dir, so it may only name a file in there
+        worker_path(work_dir, job['file_name'])
+        job = CompileJob(job['shader_name'], job['file_name'], job['profile'], job['combo_index'],
+                         [tuple(define) for define in job['defines']], source_digest=job['source_digest'])
+        future = executor.submit(self._compile, compiler, chunk_id, job)
+        future.add_done_callback(lambda done: self._compile_done(chunk_id, job, done))
+
+    def run(self, connect_timeout=60.0):
+        """Serve one coordinator until it's done with us."""
+        self.sock = self._connect(connect_timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        work_dir = tempfile.mkdtemp(prefix="shadercompile_worker_")
+        compiler = CommandCompiler(self.command, work_dir)
+        threading.Thread(target=self._heartbeat, daemon=True).start()
+        try:
+            hello = {'type': 'hello', 'threads': self.threads}
+            if self.token is not None:
+                hello['token'] = self.token
+            self._send(hello)
+            with ThreadPoolExecutor(self.threads) as executor:
+                while True:
+                    header, payload = receive_message(self.sock)
+                    if header['type'] == 'sources':
+                        offset = 0
+                        for name, size in zip(header['names'], header['sizes']):
+                            with open(worker_path(work_dir, name), "wb") as source_file:
+                                source_file.write(payload[offset:offset + size])
+                            offset += size
+                    elif header['type'] == 'chunk':
+                        for job in header['jobs']:
+                            self._submit(executor, compiler, work_dir, header['chunk'], job)
+                    elif header['type'] == 'refused':
+                        print("The coordinator at {}:{} turned us away, check -coordinator_token".format(
+                            self.host, self.port))
+                        break
+                    elif header['type'] == 'shutdown':
+                        break
+        except ConnectionError:
+            pass
+        except ValueError as error:
+            print(error)
+        finally:
+            self._stopped.set()
+            self.sock.close()
+            shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,61 @@
+"""Helpers for writing generated files."""
+import os
+import secrets
+
+
+def _create_temp(path):
+    """
+    Create a temporary file next to ``path``.
+
+    Unlike with mkstemp, which makes files only we can read, the umask applies as it would for open(),
+    so the file ends up with the same permissions it would have had if written directly.
+
+    :return: ``(file descriptor, temporary path)``
+    """
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        temp_path = "{}.{}.tmp".format(path, secrets.token_hex(4))
+        try:
+            return os.open(temp_path, flags, 0o666), temp_path
+        except FileExistsError:
+            continue
+
+
+def write_if_changed(path, text):
+    """
+    Write ``text`` to ``path``, but only if the file doesn't already hold exactly that.
+
+    Unchanged files keep their modification time, so anything that depends on them (like the C++
+    files including a generated ``.inc``) isn't rebuilt. Changed files are written to a temporary file
+    first and renamed into place, so a reader never sees a half written file.
+
+    :return: Whether the file was written
+    """
+    try:
+        with open(path) as old_file:
+            if old_file.read() == text:
+                return False
+    except (OSError, UnicodeDecodeError):
+        pass
+
+    handle, temp_path = _create_temp(path)
+    try:
+        with open(handle, "w") as temp_file:
+            temp_file.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return True
+
+
+def write_bytes_atomic(path, data):
+    """Write ``data`` to a temporary file and rename it over ``path`` in one go."""
+    handle, temp_path = _create_temp(path)
+    try:
+        with open(handle, "wb") as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
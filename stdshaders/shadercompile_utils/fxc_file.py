@@ -1,103 +1,219 @@
+import math
+import os.path
 import re
+import sys
+
+from .include_graph import get_graph
 
 
 def read_input_file(file_name):
-    out_lines = []
-    with open(file_name) as source_file:
-        for line in source_file:
-            match = re.match(r"^\s*#include\s+\"(.*)\"", line)
+    """Read a source file with every ``#include`` inlined."""
+    return get_graph().flatten(file_name)
+
+
+_annotation_re = re.compile(r"\[[^\[\]]*]")
+_initial_value_re = re.compile(r".*\[=([^]]+)]")
+_ps_annotation_re = re.compile(r"\[(ps\d+\w?)]")
+_vs_annotation_re = re.compile(r"\[(vs\d+\w?)]")
+_ps_name_re = re.compile(r".*_ps(\d+\w?)$")
+_vs_name_re = re.compile(r".*_vs(\d+\w?)$")
+_directive_re = re.compile(r"^\s*//\s*(STATIC|DYNAMIC|SKIP|CENTROID)\s*:")
+_combo_re = re.compile(r"^\s*//\s*(?:STATIC|DYNAMIC)\s*:\s*\"(.*)\"\s+\"(\d+)\.\.(\d+)\"")
+_skip_re = re.compile(r"^\s*//\s*SKIP\s*:\s*(.*)$")
+_centroid_re = re.compile(r"^\s*//\s*CENTROID\s*:\s*TEXCOORD(\d+)$")
+
+
+class Combo:
+    """
+    One ``STATIC`` or ``DYNAMIC`` combo of a target.
+
+    :ivar count: Number of values, ``max - min + 1``, or 1 once collapsed
+    :ivar stride: Step in the shader's combo index between two values, dynamic combos come first
+    :ivar dead: Collapsed by :func:`collapse_combos`, only ``min`` is compiled and ``GetIndex`` ignores it
+    """
+
+    __slots__ = ('name', 'min', 'max', 'count', 'stride', 'dead')
+
+    def __init__(self, name, min_value, max_value, stride=1):
+        self.name = sys.intern(name)
+        self.min = min_value
+        self.max = max_value
+        self.count = max_value - min_value + 1
+        self.stride = stride
+        self.dead = False
+
+    def __repr__(self):
+        return "Combo({!r}, {}, {}, {})".format(self.name, self.min, self.max, self.stride)
+
+
+class Directive:
+    """One ``// STATIC``, ``// DYNAMIC``, ``// SKIP`` or ``// CENTROID`` line, with its annotations."""
+
+    def __init__(self, kind, line, raw_line):
+        """
+        :param kind: ``STATIC``, ``DYNAMIC``, ``SKIP`` or ``CENTROID``
+        :param line: The line with every ``[...]`` annotation removed
+        :param raw_line: The line as written
+        """
+        self.kind = kind
+        self.line = line
+        lower_line = raw_line.lower()
+        self.xbox = "[XBOX]" in raw_line
+        self.ps_versions = frozenset(_ps_annotation_re.findall(lower_line))
+        self.vs_versions = frozenset(_vs_annotation_re.findall(lower_line))
+        match = _initial_value_re.match(lower_line)
+        self.initial_value = match.group(1) if match else ""
+
+    def applies_to(self, ps_version, vs_version):
+        """
+        :param ps_version: e.g. ``ps20b``, or ``None`` for non pixel shaders
+        :param vs_version: e.g. ``vs30``, or ``None`` for non vertex shaders
+        """
+        if self.xbox:
+            return False
+        if ps_version and self.ps_versions and ps_version not in self.ps_versions:
+            return False
+        if vs_version and self.vs_versions and vs_version not in self.vs_versions:
+            return False
+        return True
+
+
+class ParsedSource:
+    """
+    Every combo directive in a source file, found in a single pass.
+
+    The same source is built for several targets (``_ps2x`` becomes ``_ps20`` and ``_ps20b``), so
+    annotations are kept and only resolved in :meth:`specialize`.
+    """
+
+    def __init__(self, source):
+        """
+        :param source: Lines with every ``#include`` inlined
+        """
+        self.directives = []
+        for line in source:
+            if "//" not in line:
+                continue
+            stripped = _annotation_re.sub("", line)
+            match = _directive_re.match(stripped)
             if match:
-                out_lines.extend(read_input_file(match.group(1)))
+                self.directives.append(Directive(match.group(1), stripped, line))
+
+    def specialize(self, shader_name):
+        """
+        Resolve the directives that apply to one target.
+
+        :param shader_name: Output shader name, its suffix picks the target
+        :return: ``(static_combos, dynamic_combos, static_defs, skips, centroid_mask)``
+        """
+        match = _ps_name_re.match(shader_name)
+        ps_version = "ps" + match.group(1) if match else None
+        match = _vs_name_re.match(shader_name)
+        vs_version = "vs" + match.group(1) if match else None
+
+        static_combos = []
+        dynamic_combos = []
+        static_defs = {}
+        skips = []
+        centroid_mask = 0
+        for directive in self.directives:
+            if not directive.applies_to(ps_version, vs_version):
+                continue
+            if directive.kind == "SKIP":
+                match = _skip_re.match(directive.line)
+                if match:
+                    skips.append(match.group(1).strip())
+            elif directive.kind == "CENTROID":
+                match = _centroid_re.match(directive.line)
+                if match:
+                    centroid_mask += 1 << int(match.group(1))
             else:
-                out_lines.append(line)
-    return out_lines
-
-
-def find_combos(source: [str], shader_name: str):
-    static_combos = []
-    dynamic_combos = []
-    static_defs = {}
-    for i, line in enumerate(source):
-        if re.search(r"^\s*$", line):
-            continue
-        if "[XBOX]" in line:
-            # print("Skipping XBOX combos.")
-            source[i] = ""
-            continue
-        match = re.match(r".*_ps(\d+\w?)$", shader_name)
-        if match and re.match(r".*\[ps\d+\w?]", line.lower()) and not "[ps{}]".format(match.group(1)) in line.lower():
-            # print("Skipping combos for wrong PS Version.")
-            source[i] = ""
-            continue
-        match = re.match(r".*_vs(\d+\w?)$", shader_name)
-        if match and re.match(r".*\[vs\d+\w?]", line.lower()) and not "[vs{}]".format(match.group(1)) in line.lower():
-            # print("Skipping combos for wrong VS Version.")
-            source[i] = ""
-            continue
-        match = re.match(r".*\[=([^]]+)]", line.lower())
-        initial_value = ""
-        if match:
-            initial_value = match.group(1)
-
-        source[i] = line = re.sub(r"\[[^\[\]]*]", "", line)
-
-        match = re.match(r"^\s*//\s*STATIC\s*:\s*\"(.*)\"\s+\"(\d+)\.\.(\d+)\"", line)
-        if match:
-            static_combos.append({
-                'name': match.group(1),
-                'min': match.group(2),
-                'max': match.group(3)
-            })
-            static_defs[match.group(1)] = initial_value
-
-        match = re.match(r"^\s*//\s*DYNAMIC\s*:\s*\"(.*)\"\s+\"(\d+)\.\.(\d+)\"", line)
-        if match:
-            dynamic_combos.append({
-                'name': match.group(1),
-                'min': match.group(2),
-                'max': match.group(3)
-            })
-    return static_combos, dynamic_combos, static_defs
-
-
-def find_skips(source: [str]):
-    skip_code = ""
-    skips = []
-    for line in source:
-        match = re.match(r"^\s*//\s*SKIP\s*:\s*(.*)$", line)
-        if match:
-            skip_code += "(" + match.group(1).strip() + ")||"
-            skips.append(match.group(1).strip())
-    skip_code += "0"
-    return skip_code, skips
-
-
-def find_centroids(source: [str]):
-    centroid_mask = 0
-    for line in source:
-        match = re.match(r"^\s*//\s*CENTROID\s*:\s*TEXCOORD(\d+)$", line)
-        if match:
-            centroid_mask += 1 << int(match.group(1))
-    return centroid_mask
-
-
-def _write_variable_func_int(name, min_val, max_val):
-    var_name = "m_n" + name
-    bool_name = "m_b" + name
-    out_string = "\tvoid Set" + name + "( int i )\n\t{\n"
-    out_string += "\t\tAssert( i >= " + min_val + " && i <= " + max_val + " );\n"
-    out_string += "\t\t" + var_name + " = i;\n"
-    out_string += "#ifdef _DEBUG\n"
-    out_string += "\t\t" + bool_name + " = true;\n"
-    out_string += "#endif\t// _DEBUG\n"
-    out_string += "\t}\n\n"
-    out_string += "\tvoid Set" + name + "( bool i )\n\t{\n"
-    out_string += "\t\t" + var_name + " = i ? 1 : 0;\n"
-    out_string += "#ifdef _DEBUG\n"
-    out_string += "\t\t" + bool_name + " = true;\n"
-    out_string += "#endif\t// _DEBUG\n"
-    out_string += "\t}\n\n"
-    return out_string
+                match = _combo_re.match(directive.line)
+                if match:
+                    combo = Combo(match.group(1), int(match.group(2)), int(match.group(3)))
+                    if directive.kind == "STATIC":
+                        static_combos.append(combo)
+                        static_defs[combo.name] = directive.initial_value
+                    else:
+                        dynamic_combos.append(combo)
+        _assign_strides(static_combos, dynamic_combos)
+        return static_combos, dynamic_combos, static_defs, skips, centroid_mask
+
+
+def _assign_strides(static_combos, dynamic_combos):
+    stride = 1
+    for combo in dynamic_combos + static_combos:
+        combo.stride = stride
+        stride *= combo.count
+
+
+def collapse_combos(static_combos, dynamic_combos, names):
+    """
+    Take combos out of the combo space: they're only compiled at their minimum, and ``GetIndex``
+    gives the same index whatever they're set to. Only safe for combos that never change the code,
+    see :func:`dead_combos.find_dead_combos`.
+
+    :param names: Names of the combos to collapse
+    """
+    for combo in static_combos + dynamic_combos:
+        if combo.name in names:
+            combo.dead = True
+            combo.count = 1
+    _assign_strides(static_combos, dynamic_combos)
+
+
+_parsed_sources = {}
+
+
+def parse_input_file(file_name):
+    """
+    Read and scan a source file, reusing the result for every target built from it.
+
+    :return: :class:`ParsedSource`
+    """
+    file_name = os.path.normpath(file_name)
+    lines = get_graph().lines(file_name)
+    cached = _parsed_sources.get(file_name)
+    if cached is None or cached[0] is not lines:
+        cached = (lines, ParsedSource(lines))
+        _parsed_sources[file_name] = cached
+    return cached[1]
+
+
+def make_skip_code(skips: [str]):
+    """Join SKIP expressions into the single expression shadercompile expects."""
+    return "".join("(" + skip + ")||" for skip in skips) + "0"
+
+
+_CSHADER_INCLUDE = "#include \"shaderlib/cshader.h\"\n\n"
+
+
+# Templates for the generated index classes, as functions of their fields. f-strings are the fastest way
+# CPython has of filling them in.
+def _setter_code(name, min_val, max_val):
+    return (f"\tvoid Set{name}( int i )\n\t{{\n"
+            f"\t\tAssert( i >= {min_val} && i <= {max_val} );\n"
+            f"\t\tm_n{name} = i;\n"
+            f"#ifdef _DEBUG\n\t\tm_b{name} = true;\n#endif\t// _DEBUG\n\t}}\n\n"
+            f"\tvoid Set{name}( bool i )\n\t{{\n"
+            f"\t\tm_n{name} = i ? 1 : 0;\n"
+            f"#ifdef _DEBUG\n\t\tm_b{name} = true;\n#endif\t// _DEBUG\n\t}}\n\n")
+
+
+def _class_head_code(kind, shader_name, forgot, class_name):
+    return (f"#define shader{kind}Test_{shader_name} ({forgot}0)\n\n"
+            f"class {class_name}\n{{\npublic:\n"
+            f"\t{class_name}( void )\n\t{{\n")
+
+
+def _get_index_code(all_defined, index):
+    return ("\t}\n\n"
+            "\tint GetIndex( void )\n\t{\n"
+            "\t\t// Asserts to make sure that we aren't using any skipped combinations.\n\n"
+            "#ifdef _DEBUG\n"
+            "\t\t// Asserts to make sure that we are setting all of the combination vars.\n"
+            f"{all_defined}#endif\t// _DEBUG\n\n"
+            f"\t\treturn {index}0;\n\t}}\n\n")
 
 
 def get_shader_type(shader_name):
@@ -126,204 +242,102 @@ def get_shader_type(shader_name):
         exit(1)
 
 
-def write_static_classes(shader_name, static_combos, static_defs, dynamic_combos, skips: [str]):
-    class_name = shader_name + "_Static_Index"
-    out_string = "#include \"shaderlib/cshader.h\"\n\n"
+def _write_index_class(kind, shader_name, combos, initial_values):
+    """
+    Generate one ``*_Static_Index`` or ``*_Dynamic_Index`` class.
 
-    # A define
-    out_string += "#define shaderStaticTest_" + shader_name + " ("
+    :param kind: ``Static`` or ``Dynamic``
+    :param combos: List of :class:`Combo`, their strides go into ``GetIndex``
+    :param initial_values: Dict of combo name to the expression it starts at, ``""`` if it must be set
+    """
+    class_name = f"{shader_name}_{kind}_Index"
     prefix = "vsh_" if "vs" in get_shader_type(shader_name) else "psh_"
+    forgot_prefix = f"{prefix}forgot_to_set_{kind.lower()}_"
+    names = [combo.name for combo in combos]
+    values = [initial_values.get(name, "") for name in names]
 
-    for combo in static_combos:
-        if static_defs[combo['name']] == "":
-            out_string += prefix + "forgot_to_set_static_" + combo['name'] + " + "
-
-    out_string += "0)\n"
-
-    # Start Class Definition
-    out_string += "\nclass " + class_name + "\n{\n"
-    out_string += "public:\n"
-
+    out = [_class_head_code(kind, shader_name,
+                            "".join(f"{forgot_prefix}{name} + " for name, value in zip(names, values) if value == ""),
+                            class_name)]
     # Constructor
-    out_string += "\t" + class_name + "( void )\n\t{\n"
-    for combo in static_combos:
-        var_name = "m_n" + combo['name']
-        if static_defs[combo['name']] != "":
-            out_string += "\t\t" + var_name + " = " + static_defs[combo['name']] + ";\n"
-        else:
-            out_string += "\t\t" + var_name + " = 0;\n"
-    out_string += "#ifdef _DEBUG\n"
-    for combo in static_combos:
-        bool_name = "m_b" + combo['name']
-        if static_defs[combo['name']] != "":
-            out_string += "\t\t" + bool_name + " = true;\n"
-        else:
-            out_string += "\t\t" + bool_name + " = false;\n"
-    out_string += "#endif\t// _DEBUG\n"
-    out_string += "\t}\n\n"
-
-    # An Engine-Internal Function
-    out_string += "\tint GetIndex( void )\n\t{\n"
-    out_string += "\t\t// Asserts to make sure that we aren't using any skipped combinations.\n"
-    for skip in skips:
-        c_skip = skip.replace("$", "")
-        # out_string += "\t\tAssert( !(" + c_skip + ") );\n"
-    out_string += "\n#ifdef _DEBUG\n"
-    out_string += "\t\t// Asserts to make sure that we are setting all of the combination vars.\n"
-    if len(static_combos) > 0:
-        combined = ""
-        operator = False
-        for combo in static_combos:
-            if operator:
-                combined += " && "
-            combined += "m_b" + combo['name']
-            operator = True
-        out_string += "\t\tbool bAllStaticVarsDefined = " + combined + ";\n"
-        out_string += "\t\tAssert( bAllStaticVarsDefined );\n"
-    out_string += "#endif\t// _DEBUG\n"
-    out_string += "\n\t\treturn "
-    if len(static_combos) > 0:
-        scale = 1
-        for combo in dynamic_combos:
-            scale *= int(combo['max']) - int(combo['min']) + 1
-        for combo in static_combos:
-            var_name = "m_n" + combo['name']
-            out_string += "( " + hex(scale).upper().replace("X", "x") + " * m_n" + combo['name'] + " ) + "
-            scale *= int(combo['max']) - int(combo['min']) + 1
-    out_string += "0;\n\t}\n\n"
+    out.extend(f"\t\tm_n{name} = {value or '0'};\n" for name, value in zip(names, values))
+    out.append("#ifdef _DEBUG\n")
+    out.extend(f"\t\tm_b{name} = {'false' if value == '' else 'true'};\n" for name, value in zip(names, values))
+    out.append("#endif\t// _DEBUG\n")
+
+    all_defined = ""
+    if combos:
+        all_defined = (f"\t\tbool bAll{kind}VarsDefined = m_b{' && m_b'.join(names)};\n"
+                       f"\t\tAssert( bAll{kind}VarsDefined );\n")
+    index = "".join(f"( 0x{combo.stride:X} * m_n{combo.name} ) + " for combo in combos if not combo.dead)
+    out.append(_get_index_code(all_defined, index))
 
     # Setters
-    for combo in static_combos:
-        out_string += _write_variable_func_int(combo['name'], combo['min'], combo['max'])
-
-    out_string += "private:\n"
+    out.extend(_setter_code(combo.name, combo.min, combo.max) for combo in combos)
 
     # Member Vars
-    for combo in static_combos:
-        out_string += "\t int m_n" + combo['name'] + ";\n"
-    out_string += "#ifdef _DEBUG\n"
-    for combo in static_combos:
-        out_string += "\t bool m_b" + combo['name'] + ";\n"
-    out_string += "#endif\t// _DEBUG\n"
+    out.append("private:\n")
+    out.extend(f"\t int m_n{name};\n" for name in names)
+    out.append("#ifdef _DEBUG\n")
+    out.extend(f"\t bool m_b{name};\n" for name in names)
+    out.append("#endif\t// _DEBUG\n};\n")
+    return "".join(out)
 
-    out_string += "};\n"
 
-    return out_string
+def write_static_classes(shader_name, static_combos, static_defs, dynamic_combos, skips: [str], include_cshader=True):
+    """
+    :param include_cshader: Start with ``#include "shaderlib/cshader.h"``, left out when the class goes
+        into a header that includes it once for every shader
+    """
+    code = _write_index_class("Static", shader_name, static_combos, static_defs)
+    return _CSHADER_INCLUDE + code if include_cshader else code
 
 
 def write_dynamic_classes(shader_name, dynamic_combos, skips: [str]):
-    class_name = shader_name + "_Dynamic_Index"
-    out_string = ""
-
-    # A define
-    out_string += "#define shaderDynamicTest_" + shader_name + " ("
-    prefix = "vsh_" if "vs" in get_shader_type(shader_name) else "psh_"
-
-    for combo in dynamic_combos:
-        out_string += prefix + "forgot_to_set_dynamic_" + combo['name'] + " + "
-
-    out_string += "0)\n"
-
-    # Start Class Definition
-    out_string += "\nclass " + class_name + "\n{\n"
-    out_string += "public:\n"
+    return _write_index_class("Dynamic", shader_name, dynamic_combos, {})
 
-    # Constructor
-    out_string += "\t" + class_name + "( void )\n\t{\n"
-    for combo in dynamic_combos:
-        var_name = "m_n" + combo['name']
-        out_string += "\t\t" + var_name + " = 0;\n"
-    out_string += "#ifdef _DEBUG\n"
-    for combo in dynamic_combos:
-        bool_name = "m_b" + combo['name']
-        out_string += "\t\t" + bool_name + " = false;\n"
-    out_string += "#endif\t// _DEBUG\n"
-    out_string += "\t}\n\n"
-
-    # An Engine-Internal Function
-    out_string += "\tint GetIndex( void )\n\t{\n"
-    out_string += "\t\t// Asserts to make sure that we aren't using any skipped combinations.\n"
-    for skip in skips:
-        c_skip = skip.replace("$", "")
-        # out_string += "\t\tAssert( !(" + c_skip + ") );\n"
-    out_string += "\n#ifdef _DEBUG\n"
-    out_string += "\t\t// Asserts to make sure that we are setting all of the combination vars.\n"
-    if len(dynamic_combos) > 0:
-        combined = ""
-        operator = False
-        for combo in dynamic_combos:
-            if operator:
-                combined += " && "
-            combined += "m_b" + combo['name']
-            operator = True
-        out_string += "\t\tbool bAllDynamicVarsDefined = " + combined + ";\n"
-        out_string += "\t\tAssert( bAllDynamicVarsDefined );\n"
-    out_string += "#endif\t// _DEBUG\n"
-    out_string += "\n\t\treturn "
-    if len(dynamic_combos) > 0:
-        scale = 1
-        for combo in dynamic_combos:
-            out_string += "( " + hex(scale).upper().replace("X", "x") + " * m_n" + combo['name'] + " ) + "
-            scale *= int(combo['max']) - int(combo['min']) + 1
-    out_string += "0;\n\t}\n\n"
 
-    # Setters
-    for combo in dynamic_combos:
-        out_string += _write_variable_func_int(combo['name'], combo['min'], combo['max'])
+def num_combos(static_combos, dynamic_combos):
+    """:return: Number of combos, skipped or not"""
+    return num_dynamic_combos(dynamic_combos) * math.prod(combo.count for combo in static_combos)
 
-    out_string += "private:\n"
 
-    # Member Vars
-    for combo in dynamic_combos:
-        out_string += "\t int m_n" + combo['name'] + ";\n"
-    out_string += "#ifdef _DEBUG\n"
-    for combo in dynamic_combos:
-        out_string += "\t bool m_b" + combo['name'] + ";\n"
-    out_string += "#endif\t// _DEBUG\n"
-
-    out_string += "};\n"
-
-    return out_string
+def num_dynamic_combos(dynamic_combos):
+    """:return: Number of dynamic combos in each static combo"""
+    return math.prod(combo.count for combo in dynamic_combos)
 
 
-def _num_combos(static_combos, dynamic_combos):
-    scale = 1
+def format_file_list(shader_name, file_name, static_combos, dynamic_combos, skip_code, centroid_mask):
+    out_string = "#BEGIN " + shader_name + "\n"
+    out_string += file_name + "\n"
+    out_string += "#DEFINES-D:\n"
     for combo in dynamic_combos:
-        scale *= int(combo['max']) - int(combo['min']) + 1
+        out_string += "{}={}..{}\n".format(combo.name, combo.min, combo.min if combo.dead else combo.max)
+    out_string += "#DEFINES-S:\n"
     for combo in static_combos:
-        scale *= int(combo['max']) - int(combo['min']) + 1
-    return scale
+        out_string += "{}={}..{}\n".format(combo.name, combo.min, combo.min if combo.dead else combo.max)
+    out_string += "#SKIPS:\n" + skip_code + "\n"
+    out_string += "#COMMAND:\n"
+    out_string += "fxc.exe "
+    out_string += "/DTOTALSHADERCOMBOS=" + str(num_combos(static_combos, dynamic_combos)) + " "
+    out_string += "/DCENTROIDMASK=" + str(centroid_mask) + " "
+    out_string += "/DNUMDYNAMICCOMBOS=" + str(num_dynamic_combos(dynamic_combos)) + " "
+    out_string += "/DFLAGS=0x0"
+    out_string += "\n"
+    out_string += "/Dmain=main /Emain /T" + get_shader_type(shader_name) + " "
+    out_string += "/DSHADER_MODEL_" + get_shader_type(shader_name).upper() + "=1 "
+    out_string += "/nologo "
+    out_string += "/Foshader.o "
+    out_string += file_name
+    out_string += ">output.txt 2>&1 \n"
+    out_string += "#END\n"
+    return out_string
 
 
-def _num_dynamic_combos(dynamic_combos):
-    scale = 1
-    for combo in dynamic_combos:
-        scale *= int(combo['max']) - int(combo['min']) + 1
-    return scale
+def write_file_list(file_list_code, work_dir=""):
+    with open(os.path.join(work_dir, "compile_temp", "filelist.txt"), "a") as file_list:
+        file_list.write(file_list_code)
 
 
 def dump_file_list(shader_name, file_name, static_combos, dynamic_combos, skip_code, centroid_mask):
-    with open("./compile_temp/filelist.txt", "a") as file_list:
-        file_list.write("#BEGIN " + shader_name + "\n")
-        file_list.write(file_name + "\n")
-        file_list.write("#DEFINES-D:\n")
-        for combo in dynamic_combos:
-            file_list.write(combo['name'] + "=" + combo['min'] + ".." + combo['max'] + "\n")
-        file_list.write("#DEFINES-S:\n")
-        for combo in static_combos:
-            file_list.write(combo['name'] + "=" + combo['min'] + ".." + combo['max'] + "\n")
-        file_list.write("#SKIPS:\n" + skip_code + "\n")
-        file_list.write("#COMMAND:\n")
-        file_list.write("fxc.exe ")
-        file_list.write("/DTOTALSHADERCOMBOS=" + str(_num_combos(static_combos, dynamic_combos)) + " ")
-        file_list.write("/DCENTROIDMASK=" + str(centroid_mask) + " ")
-        file_list.write("/DNUMDYNAMICCOMBOS=" + str(_num_dynamic_combos(dynamic_combos)) + " ")
-        file_list.write("/DFLAGS=0x0")
-        file_list.write("\n")
-        file_list.write("/Dmain=main /Emain /T" + get_shader_type(shader_name) + " ")
-        file_list.write("/DSHADER_MODEL_" + get_shader_type(shader_name).upper() + "=1 ")
-        file_list.write("/nologo ")
-        file_list.write("/Foshader.o ")
-        file_list.write(file_name)
-        file_list.write(">output.txt 2>&1 \n")
-        file_list.write("#END\n")
+    write_file_list(format_file_list(shader_name, file_name, static_combos, dynamic_combos, skip_code, centroid_mask))
@@ -0,0 +1,177 @@
+"""
+Local history of how long shaders took to compile, used to predict what the next build will cost.
+"""
+import os
+import time
+
+from . import fxc_file
+from .skip_eval import SkipEvaluator
+from .skip_eval import SkipSyntaxError
+
+# Runs of a shader averaged for its per-combo time
+RECENT_RUNS = 5
+# Runs of other shaders averaged for a shader with no history of its own
+PROFILE_RUNS = 200
+
+
+class BuildHistory:
+    """
+    Compile times and combo counts of every shader built, in an SQLite file.
+
+    A shader's per-combo time is taken from its last few builds, falling back to other shaders with
+    the same profile, then to every shader, so new shaders still get a prediction.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Database file, created if needed
+        """
+        # Only needed once there's a history to read, so importing the package doesn't load it
+        import sqlite3
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS compiles ("
+            "shader TEXT NOT NULL, profile TEXT NOT NULL, combos INTEGER NOT NULL, compiled INTEGER NOT NULL, "
+            "seconds REAL NOT NULL, time REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS compiles_shader ON compiles (shader, time)")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def record(self, shader_name, profile, combos, compiled, seconds):
+        """
+        Add a build of one shader.
+
+        :param combos: Live combos the shader had
+        :param compiled: Combos actually run through the compiler, cache hits don't count
+        :param seconds: Compiler time spent on those combos
+        """
+        self.connection.execute("INSERT INTO compiles VALUES (?, ?, ?, ?, ?, ?)",
+                                (shader_name, profile, combos, compiled, seconds, time.time()))
+        self.connection.commit()
+
+    def _average(self, query, parameters):
+        rows = self.connection.execute(query, parameters).fetchall()
+        compiled = sum(row[0] for row in rows)
+        return sum(row[1] for row in rows) / compiled if compiled else None
+
+    def per_combo_seconds(self, shader_name, profile):
+        """:return: Predicted seconds per combo, or ``None`` with no history at all"""
+        for query, parameters in (
+            ("SELECT compiled, seconds FROM compiles WHERE shader = ? AND compiled > 0 ORDER BY time DESC LIMIT ?",
+             (shader_name, RECENT_RUNS)),
+            ("SELECT compiled, seconds FROM compiles WHERE profile = ? AND compiled > 0 ORDER BY time DESC LIMIT ?",
+             (profile, PROFILE_RUNS)),
+            ("SELECT compiled, seconds FROM compiles WHERE compiled > 0 ORDER BY time DESC LIMIT ?",
+             (PROFILE_RUNS,)),
+        ):
+            average = self._average(query, parameters)
+            if average is not None:
+                return average
+        return None
+
+    def last_combos(self, shader_name):
+        """:return: Live combos at the shader's last recorded build, or ``None``"""
+        row = self.connection.execute("SELECT combos FROM compiles WHERE shader = ? ORDER BY time DESC LIMIT 1",
+                                      (shader_name,)).fetchone()
+        return row[0] if row else None
+
+
+class CostEstimate:
+    """Predicted cost of compiling one shader."""
+
+    def __init__(self, shader_name, combos, previous_combos, seconds):
+        """
+        :param combos: Live combos
+        :param previous_combos: Live combos at the last recorded build, or ``None``
+        :param seconds: Predicted compile time, or ``None`` without any history
+        """
+        self.shader_name = shader_name
+        self.combos = combos
+        self.previous_combos = previous_combos
+        self.seconds = seconds
+
+
+def live_combos(shader):
+    """:return: Number of combos ``shader`` compiles, every combo if its SKIPs can't be evaluated"""
+    try:
+        return SkipEvaluator(shader.static_combos, shader.dynamic_combos, shader.skips).count_live()
+    except SkipSyntaxError:
+        return fxc_file.num_combos(shader.static_combos, shader.dynamic_combos)
+
+
+def record_vcs_times(history, shader_list, vcs_dir, start_time, threads):
+    """
+    Record a shadercompile.exe build, which doesn't report per-shader times.
+
+    shadercompile.exe works through filelist.txt a shader at a time and writes each ``.vcs`` once its
+    last combo is done, so a shader is taken to have cost the time since the ``.vcs`` written before
+    it, on every thread. Shaders whose ``.vcs`` wasn't written during the build are left out.
+
+    :param vcs_dir: Directory shadercompile.exe wrote the ``.vcs`` files to
+    :param start_time: ``time.time()`` when shadercompile.exe was started
+    :param threads: Threads shadercompile.exe ran
+    """
+    written = []
+    for shader in shader_list:
+        if shader.type != "fxc" or not shader.compile_vcs:
+            continue
+        try:
+            mtime = os.stat(os.path.join(vcs_dir, shader.shader_name + ".vcs")).st_mtime
+        except OSError:
+            continue
+        if mtime >= start_time:
+            written.append((mtime, shader))
+    written.sort(key=lambda item: item[0])
+    previous = start_time
+    for mtime, shader in written:
+        combos = live_combos(shader)
+        history.record(shader.shader_name, fxc_file.get_shader_type(shader.shader_name), combos, combos,
+                       (mtime - previous) * threads)
+        previous = mtime
+
+
+def estimate_costs(shader_list, history):
+    """
+    Predict the compile time of every ``.fxc`` shader: live combos times its per-combo time.
+
+    :param shader_list: Prepped shaders
+    :param history: :class:`BuildHistory`
+    :return: Dict of shader name to :class:`CostEstimate`
+    """
+    estimates = {}
+    for shader in shader_list:
+        if shader.type != "fxc":
+            continue
+        combos = live_combos(shader)
+        per_combo = history.per_combo_seconds(shader.shader_name, fxc_file.get_shader_type(shader.shader_name))
+        estimates[shader.shader_name] = CostEstimate(
+            shader.shader_name, combos, history.last_combos(shader.shader_name),
+            combos * per_combo if per_combo is not None else None)
+    return estimates
+
+
+def check_budget(estimates, shader_budget=None, total_budget=None):
+    """
+    :param estimates: Result of :func:`estimate_costs`
+    :param shader_budget: Seconds any one shader may take
+    :param total_budget: Seconds the whole list may take
+    :return: List of messages, one per budget that's exceeded
+    """
+    messages = []
+    total = 0.0
+    for estimate in sorted(estimates.values(), key=lambda e: e.seconds or 0, reverse=True):
+        if estimate.seconds is None:
+            continue
+        total += estimate.seconds
+        if shader_budget is not None and estimate.seconds > shader_budget:
+            grown = ""
+            if estimate.previous_combos and estimate.previous_combos != estimate.combos:
+                grown = ", was {} combos".format(estimate.previous_combos)
+            messages.append("{}: {} combos, predicted {:.0f}s, over the {:g}s shader budget{}".format(
+                estimate.shader_name, estimate.combos, estimate.seconds, shader_budget, grown))
+    if total_budget is not None and total > total_budget:
+        messages.append("Predicted {:.0f}s in total, over the {:g}s budget".format(total, total_budget))
+    return messages
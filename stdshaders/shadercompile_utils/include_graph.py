@@ -0,0 +1,267 @@
+"""Reads every source file once and keeps track of who includes what."""
+import hashlib
+import io
+import os.path
+import re
+
+_include_re = re.compile(r"^\s*#include\s+\"(.*)\"")
+_pragma_once_re = re.compile(r"^\s*#\s*pragma\s+once\b")
+_ifndef_re = re.compile(r"^\s*#\s*ifndef\s+(\w+)")
+_define_re = re.compile(r"^\s*#\s*define\s+(\w+)")
+_endif_re = re.compile(r"^\s*#\s*endif\b")
+
+
+def file_state(path):
+    """:return: ``(mtime, size)`` of ``path``, or ``None`` if it doesn't exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class SourceFile:
+    """A parsed source file."""
+
+    def __init__(self, path, data, state=None):
+        """
+        :param path: Normalized file path
+        :param data: Raw file contents
+        :param state: :func:`file_state` of the file when it was read
+        """
+        self.path = path
+        self.state = state
+        self.digest = hashlib.sha1(data).hexdigest()
+        # Decoded the same way open() would, so the lines match what the old per-shader reads saw
+        self.lines = io.TextIOWrapper(io.BytesIO(data)).readlines()
+        # (line index, name as written)
+        self.includes = []
+        for i, line in enumerate(self.lines):
+            match = _include_re.match(line)
+            if match:
+                self.includes.append((i, match.group(1)))
+        self.include_once = self._find_include_once()
+
+    def _find_include_once(self):
+        """Check for ``#pragma once`` or a classic ``#ifndef X / #define X ... #endif`` guard."""
+        code = [line for line in self.lines if line.strip() != "" and not line.lstrip().startswith("//")]
+        if any(_pragma_once_re.match(line) for line in code):
+            return True
+        if len(code) < 3:
+            return False
+        guard = _ifndef_re.match(code[0])
+        define = _define_re.match(code[1])
+        return guard is not None and define is not None and guard.group(1) == define.group(1) \
+            and _endif_re.match(code[-1]) is not None
+
+
+class IncludeGraph:
+    """
+    The ``#include`` graph of every shader in a build.
+
+    Each file is read and parsed once per run, no matter how many shaders include it. Includes are
+    resolved relative to the including file first, then relative to each of ``search_dirs``.
+    """
+
+    def __init__(self):
+        self._files = {}
+        self._resolved = {}
+        self._included_by = {}
+        self._flattened = {}
+        self._roots = set()
+        # Directories includes not found next to the including file are looked up in, "" is the working directory
+        self.search_dirs = [""]
+
+    def get(self, path):
+        """
+        :param path: File path
+        :return: The :class:`SourceFile` for ``path``
+        """
+        path = os.path.normpath(path)
+        source = self._files.get(path)
+        if source is None:
+            with open(path, "rb") as source_file:
+                stat = os.fstat(source_file.fileno())
+                source = SourceFile(path, source_file.read(), (stat.st_mtime_ns, stat.st_size))
+            self._files[path] = source
+        return source
+
+    def resolve(self, name, including_file):
+        """
+        Find the file an ``#include "name"`` in ``including_file`` refers to.
+
+        :return: Normalized path, which may not exist
+        """
+        key = (name, including_file)
+        path = self._resolved.get(key)
+        if path is None:
+            path = os.path.normpath(os.path.join(os.path.dirname(including_file), name))
+            if not os.path.exists(path):
+                candidates = [os.path.normpath(os.path.join(directory, name)) for directory in self.search_dirs]
+                path = next((candidate for candidate in candidates if os.path.exists(candidate)), candidates[0])
+            self._resolved[key] = path
+            self._included_by.setdefault(path, set()).add(including_file)
+        return path
+
+    def _includes(self, path):
+        source = self.get(path)
+        return [(i, self.resolve(name, source.path)) for i, name in source.includes]
+
+    def dependencies(self, path):
+        """
+        :param path: Root source file, usually a shader
+        :return: Every file ``path`` includes, directly or not, in the order they are first seen
+        """
+        path = os.path.normpath(path)
+        self._roots.add(path)
+        found = []
+        seen = {path}
+
+        def walk(current):
+            for _, dep in self._includes(current):
+                if dep not in seen:
+                    seen.add(dep)
+                    found.append(dep)
+                    walk(dep)
+        walk(path)
+        return found
+
+    def edges(self, path):
+        """
+        :param path: Root source file, after :meth:`dependencies`
+        :return: List of ``(name, including file, resolved path)`` for every include under ``path``, to
+            hand to :meth:`add_edges` of another process's graph
+        """
+        path = os.path.normpath(path)
+        edges = []
+        for including_file in [path] + self.dependencies(path):
+            for _, name in self.get(including_file).includes:
+                edges.append((name, including_file, self.resolve(name, including_file)))
+        return edges
+
+    def add_edges(self, path, edges):
+        """
+        Take in the includes of a root file walked by another process, see :meth:`edges`.
+
+        The files themselves are read again if anything here needs them.
+        """
+        self._roots.add(os.path.normpath(path))
+        for name, including_file, resolved in edges:
+            key = (name, including_file)
+            if key not in self._resolved:
+                self._resolved[key] = resolved
+                self._included_by.setdefault(resolved, set()).add(including_file)
+
+    def flatten(self, path):
+        """
+        Inline every ``#include`` into one list of lines.
+
+        Files with an include guard or ``#pragma once`` are only inlined the first time they're seen.
+
+        :param path: Root source file
+        :return: A new list of lines, safe to modify
+        """
+        return list(self.lines(path))
+
+    def lines(self, path):
+        """
+        Same as :meth:`flatten`, but returns the cached tuple itself instead of a copy.
+        """
+        path = os.path.normpath(path)
+        self._roots.add(path)
+        lines = self._flattened.get(path)
+        if lines is None:
+            lines = []
+            self._flatten_r(path, lines, set())
+            lines = tuple(lines)
+            self._flattened[path] = lines
+        return lines
+
+    def _flatten_r(self, path, out_lines, included_once):
+        source = self.get(path)
+        if source.include_once:
+            if path in included_once:
+                return
+            included_once.add(path)
+        includes = dict(self._includes(path))
+        for i, line in enumerate(source.lines):
+            if i in includes:
+                self._flatten_r(includes[i], out_lines, included_once)
+            else:
+                out_lines.append(line)
+
+    def dependents(self, path):
+        """
+        :param path: Any file in the graph, e.g. ``common_ps_fxc.h``
+        :return: Set of root files that include ``path``, directly or not
+        """
+        path = os.path.normpath(path)
+        found = set()
+        pending = [path]
+        while pending:
+            current = pending.pop()
+            for parent in self._included_by.get(current, ()):
+                if parent not in found:
+                    found.add(parent)
+                    pending.append(parent)
+        return found & self._roots
+
+    def affected(self, paths):
+        """
+        :param paths: Changed files
+        :return: Set of root files that need to be rebuilt
+        """
+        found = set()
+        for path in paths:
+            path = os.path.normpath(path)
+            if path in self._roots:
+                found.add(path)
+            found |= self.dependents(path)
+        return found
+
+    def invalidate(self, paths):
+        """
+        Forget everything read from ``paths`` so the next lookup reads them again.
+
+        :param paths: Changed, added or removed files
+        :return: Set of root files affected by the change
+        """
+        paths = [os.path.normpath(path) for path in paths]
+        affected = self.affected(paths)
+        for path in paths:
+            self._files.pop(path, None)
+            # Its includes may have changed too
+            for key in [key for key in self._resolved if key[1] == path]:
+                self._included_by.get(self._resolved.pop(key), set()).discard(path)
+        for root in affected:
+            self._flattened.pop(root, None)
+        return affected
+
+    def refresh(self, search_dirs):
+        """
+        Get ready for another build in the same process: forget every file changed on disk since it was
+        read, and every include that didn't resolve to a file, as it may exist now.
+
+        :param search_dirs: Include directories of the new build, everything resolved is dropped if
+            they're not the ones used so far
+        :return: Set of root files affected, see :meth:`invalidate`
+        """
+        if list(search_dirs) != self.search_dirs:
+            self.search_dirs = list(search_dirs)
+            self._resolved.clear()
+            self._included_by.clear()
+            self._flattened.clear()
+        changed = [path for path, source in self._files.items() if file_state(path) != source.state]
+        changed += [key[1] for key, path in self._resolved.items() if not os.path.exists(path)]
+        return self.invalidate(changed)
+
+
+_shared_graph = None
+
+
+def get_graph():
+    """The include graph shared by everything in this process."""
+    global _shared_graph
+    if _shared_graph is None:
+        _shared_graph = IncludeGraph()
+    return _shared_graph
@@ -0,0 +1,239 @@
+"""
+Checkpoints a native build, so one that crashed or was stopped can carry on where it left off.
+
+Every static combo is written to the journal once all of its live dynamic combos have compiled. A
+shader's static combos are split into shards of about :data:`SHARD_COMBOS` combos, each its own file
+starting with a key of everything that goes into the shader: its flattened source, combos, SKIPs and
+the compiler. Resuming reloads every shard whose key still matches and only compiles what's missing;
+a shard that was cut off halfway through a write loses just the static combo it was writing.
+
+File layout, big endian: the magic, key length and key, then for each static combo its index and
+record count followed by ``(dynamic index, size, bytecode)`` records.
+"""
+import hashlib
+import os
+import shutil
+import struct
+from collections import Counter
+
+from . import fxc_file
+from .scheduler import source_digest
+from .skip_eval import load_numpy
+
+MAGIC = b"SCJ1"
+# Combos per shard, a shard covers as many whole static combos as fit
+SHARD_COMBOS = 1 << 16
+
+_header = struct.Struct("!4sI")
+_block = struct.Struct("!II")
+_record = struct.Struct("!II")
+
+
+def shader_key(shader, version):
+    """
+    :param version: Identifies the compiler, see :func:`compiler_version`
+    :return: Hash of everything that goes into compiling ``shader``
+    """
+    key = hashlib.sha1()
+    for part in (version, source_digest(shader), shader.file_list_code, repr(shader.skips),
+                 repr(sorted(shader.static_defs.items())), str(shader.centroid_mask)):
+        key.update(part.encode())
+        key.update(b"\0")
+    return key.hexdigest()
+
+
+def live_per_static_combo(evaluator, num_dynamic):
+    """:return: Dict of static combo index to its number of live combos, static combos with none are left out"""
+    numpy = load_numpy()
+    counts = Counter()
+    for batch in evaluator.live_indices():
+        if numpy is not None:
+            static_ids, batch_counts = numpy.unique(batch // num_dynamic, return_counts=True)
+            counts.update(dict(zip(static_ids.tolist(), batch_counts.tolist())))
+        else:
+            counts.update(index // num_dynamic for index in batch)
+    return counts
+
+
+class _ShaderJournal:
+    """The shards of one shader."""
+
+    def __init__(self, journal_dir, shader_name, key, num_dynamic, expected):
+        self.journal_dir = journal_dir
+        self.shader_name = shader_name
+        self.key = key.encode()
+        self.num_dynamic = num_dynamic
+        self.static_per_shard = max(1, SHARD_COMBOS // num_dynamic)
+        # static combo index -> live combos, and the ones compiled so far
+        self.expected = expected
+        self.pending = {}
+        self.files = {}
+        self.checkpointed = 0
+
+    def shard_path(self, shard):
+        return os.path.join(self.journal_dir, "{}.{}.journal".format(self.shader_name, shard))
+
+    def shard_paths(self):
+        """:return: Dict of shard number to path, for every shard on disk"""
+        prefix = self.shader_name + "."
+        paths = {}
+        for name in os.listdir(self.journal_dir):
+            shard = name[len(prefix):-len(".journal")]
+            if name.startswith(prefix) and name.endswith(".journal") and shard.isdigit():
+                paths[int(shard)] = os.path.join(self.journal_dir, name)
+        return paths
+
+    def load(self):
+        """
+        Read back every shard that's still valid, deleting the rest.
+
+        :return: ``(dict of combo index to bytecode, whether any shard was stale)``
+        """
+        combos = {}
+        stale = False
+        for shard, path in self.shard_paths().items():
+            with open(path, "rb") as shard_file:
+                data = shard_file.read()
+            good_end, shard_combos = self._parse(data, shard)
+            if good_end == 0:
+                stale = True
+                os.remove(path)
+                continue
+            if good_end < len(data):
+                # Cut off while writing, drop the partial static combo
+                with open(path, "r+b") as shard_file:
+                    shard_file.truncate(good_end)
+            combos.update(shard_combos)
+        return combos, stale
+
+    def _parse(self, data, shard):
+        """:return: ``(end of the last complete static combo, combos)``, 0 if the shard doesn't match"""
+        try:
+            magic, key_size = _header.unpack_from(data)
+        except struct.error:
+            return 0, {}
+        offset = _header.size + key_size
+        if magic != MAGIC or data[_header.size:offset] != self.key:
+            return 0, {}
+        combos = {}
+        while offset < len(data):
+            try:
+                static_id, count = _block.unpack_from(data, offset)
+                pos = offset + _block.size
+                block = {}
+                for _ in range(count):
+                    dynamic_index, size = _record.unpack_from(data, pos)
+                    pos += _record.size
+                    if pos + size > len(data):
+                        raise struct.error("Truncated record")
+                    block[static_id * self.num_dynamic + dynamic_index] = data[pos:pos + size]
+                    pos += size
+            except struct.error:
+                break
+            if static_id // self.static_per_shard != shard or count != self.expected.get(static_id):
+                break
+            combos.update(block)
+            offset = pos
+        return offset, combos
+
+    def add(self, index, bytecode):
+        static_id, dynamic_index = divmod(index, self.num_dynamic)
+        records = self.pending.setdefault(static_id, [])
+        records.append((dynamic_index, bytecode))
+        if len(records) == self.expected.get(static_id):
+            self._write(static_id, self.pending.pop(static_id))
+
+    def _write(self, static_id, records):
+        shard = static_id // self.static_per_shard
+        shard_file = self.files.get(shard)
+        if shard_file is None:
+            path = self.shard_path(shard)
+            new = not os.path.isfile(path)
+            shard_file = self.files[shard] = open(path, "ab")
+            if new:
+                shard_file.write(_header.pack(MAGIC, len(self.key)) + self.key)
+        out = [_block.pack(static_id, len(records))]
+        for dynamic_index, bytecode in sorted(records, key=lambda record: record[0]):
+            out.append(_record.pack(dynamic_index, len(bytecode)))
+            out.append(bytecode)
+        shard_file.write(b"".join(out))
+        # Enough to survive the build being killed, not the machine losing power
+        shard_file.flush()
+        self.checkpointed += 1
+
+    def close(self):
+        for shard_file in self.files.values():
+            shard_file.close()
+        self.files.clear()
+
+    def remove(self):
+        self.close()
+        for path in self.shard_paths().values():
+            os.remove(path)
+
+
+class BuildJournal:
+    """The checkpoints of every shader in a build, see the module docs."""
+
+    def __init__(self, journal_dir, version, resume=False):
+        """
+        :param journal_dir: Directory for the shard files
+        :param version: Identifies the compiler, see :func:`compiler_version`
+        :param resume: Keep what an earlier build checkpointed, otherwise the journal starts empty
+        """
+        self.journal_dir = journal_dir
+        self.version = version
+        self.resume = resume
+        self.shaders = {}
+        if not resume:
+            shutil.rmtree(journal_dir, ignore_errors=True)
+        os.makedirs(journal_dir, exist_ok=True)
+
+    def open(self, shader, evaluator):
+        """
+        Start journaling a shader.
+
+        :return: Dict of combo index to bytecode already compiled by an earlier build, with ``resume``
+        """
+        num_dynamic = fxc_file.num_dynamic_combos(shader.dynamic_combos)
+        expected = live_per_static_combo(evaluator, num_dynamic)
+        journal = _ShaderJournal(self.journal_dir, shader.shader_name, shader_key(shader, self.version),
+                                 num_dynamic, expected)
+        self.shaders[shader.shader_name] = journal
+        if not self.resume:
+            return {}
+        combos, stale = journal.load()
+        if stale:
+            print("{}: changed since the interrupted build, its old checkpoints were dropped".format(
+                shader.shader_name))
+        if combos:
+            print("{}: resuming, {} of {} static combos already compiled".format(
+                shader.shader_name, len({index // num_dynamic for index in combos}), len(expected)))
+        return combos
+
+    def record(self, result):
+        """Add a compiled combo, and any it stands in for, checkpointing static combos as they complete."""
+        journal = self.shaders.get(result.job.shader_name)
+        if journal is None or not result.ok:
+            return
+        journal.add(result.job.combo_index, result.bytecode)
+        for index in result.job.aliases:
+            journal.add(index, result.bytecode)
+
+    def recorder(self, on_result=None):
+        """:return: An ``on_result`` callback that records every result, then calls ``on_result``"""
+        def record_result(result, shader_result):
+            self.record(result)
+            if on_result is not None:
+                on_result(result, shader_result)
+        return record_result
+
+    def finish(self, shader_name):
+        """Forget a shader once its ``.vcs`` has been written."""
+        journal = self.shaders.pop(shader_name, None)
+        if journal is not None:
+            journal.remove()
+
+    def close(self):
+        for journal in self.shaders.values():
+            journal.close()
@@ -0,0 +1,102 @@
+"""Runs ``generate`` for a whole shader list, optionally across a process pool."""
+from concurrent.futures import ProcessPoolExecutor
+
+from . import fxc_file
+from . import trace
+from .include_graph import get_graph
+
+_manifest = None
+_options = None
+_dynamic = False
+_rebuild = False
+
+
+def _init_worker(manifest, options, dynamic, rebuild, search_dirs, tracing=False):
+    global _manifest, _options, _dynamic, _rebuild
+    # Workers started with spawn don't inherit the parent's include graph
+    get_graph().search_dirs = list(search_dirs)
+    _manifest = manifest
+    _options = options
+    _dynamic = dynamic
+    _rebuild = rebuild
+    if tracing:
+        trace.enable()
+
+
+def _generate_shader(shader):
+    """
+    Walk a shader's dependencies, check it against the manifest and generate its output if it's stale.
+
+    :return: ``(shader, key, stale, trace events)``
+    """
+    with trace.span("dependencies", shader=shader.shader_name):
+        key = _manifest.shader_key(shader, dict(shader.build_options, **_options))
+    if not _rebuild and _manifest.is_current(shader, key, _dynamic):
+        return shader, key, False, trace.take_events()
+    with trace.span("generate", shader=shader.shader_name):
+        shader.generate(_dynamic)
+    return shader, key, True, trace.take_events()
+
+
+def _generate_shader_in_worker(shader):
+    """:return: ``(result of _generate_shader, the shader's include graph edges)``"""
+    result = _generate_shader(shader)
+    return result, get_graph().edges(shader.file_path + shader.file_name)
+
+
+def prep_shaders(shader_list, manifest, options, dynamic, rebuild=False, jobs=1, work_dir=""):
+    """
+    Prep every stale shader in ``shader_list``.
+
+    Parsing and text generation happen on ``jobs`` worker processes, the ``.inc`` files and
+    ``filelist.txt`` sections are then written out here in shader list order, so the output is the
+    same no matter how many jobs are used.
+
+    :param shader_list: List of :class:`BaseShader`, updated in place with the prepped shaders
+    :param manifest: :class:`BuildManifest` to check and update
+    :param options: Build flags passed to :meth:`BuildManifest.shader_key`, on top of each shader's own
+    :param dynamic: Only generate ``.inc`` files
+    :param rebuild: Ignore the manifest
+    :param jobs: Number of worker processes, 1 preps everything in this process
+    :param work_dir: Project directory the output goes in, the current one by default
+    :return: List of shaders that were prepped
+    """
+    if jobs > 1 and len(shader_list) > 1:
+        chunk_size = max(1, len(shader_list) // (jobs * 4))
+        with ProcessPoolExecutor(jobs, initializer=_init_worker,
+                                 initargs=(manifest, options, dynamic, rebuild, get_graph().search_dirs,
+                                           trace.enabled())) as executor:
+            results = []
+            for result, edges in executor.map(_generate_shader_in_worker, shader_list, chunksize=chunk_size):
+                # The workers walked the includes, this process needs them too to map changes back to shaders
+                shader = result[0]
+                get_graph().add_edges(shader.file_path + shader.file_name, edges)
+                results.append(result)
+    else:
+        _init_worker(manifest, options, dynamic, rebuild, get_graph().search_dirs)
+        results = [_generate_shader(shader) for shader in shader_list]
+
+    prepped = []
+    for i, (shader, key, stale, events) in enumerate(results):
+        shader_list[i] = shader
+        trace.add_events(events)
+        if stale:
+            with trace.span("write", shader=shader.shader_name):
+                shader.write(dynamic, work_dir)
+            manifest.update(shader, key, dynamic)
+            prepped.append(shader)
+            if trace.enabled():
+                _record_stats(shader)
+    return prepped
+
+
+def _record_stats(shader):
+    source = "".join(fxc_file.read_input_file(shader.file_path + shader.file_name))
+    stats = {
+        'includes': len(shader.dependencies),
+        'source_bytes': len(source.encode()),
+        'bytes_written': (len(shader.header_code) if shader.inc_updated else 0) + len(shader.file_list_code),
+    }
+    if shader.type == "fxc":
+        stats['combos'] = fxc_file.num_combos(shader.static_combos, shader.dynamic_combos)
+    trace.record(shader.shader_name, **stats)
@@ -0,0 +1,162 @@
+"""
+A small C preprocessor, just enough to tell which combos of a shader produce the same code.
+
+It evaluates ``#define``/``#undef``/``#if``/``#ifdef``/``#ifndef``/``#elif``/``#else``/``#endif``
+for a set of defines and hashes what's left. Macros aren't expanded in the code itself; instead the
+definition of every macro a line uses is hashed along with it, so two combos only hash the same if
+they really preprocess to the same code.
+"""
+import hashlib
+import re
+
+from . import skip_eval
+
+_identifier_re = re.compile(r"[A-Za-z_]\w*")
+_directive_re = re.compile(r"^\s*#\s*(\w+)\s*(.*)$")
+_define_re = re.compile(r"([A-Za-z_]\w*)(\([^)]*\))?\s*(.*)$")
+_defined_re = re.compile(r"\bdefined\s*(?:\(\s*([A-Za-z_]\w*)\s*\)|([A-Za-z_]\w*))")
+# A preprocessing number or an identifier, so the digits and suffixes of ``0x1Fu`` aren't taken for identifiers
+_token_re = re.compile(r"(\.?\d(?:[eE][+-]|[\w.])*)|([A-Za-z_]\w*)")
+_integer_re = re.compile(r"(?:0[xX]([0-9a-fA-F]+)|(0[0-7]*)|([1-9]\d*))(?:[uU](?:ll|LL|[lL])?|(?:ll|LL|[lL])[uU]?)?$")
+_comment_re = re.compile(r"//[^\n]*|/\*.*?\*/", re.DOTALL)
+
+
+def _strip_comments(source):
+    """Remove comments, keeping the line count the same."""
+    return _comment_re.sub(lambda match: "\n" * match.group(0).count("\n"), source)
+
+
+def parse_integer(literal):
+    """
+    :param literal: A C integer literal, e.g. ``0x1F``, ``017`` or ``10UL``
+    :return: Its value
+    :raise SkipSyntaxError: If ``literal`` isn't one, e.g. ``08`` or ``1.5``
+    """
+    match = _integer_re.match(literal)
+    if match is None:
+        raise skip_eval.SkipSyntaxError("Not an integer in #if: " + literal)
+    hex_digits, octal, decimal = match.groups()
+    if hex_digits is not None:
+        return int(hex_digits, 16)
+    if octal is not None:
+        return int(octal, 8)
+    return int(decimal)
+
+
+class _Line:
+    __slots__ = ('directive', 'argument', 'text', 'identifiers')
+
+    def __init__(self, directive, argument, text):
+        self.directive = directive
+        self.argument = argument
+        self.text = text
+        self.identifiers = frozenset(_identifier_re.findall(text if directive is None else argument))
+
+
+class Preprocessor:
+    """
+    A source file split into directives and code once, then preprocessed for any number of define sets.
+    """
+
+    def __init__(self, source):
+        """
+        :param source: Lines with every ``#include`` inlined, see :func:`fxc_file.read_input_file`
+        """
+        text = _strip_comments("".join(source)).replace("\\\n", "")
+        self.lines = []
+        self.identifiers = set()
+        for line in text.split("\n"):
+            stripped = " ".join(line.split())
+            if stripped == "":
+                continue
+            match = _directive_re.match(stripped)
+            if match:
+                parsed = _Line(match.group(1), match.group(2), stripped)
+            else:
+                parsed = _Line(None, "", stripped)
+            self.identifiers |= parsed.identifiers
+            self.lines.append(parsed)
+        self._expressions = {}
+
+    def _evaluate(self, expression, macros):
+        expression = _defined_re.sub(lambda m: "1" if (m.group(1) or m.group(2)) in macros else "0", expression)
+        expression = self._expand(expression, macros, set())
+        # Identifiers left over aren't macros and count as 0, numbers are rewritten in decimal for skip_eval
+        expression = _token_re.sub(lambda m: "0" if m.group(1) is None else str(parse_integer(m.group(1))),
+                                   expression)
+        tree = self._expressions.get(expression)
+        if tree is None:
+            tree = self._expressions[expression] = skip_eval.parse_skip(expression)
+        return skip_eval.evaluate(tree, {}) != 0
+
+    def _expand(self, text, macros, expanding):
+        def replace(match):
+            name = match.group(2)
+            definition = macros.get(name) if name is not None else None
+            if definition is None or definition[0] is not None or name in expanding:
+                return match.group(0)
+            return "(" + self._expand(definition[1], macros, expanding | {name}) + ")"
+        return _token_re.sub(replace, text)
+
+    def _used_macros(self, identifiers, macros, found):
+        for name in identifiers:
+            if name in macros and name not in found:
+                found[name] = macros[name]
+                self._used_macros(_identifier_re.findall(macros[name][1]), macros, found)
+
+    def digest(self, defines):
+        """
+        Preprocess with a set of defines and hash the result.
+
+        :param defines: List of ``(name, value)``, as passed on the command line
+        :return: Hex digest
+        """
+        macros = {str(name): (None, str(value)) for name, value in defines}
+        # One entry per #if level: (a branch has been taken, the enclosing block is active)
+        stack = []
+        active = True
+        out = hashlib.sha1()
+        for line in self.lines:
+            directive = line.directive
+            if directive in ("if", "ifdef", "ifndef"):
+                if not active:
+                    stack.append((True, False))
+                    continue
+                if directive == "if":
+                    taken = self._evaluate(line.argument, macros)
+                else:
+                    taken = (line.argument.split()[0] in macros) == (directive == "ifdef")
+                stack.append((taken, True))
+                active = taken
+            elif directive == "elif":
+                was_taken, parent = stack.pop()
+                active = parent and not was_taken and self._evaluate(line.argument, macros)
+                stack.append((was_taken or active, parent))
+            elif directive == "else":
+                was_taken, parent = stack.pop()
+                active = parent and not was_taken
+                stack.append((True, parent))
+            elif directive == "endif":
+                if stack:
+                    active = stack.pop()[1]
+            elif not active:
+                continue
+            elif directive == "define":
+                match = _define_re.match(line.argument)
+                if match:
+                    macros[match.group(1)] = (match.group(2), match.group(3))
+                out.update(line.text.encode())
+                out.update(b"\n")
+            elif directive == "undef":
+                macros.pop(line.argument.strip(), None)
+                out.update(line.text.encode())
+                out.update(b"\n")
+            else:
+                # Code, or a directive like #pragma or #error that ends up in the output as is
+                used = {}
+                self._used_macros(line.identifiers, macros, used)
+                out.update(line.text.encode())
+                for name in sorted(used):
+                    out.update("\0{}{}={}".format(name, used[name][0] or "", used[name][1]).encode())
+                out.update(b"\n")
+        return out.hexdigest()
@@ -0,0 +1,316 @@
+"""
+Shares compiled combos between machines over HTTP, so a fresh checkout fetches its shaders instead of
+compiling them.
+
+Combos are stored under their :func:`combo_key`, the hash of the flattened source, defines, profile
+and compiler, so machines share hits as long as they run the same compiler command. Lookups and
+uploads are batched, many combos to a request. A server that's down, or slower than the timeout, is
+left alone for a while and everything is compiled locally in the meantime.
+
+Protocol, every batch body is a JSON header followed by the concatenated bytecode, each prefixed by
+its length as in :mod:`distributed`:
+
+* ``GET /v1/combo/KEY``, ``PUT /v1/combo/KEY``: one combo's bytecode
+* ``POST /v1/get``: header ``{"keys": [...]}``, answered with ``{"sizes": [...]}``, -1 for a miss
+* ``POST /v1/put``: header ``{"keys": [...], "sizes": [...]}``
+
+The server listens on this machine only unless it's given a host. Serving anything wider needs a
+shared token, which uploads have to send in a ``X-Cache-Token`` header; lookups are left open.
+"""
+import hmac
+import json
+import re
+import struct
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from .combo_cache import ComboCache
+from .distributed import is_loopback
+
+DEFAULT_PORT = 27016
+# Combos looked up or uploaded per request
+BATCH_SIZE = 256
+# Seconds a request may take before the server counts as down
+DEFAULT_TIMEOUT = 5.0
+# Seconds to compile locally after the server failed, before trying it again
+RETRY_INTERVAL = 60.0
+# Largest request body the server accepts
+MAX_BODY = 256 * 1024 * 1024
+
+# Header uploads carry the server's token in
+TOKEN_HEADER = "X-Cache-Token"
+
+_frame = struct.Struct("!II")
+_key_pattern = re.compile(r"^[0-9a-f]{64}$")
+
+
+def pack_batch(header, payloads):
+    """:return: ``header`` and ``payloads`` as one request or response body"""
+    data = json.dumps(header).encode()
+    payload = b"".join(payloads)
+    return _frame.pack(len(data), len(payload)) + data + payload
+
+
+def unpack_batch(body, sizes_field="sizes"):
+    """
+    :return: ``(header, payloads)``, a payload is ``None`` where its size is -1
+    """
+    header_size, payload_size = _frame.unpack_from(body)
+    if _frame.size + header_size + payload_size != len(body):
+        raise ValueError("Truncated batch")
+    header = json.loads(body[_frame.size:_frame.size + header_size].decode())
+    payloads = []
+    offset = _frame.size + header_size
+    for size in header.get(sizes_field, []):
+        if size < 0:
+            payloads.append(None)
+            continue
+        payloads.append(body[offset:offset + size])
+        offset += size
+    if offset != len(body):
+        raise ValueError("Batch sizes don't match its payload")
+    return header, payloads
+
+
+class _CacheHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def cache(self):
+        return self.server.cache
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=b"", content_type="application/octet-stream"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        size = int(self.headers.get("Content-Length", 0))
+        if size > MAX_BODY:
+            raise ValueError("Request too large")
+        return self.rfile.read(size)
+
+    def _authorized(self):
+        """Check an upload carries the server's token, replying 403 if it doesn't, before its body is read."""
+        token = self.server.token
+        if token is None or hmac.compare_digest(self.headers.get(TOKEN_HEADER, "").encode(), token.encode()):
+            return True
+        # The body is left unread, so the connection can't be reused
+        self.close_connection = True
+        self._reply(403)
+        return False
+
+    def _combo_key(self):
+        """:return: The key in a ``/v1/combo/KEY`` path, or ``None``"""
+        prefix = "/v1/combo/"
+        key = self.path[len(prefix):] if self.path.startswith(prefix) else ""
+        return key if _key_pattern.match(key) else None
+
+    def do_GET(self):
+        key = self._combo_key()
+        bytecode = self.cache.get(key) if key is not None else None
+        if bytecode is None:
+            self._reply(404 if key is not None else 400)
+        else:
+            self._reply(200, bytecode)
+
+    def do_PUT(self):
+        if not self._authorized():
+            return
+        key = self._combo_key()
+        try:
+            body = self._read_body()
+        except ValueError:
+            self._reply(413)
+            return
+        if key is None or not body:
+            self._reply(400)
+            return
+        self.cache.put(key, body)
+        self._reply(204)
+
+    def do_POST(self):
+        if self.path == "/v1/put" and not self._authorized():
+            return
+        try:
+            header, payloads = unpack_batch(self._read_body())
+            keys = header['keys']
+            if not all(isinstance(key, str) and _key_pattern.match(key) for key in keys):
+                raise ValueError("Bad combo key")
+        except (ValueError, KeyError, TypeError, struct.error):
+            self._reply(400)
+            return
+        if self.path == "/v1/get":
+            found = [self.cache.get(key) for key in keys]
+            self._reply(200, pack_batch({'sizes': [-1 if data is None else len(data) for data in found]},
+                                        [data for data in found if data is not None]))
+        elif self.path == "/v1/put":
+            if len(payloads) != len(keys):
+                self._reply(400)
+                return
+            for key, bytecode in zip(keys, payloads):
+                if bytecode:
+                    self.cache.put(key, bytecode)
+            self._reply(204)
+        else:
+            self._reply(404)
+
+
+class RemoteCacheServer(ThreadingHTTPServer):
+    """Serves a :class:`ComboCache` directory to :class:`RemoteCache` clients."""
+
+    daemon_threads = True
+
+    def __init__(self, cache_dir, max_size, port=DEFAULT_PORT, host="127.0.0.1", token=None):
+        """
+        :param cache_dir: Directory for the cache, created if needed
+        :param max_size: Size cap in bytes
+        :param port: Port to listen on, 0 picks a free one, see :attr:`port`
+        :param host: Interface to listen on, this machine only by default, ``""`` for all of them
+        :param token: Shared secret uploads must send, required unless ``host`` is a loopback address
+        """
+        if token is None and not is_loopback(host):
+            raise ValueError("Serving the combo cache beyond this machine needs a token")
+        self.token = token
+        self.cache = ComboCache(cache_dir, max_size)
+        super().__init__((host, port), _CacheHandler)
+        self.port = self.server_address[1]
+
+
+class RemoteCache:
+    """
+    Client for a :class:`RemoteCacheServer`.
+
+    Every error is swallowed: a lookup that fails is a miss, an upload that fails is dropped, and the
+    server isn't asked again for ``retry_interval`` seconds.
+    """
+
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT, batch_size=BATCH_SIZE, retry_interval=RETRY_INTERVAL,
+                 token=None):
+        """
+        :param url: Server address, e.g. ``http://buildcache:27016``
+        :param timeout: Seconds a request may take
+        :param batch_size: Combos looked up or uploaded per request
+        :param retry_interval: Seconds to leave the server alone after it failed
+        :param token: The server's token, without it uploads are refused
+        """
+        self.token = token
+        if "://" not in url:
+            url = "http://" + url
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.batch_size = max(1, batch_size)
+        self.retry_interval = retry_interval
+        self.hits = 0
+        self.misses = 0
+        self.uploaded = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self._down_until = 0.0
+        # The server turned down an upload, so nothing more is sent
+        self.refused = False
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return time.monotonic() >= self._down_until
+
+    def _post(self, path, body):
+        """:return: Response body, or ``None`` if the server is down, slow or refused"""
+        if not self.available:
+            return None
+        headers = {"Content-Type": "application/octet-stream"}
+        if self.token is not None:
+            headers[TOKEN_HEADER] = self.token
+        request = urllib.request.Request(self.url + path, body, headers)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.read()
+        except urllib.error.HTTPError as error:
+            if error.code != 403:
+                self._mark_down(error)
+                return None
+            with self._lock:
+                self.errors += 1
+                if not self.refused:
+                    # Lookups still work, only uploads stop
+                    print("Remote cache {} refused an upload, check -cache_token".format(self.url))
+                self.refused = True
+            return None
+        except (OSError, ValueError) as error:
+            self._mark_down(error)
+            return None
+        finally:
+            with self._lock:
+                self.seconds += time.perf_counter() - start
+
+    def _mark_down(self, error):
+        """Leave the server alone for ``retry_interval`` seconds."""
+        with self._lock:
+            self.errors += 1
+            if self.available:
+                print("Remote cache {} unavailable ({}), compiling locally for {:.0f}s".format(
+                    self.url, getattr(error, 'reason', error), self.retry_interval))
+            self._down_until = time.monotonic() + self.retry_interval
+
+    def get_many(self, keys):
+        """
+        Look up combos, one request per :attr:`batch_size` keys.
+
+        :return: Dict of key to bytecode for every hit
+        """
+        found = {}
+        for start in range(0, len(keys), self.batch_size):
+            batch = keys[start:start + self.batch_size]
+            body = self._post("/v1/get", pack_batch({'keys': batch}, []))
+            try:
+                _, payloads = unpack_batch(body) if body is not None else (None, [None] * len(batch))
+            except (ValueError, struct.error):
+                payloads = [None] * len(batch)
+            found.update((key, bytecode) for key, bytecode in zip(batch, payloads) if bytecode is not None)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, key, bytecode):
+        """Queue a combo for upload, sending the queue once it holds a full batch."""
+        with self._lock:
+            if self.refused:
+                return
+            self._pending.append((key, bytecode))
+            if len(self._pending) < self.batch_size:
+                return
+            batch, self._pending = self._pending, []
+        self._upload(batch)
+
+    def flush(self):
+        """Upload every queued combo."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._upload(batch)
+
+    def _upload(self, batch):
+        keys = [key for key, _ in batch]
+        body = pack_batch({'keys': keys, 'sizes': [len(bytecode) for _, bytecode in batch]},
+                          [bytecode for _, bytecode in batch])
+        if self._post("/v1/put", body) is not None:
+            with self._lock:
+                self.uploaded += len(batch)
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        return "Remote cache: {} hits, {} misses ({:.0%} hit rate), {} uploaded, {} errors, {:.1f}s waiting".format(
+            self.hits, self.misses, self.hits / lookups if lookups else 0, self.uploaded, self.errors, self.seconds)
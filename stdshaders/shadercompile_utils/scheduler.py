@@ -0,0 +1,381 @@
+"""Compiles shader combos with any command line compiler, without shadercompile.exe."""
+import hashlib
+import os
+import shlex
+import subprocess
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+from . import fxc_file
+from .preprocessor import Preprocessor
+from .skip_eval import SkipEvaluator
+from .skip_eval import SkipSyntaxError
+
+# fxc style command line, {defines} expands to one /DNAME=VALUE argument per define
+DEFAULT_COMMAND = "fxc.exe /nologo /T{profile} /E{entry} {defines} /Fo{output} {source}"
+
+
+class CompileJob:
+    """A single combo of a single shader."""
+
+    def __init__(self, shader_name, file_name, profile, combo_index, defines, cost=0, source_digest=""):
+        """
+        :param shader_name: Output shader name
+        :param file_name: Source file, relative to the compile directory
+        :param profile: Target profile, e.g. ``ps_2_0``
+        :param combo_index: Index of the combo, as returned by ``GetIndex``
+        :param defines: List of ``(name, value)`` pairs
+        :param cost: Estimated cost, higher is scheduled sooner
+        :param source_digest: Hash of the source with every ``#include`` inlined
+        """
+        self.shader_name = shader_name
+        self.file_name = file_name
+        self.profile = profile
+        self.combo_index = combo_index
+        self.defines = defines
+        self.cost = cost
+        self.source_digest = source_digest
+        # Other combo indices that preprocess to the same code, and so share this job's bytecode
+        self.aliases = []
+
+    def __str__(self):
+        return "{} combo {}".format(self.shader_name, self.combo_index)
+
+
+class CompileResult:
+    """The outcome of a :class:`CompileJob`."""
+
+    def __init__(self, job, bytecode, output, returncode, seconds, cached=False):
+        self.job = job
+        self.bytecode = bytecode
+        self.output = output
+        self.returncode = returncode
+        self.seconds = seconds
+        self.cached = cached
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and self.bytecode is not None
+
+
+def split_command(command):
+    """
+    Split a command line into arguments the way the platform's shell would.
+
+    On Windows quotes are kept by :func:`shlex.split`, they're stripped here so a quoted path with spaces
+    in it is passed on as is.
+    """
+    if os.name != 'nt':
+        return shlex.split(command)
+    return [argument[1:-1] if len(argument) > 1 and argument[0] == argument[-1] == '"' else argument
+            for argument in shlex.split(command, posix=False)]
+
+
+def quote_argument(argument):
+    """:return: ``argument`` quoted for :func:`split_command` if it needs it"""
+    return subprocess.list2cmdline([argument]) if os.name == 'nt' else shlex.quote(argument)
+
+
+class CommandCompiler:
+    """
+    Runs a command for each combo.
+
+    The command is a template with ``{profile}``, ``{entry}``, ``{defines}``, ``{output}`` and
+    ``{source}`` fields, e.g. ``wine fxc.exe /T{profile} {defines} /Fo{output} {source}``.
+    """
+
+    def __init__(self, command=DEFAULT_COMMAND, work_dir=".", define_format="/D{name}={value}"):
+        """
+        :param command: Command template
+        :param work_dir: Directory the compiler runs in, which holds the sources
+        :param define_format: How a single define is passed to the compiler
+        """
+        self.command = split_command(command)
+        self.work_dir = work_dir
+        self.define_format = define_format
+
+    def _arguments(self, job, output):
+        fields = {
+            'profile': job.profile,
+            'entry': "main",
+            'output': output,
+            'source': job.file_name,
+        }
+        arguments = []
+        for argument in self.command:
+            if argument == "{defines}":
+                arguments.extend(self.define_format.format(name=name, value=value) for name, value in job.defines)
+            else:
+                arguments.append(argument.format(**fields))
+        return arguments
+
+    def compile(self, job):
+        """
+        :return: :class:`CompileResult`
+        """
+        handle, output = tempfile.mkstemp(suffix=".o", prefix="combo_", dir=self.work_dir)
+        os.close(handle)
+        start = time.perf_counter()
+        try:
+            process = subprocess.run(self._arguments(job, output), cwd=self.work_dir,
+                                     stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            bytecode = None
+            if process.returncode == 0 and os.path.getsize(output) > 0:
+                with open(output, "rb") as bytecode_file:
+                    bytecode = bytecode_file.read()
+            log = process.stdout.decode(errors="replace")
+            returncode = process.returncode
+        except OSError as error:
+            bytecode = None
+            log = str(error)
+            returncode = -1
+        finally:
+            os.remove(output)
+        return CompileResult(job, bytecode, log, returncode, time.perf_counter() - start)
+
+
+class ShaderCompileResult:
+    """Every combo compiled for one shader."""
+
+    def __init__(self, shader_name, total_combos):
+        self.shader_name = shader_name
+        self.total_combos = total_combos
+        self.expected = 0
+        self.completed = 0
+        self.compiled = 0
+        self.cached = 0
+        # Combos an interrupted build had already compiled
+        self.resumed = 0
+        self.bytecode = {}
+        self.failures = []
+        self.seconds = 0.0
+
+    @property
+    def done(self):
+        return self.completed == self.expected
+
+    @property
+    def dedup_ratio(self):
+        """Combos per compiler run"""
+        return (self.completed - self.resumed) / self.compiled if self.compiled else 1.0
+
+
+def combo_defines(shader, evaluator, combo_index):
+    """
+    All the defines a single combo is compiled with, in the same order as filelist.txt.
+
+    :param shader: A prepped :class:`DX9Shader`
+    :param evaluator: The shader's :class:`SkipEvaluator`
+    :param combo_index: Combo to compile
+    :return: List of ``(name, value)``
+    """
+    profile = fxc_file.get_shader_type(shader.shader_name)
+    num_dynamic = fxc_file.num_dynamic_combos(shader.dynamic_combos)
+    defines = [
+        ("TOTALSHADERCOMBOS", evaluator.total),
+        ("CENTROIDMASK", shader.centroid_mask),
+        ("NUMDYNAMICCOMBOS", num_dynamic),
+        ("FLAGS", "0x0"),
+        ("main", "main"),
+        ("SHADER_MODEL_" + profile.upper(), 1),
+    ]
+    values = evaluator.decode(combo_index)
+    for combo in shader.dynamic_combos + shader.static_combos:
+        defines.append((combo.name, values[combo.name]))
+    return defines
+
+
+def estimate_cost(shader):
+    """Rough cost of one combo of ``shader``, bigger sources take longer to compile."""
+    return len("".join(fxc_file.read_input_file(shader.file_path + shader.file_name)))
+
+
+def source_digest(shader):
+    """Hash of a shader's source with every ``#include`` inlined."""
+    source = "".join(fxc_file.read_input_file(shader.file_path + shader.file_name))
+    return hashlib.sha1(source.encode()).hexdigest()
+
+
+def group_combos(shader, evaluator, indices):
+    """
+    Group combos that preprocess to exactly the same code.
+
+    :param indices: Iterable of combo indices
+    :return: List of lists of combo indices, in the order each group was first seen
+    """
+    preprocessor = Preprocessor(fxc_file.read_input_file(shader.file_path + shader.file_name))
+    digests = {}
+    groups = {}
+    for index in indices:
+        defines = combo_defines(shader, evaluator, index)
+        # Defines the source never mentions can't change the result, don't preprocess again for them
+        key = tuple(value for name, value in defines if name in preprocessor.identifiers)
+        digest = digests.get(key)
+        if digest is None:
+            digest = digests[key] = preprocessor.digest(defines)
+        groups.setdefault(digest, []).append(index)
+    return list(groups.values())
+
+
+def shader_jobs(shader, evaluator, cost, indices=None, dedup=False):
+    """
+    Yield a :class:`CompileJob` for every live combo of a shader.
+
+    :param indices: Only these combo indices, all live combos if ``None``
+    :param dedup: Only yield one job for combos that preprocess to the same code, with the others as
+        its ``aliases``
+    """
+    profile = fxc_file.get_shader_type(shader.shader_name)
+    digest = source_digest(shader)
+    if indices is None:
+        indices = (int(index) for batch in evaluator.live_indices() for index in batch)
+    if dedup:
+        indices = list(indices)
+        try:
+            groups = group_combos(shader, evaluator, indices)
+        except (SkipSyntaxError, IndexError) as error:
+            print("{}: can't preprocess, compiling every combo ({})".format(shader.shader_name, error))
+            groups = [[index] for index in indices]
+    else:
+        groups = ([index] for index in indices)
+    for group in groups:
+        job = CompileJob(shader.shader_name, shader.file_name, profile, group[0],
+                         combo_defines(shader, evaluator, group[0]), cost, digest)
+        job.aliases = group[1:]
+        yield job
+
+
+class Scheduler:
+    """
+    Runs every combo of a list of shaders through a compiler backend on a pool of workers.
+
+    Shaders with the most expensive combos go first so the long jobs don't end up at the tail of the
+    build. Results are streamed back as they finish.
+    """
+
+    def __init__(self, backend, threads=1, dedup=False):
+        """
+        :param backend: Anything with a ``compile(job)`` method returning a :class:`CompileResult`, and
+            optionally a ``prefetch(jobs)`` generator that gets to see the jobs first
+        :param threads: Number of jobs to run at once
+        :param dedup: Compile combos that preprocess to the same code only once
+        """
+        self.backend = backend
+        self.threads = max(1, threads)
+        self.dedup = dedup
+
+    def plan(self, shader_list, cost_func=estimate_cost):
+        """
+        Order shaders longest first.
+
+        :return: List of ``(shader, evaluator, cost)``
+        """
+        planned = []
+        for shader in shader_list:
+            evaluator = SkipEvaluator(shader.static_combos, shader.dynamic_combos, shader.skips)
+            planned.append((shader, evaluator, cost_func(shader)))
+        planned.sort(key=lambda item: item[2], reverse=True)
+        return planned
+
+    def run(self, shader_list, on_result=None, cost_func=estimate_cost, journal=None):
+        """
+        Compile every live combo of every shader.
+
+        :param shader_list: Prepped :class:`DX9Shader` objects
+        :param on_result: Called with each :class:`CompileResult` and its :class:`ShaderCompileResult`
+            as soon as it's done
+        :param cost_func: Estimated per-combo cost of a shader
+        :param journal: :class:`BuildJournal` to checkpoint to, combos it already has aren't compiled again
+        :return: Dict of shader name to :class:`ShaderCompileResult`
+        """
+        results = {}
+        planned = self.plan(shader_list, cost_func)
+        for shader, evaluator, _ in planned:
+            shader_result = results[shader.shader_name] = ShaderCompileResult(shader.shader_name, evaluator.total)
+            shader_result.expected = evaluator.count_live()
+            if journal is not None:
+                shader_result.bytecode = journal.open(shader, evaluator)
+                shader_result.completed = shader_result.resumed = len(shader_result.bytecode)
+
+        def all_jobs():
+            for shader, evaluator, cost in planned:
+                done = results[shader.shader_name].bytecode
+                indices = None
+                if done:
+                    live = (int(index) for batch in evaluator.live_indices() for index in batch)
+                    indices = (index for index in live if index not in done)
+                yield from shader_jobs(shader, evaluator, cost, indices, dedup=self.dedup)
+
+        if journal is not None:
+            on_result = journal.recorder(on_result)
+        try:
+            self.run_jobs(all_jobs(), results, on_result)
+        finally:
+            if journal is not None:
+                journal.close()
+        return results
+
+    def run_jobs(self, jobs, results, on_result=None):
+        """
+        Compile an iterable of jobs, keeping only a few of them in flight at a time.
+
+        :param jobs: Iterable of :class:`CompileJob`
+        :param results: Dict of shader name to :class:`ShaderCompileResult`, filled in as jobs finish
+        :param on_result: Called with each :class:`CompileResult` and its :class:`ShaderCompileResult`
+        """
+        if hasattr(self.backend, "prefetch"):
+            jobs = self.backend.prefetch(jobs)
+        jobs = iter(jobs)
+        pending = set()
+        with ThreadPoolExecutor(self.threads) as executor:
+            while True:
+                while len(pending) < self.threads * 2:
+                    job = next(jobs, None)
+                    if job is None:
+                        break
+                    pending.add(executor.submit(self.backend.compile, job))
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    self.add_result(future.result(), results, on_result)
+
+    @staticmethod
+    def add_result(result, results, on_result=None):
+        """Add a finished job to its :class:`ShaderCompileResult`, and to any combos it stands in for."""
+        shader_result = results[result.job.shader_name]
+        shader_result.seconds += result.seconds
+        shader_result.compiled += 1
+        shader_result.cached += result.cached
+        shader_result.completed += 1 + len(result.job.aliases)
+        if result.ok:
+            shader_result.bytecode[result.job.combo_index] = result.bytecode
+            for index in result.job.aliases:
+                shader_result.bytecode[index] = result.bytecode
+        else:
+            shader_result.failures.append(result)
+        if on_result is not None:
+            on_result(result, shader_result)
+
+
+class ProgressPrinter:
+    """Prints failures as they happen and a line whenever a shader finishes."""
+
+    def __init__(self, num_shaders):
+        self.num_shaders = num_shaders
+        self.finished = 0
+
+    def __call__(self, result, shader_result):
+        if not result.ok:
+            defines = " ".join("{}={}".format(name, value) for name, value in result.job.defines)
+            print("FAILED: {}\n\t{}\n{}".format(result.job, defines, result.output.rstrip()))
+        if shader_result.done:
+            self.finished += 1
+            print("[{}/{}] {}: {} combos, {} compiled ({:.1f}x dedup), {} failed, {:.1f}s".format(
+                self.finished, self.num_shaders, shader_result.shader_name, shader_result.expected,
+                shader_result.compiled, shader_result.dedup_ratio, len(shader_result.failures),
+                shader_result.seconds))
+
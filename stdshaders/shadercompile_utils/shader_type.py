@@ -1,79 +1,124 @@
 import os.path
-import re
+import sys
 
+from . import amalgamate
 from . import fxc_file
+from .dead_combos import find_dead_combos
+from .file_utils import write_if_changed
+from .include_graph import get_graph
 
 
 class BaseShader:
     """
     The generic shader type, extended for .fxc, .vsh, and .psh shaders.
+
+    Big projects have thousands of these, so they're slotted and their names interned: every target
+    of a source file shares its file name and path strings.
     """
 
+    __slots__ = ('file_name', 'file_path', 'shader_name', 'type', '_dependencies', 'static_combos',
+                 'dynamic_combos', 'static_defs', 'skip_code', 'skips', 'centroid_mask', 'inc_file', 'compile_vcs',
+                 'header_code', 'file_list_code', 'inc_updated', 'amalgam_header', 'index_code', 'build_options',
+                 'collapse_dead', 'dead_combos')
+
     def __init__(self, file_name, shader_name, compile_vcs=True):
         """
         :param file_name: Source File name
         :param shader_name: Output shader name
         :param compile_vcs: Whether to actually compile shader
         """
-        self.file_name = os.path.basename(file_name)
-        self.file_path = os.path.dirname(file_name)
-        if self.file_path != "":
-            self.file_path += "/".replace("/", os.sep)
-        self.shader_name = os.path.basename(shader_name)
+        self.file_name = sys.intern(os.path.basename(file_name))
+        file_path = os.path.dirname(file_name)
+        if file_path != "":
+            file_path += "/".replace("/", os.sep)
+        self.file_path = sys.intern(file_path)
+        self.shader_name = sys.intern(os.path.basename(shader_name))
         self.type = ""
 
-        self.dependencies = []
-        self.get_dependencies()
+        self._dependencies = None
 
-        self.static_combos = []
-        self.dynamic_combos = []
+        # Replaced by generate, until then the empty tuples are shared by every shader
+        self.static_combos = ()
+        self.dynamic_combos = ()
         self.static_defs = {}
         self.skip_code = ""
-        self.skips = []
+        self.skips = ()
         self.centroid_mask = 0
 
         self.inc_file = False
         self.compile_vcs = compile_vcs
 
+        self.header_code = ""
+        self.file_list_code = ""
+        self.inc_updated = False
+        # Shared header the index classes go in instead of the .inc, see amalgamate.assign_headers
+        self.amalgam_header = None
+        self.index_code = ""
+        # Flags of the shader list this came from, e.g. force30, part of its build manifest key
+        self.build_options = {}
+        # Whether generate takes combos that never change the code out of the combo space, and which
+        # ones it took out, see dead_combos.find_dead_combos
+        self.collapse_dead = False
+        self.dead_combos = {}
+
     def __str__(self):
         return "{} ({})".format(self.shader_name, self.file_name)
 
-    def _get_dependencies_r(self, path):
-        with open(path) as source_file:
-            for line in source_file:
-                match = re.match(r"^\s*#include\s+\"(.*)\"", line)
-                if match:
-                    if match.group(1) not in self.dependencies:
-                        dep_path = match.group(1)
-                        if os.path.exists(self.file_path + dep_path):
-                            dep_path = self.file_path + dep_path
-                        self.dependencies.append(dep_path)
-                        self._get_dependencies_r(dep_path)
+    @property
+    def dependencies(self):
+        """Every file included by the source file, found on first use."""
+        if self._dependencies is None:
+            self.get_dependencies()
+        return self._dependencies
+
+    def invalidate(self):
+        """Forget anything read from the source files, after they've changed."""
+        self._dependencies = None
 
     def get_dependencies(self):
         """Find all ``#include`` statements in the source file."""
-        self._get_dependencies_r(self.file_path + self.file_name)
-        pass
+        self._dependencies = get_graph().dependencies(self.file_path + self.file_name)
 
-    def prep(self, dynamic):
+    def prep(self, dynamic, work_dir=""):
         """Prepare the shader for compilation, and create ``.inc`` files if applicable"""
+        self.generate(dynamic)
+        self.write(dynamic, work_dir)
+
+    def generate(self, dynamic):
+        """Parse the shader and build its ``.inc`` and ``filelist.txt`` text without touching any files"""
         pass
 
+    def write(self, dynamic, work_dir=""):
+        """
+        Write out what :meth:`generate` produced
+
+        :param work_dir: Project directory holding ``include`` and ``compile_temp``, the current one by default
+        """
+        if self.compile_vcs and not dynamic and self.file_list_code:
+            fxc_file.write_file_list(self.file_list_code, work_dir)
+        if self.inc_file and self.header_code:
+            self.inc_updated = write_if_changed(os.path.join(work_dir, "include", "{}.inc".format(self.shader_name)),
+                                                self.header_code)
+
 
 class DX9Shader(BaseShader):
+    __slots__ = ()
+
     def __init__(self, file_name, shader_name, compile_vcs=True):
         super(DX9Shader, self).__init__(file_name, shader_name, compile_vcs)
         self.inc_file = True
         self.type = "fxc"
 
-    def prep(self, dynamic):
-        full_code = fxc_file.read_input_file(self.file_path + self.file_name)
-        self.static_combos, self.dynamic_combos, self.static_defs = \
-            fxc_file.find_combos(full_code, self.shader_name)
-        self.skip_code, self.skips = fxc_file.find_skips(full_code)
-        self.centroid_mask = fxc_file.find_centroids(full_code)
+    def generate(self, dynamic):
+        parsed = fxc_file.parse_input_file(self.file_path + self.file_name)
+        self.static_combos, self.dynamic_combos, self.static_defs, self.skips, self.centroid_mask = \
+            parsed.specialize(self.shader_name)
+        if self.collapse_dead:
+            self.dead_combos = find_dead_combos(self)
+            fxc_file.collapse_combos(self.static_combos, self.dynamic_combos, self.dead_combos)
+        self.skip_code = fxc_file.make_skip_code(self.skips)
         if self.compile_vcs and not dynamic:
-            fxc_file.dump_file_list(
+            self.file_list_code = fxc_file.format_file_list(
                 self.shader_name,
                 self.file_name,
                 self.static_combos,
@@ -82,23 +127,31 @@ class DX9Shader(BaseShader):
                 self.centroid_mask
             )
         if self.inc_file:
-            with open("include/{}.inc".format(self.shader_name), "w") as out_file:
-                header_code = fxc_file.write_static_classes(
+            self.index_code = "".join([
+                fxc_file.write_static_classes(
                     self.shader_name,
                     self.static_combos,
                     self.static_defs,
                     self.dynamic_combos,
-                    self.skips
-                ) + "\n\n"
-                header_code += fxc_file.write_dynamic_classes(
+                    self.skips,
+                    include_cshader=self.amalgam_header is None
+                ),
+                "\n\n",
+                fxc_file.write_dynamic_classes(
                     self.shader_name,
                     self.dynamic_combos,
                     self.skips
                 )
-                out_file.write(header_code)
+            ])
+            if self.amalgam_header is None:
+                self.header_code = self.index_code
+            else:
+                self.header_code = amalgamate.stub_code(self.amalgam_header)
 
 
 class LegacyVertexShader(BaseShader):
+    __slots__ = ()
+
     def __init__(self, file_name, shader_name, compile_vcs=True):
         super(LegacyVertexShader, self).__init__(file_name, shader_name, compile_vcs)
         self.inc_file = True
@@ -106,6 +159,8 @@ class LegacyVertexShader(BaseShader):
 
 
 class LegacyPixelShader(BaseShader):
+    __slots__ = ()
+
     def __init__(self, file_name, shader_name, compile_vcs=True):
         super(LegacyPixelShader, self).__init__(file_name, shader_name, compile_vcs)
         self.inc_file = False
@@ -0,0 +1,374 @@
+"""
+Evaluates ``// SKIP`` expressions over a shader's whole combo space.
+
+Combo indices follow the layout of the generated ``GetIndex`` functions: dynamic combos first, each
+one scaled by the ranges before it, then static combos scaled by the total number of dynamic combos.
+Expressions are evaluated with NumPy in fixed size batches when it's installed, and one combo at a
+time otherwise. NumPy is only imported once combos are enumerated, see :func:`load_numpy`.
+"""
+import re
+
+numpy = None
+_numpy_loaded = False
+
+_token_re = re.compile(r"\s*(?:(\d+)|\$(\w+)|(defined\b|\|\||&&|==|!=|<=|>=|<<|>>|[-+*/%<>!~&|^?:()]))")
+
+# Binary operator precedence, higher binds tighter
+_binary_precedence = {
+    '||': 1, '&&': 2, '|': 3, '^': 4, '&': 5,
+    '==': 6, '!=': 6, '<': 7, '>': 7, '<=': 7, '>=': 7,
+    '<<': 8, '>>': 8, '+': 9, '-': 9, '*': 10, '/': 10, '%': 10,
+}
+
+DEFAULT_BATCH_SIZE = 1 << 18
+
+
+class SkipSyntaxError(ValueError):
+    pass
+
+
+def load_numpy():
+    """:return: The ``numpy`` module, imported on first use, or ``None`` if it isn't installed"""
+    global numpy, _numpy_loaded
+    if not _numpy_loaded:
+        _numpy_loaded = True
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
+
+def _tokenize(expression):
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = _token_re.match(expression, pos)
+        if match is None or match.end() == pos:
+            raise SkipSyntaxError("Unexpected '{}' in SKIP: {}".format(expression[pos:].strip(), expression))
+        number, var, operator = match.groups()
+        if number is not None:
+            tokens.append(('num', int(number)))
+        elif var is not None:
+            tokens.append(('var', var))
+        else:
+            tokens.append(('op', operator))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _expect(self, operator):
+        if self._peek() != ('op', operator):
+            raise SkipSyntaxError("Expected '{}' in SKIP: {}".format(operator, self.expression))
+        self.pos += 1
+
+    def parse(self):
+        node = self._ternary()
+        if self.pos != len(self.tokens):
+            raise SkipSyntaxError("Trailing tokens in SKIP: " + self.expression)
+        return node
+
+    def _ternary(self):
+        node = self._binary(1)
+        if self._peek() == ('op', '?'):
+            self.pos += 1
+            if_true = self._ternary()
+            self._expect(':')
+            if_false = self._ternary()
+            node = ('?', node, if_true, if_false)
+        return node
+
+    def _binary(self, min_precedence):
+        node = self._unary()
+        while True:
+            kind, value = self._peek()
+            if kind != 'op' or _binary_precedence.get(value, 0) < min_precedence:
+                return node
+            self.pos += 1
+            node = (value, node, self._binary(_binary_precedence[value] + 1))
+
+    def _unary(self):
+        kind, value = self._peek()
+        if kind == 'op' and value in ('!', '~', '-', '+'):
+            self.pos += 1
+            return ('u' + value, self._unary())
+        if kind == 'op' and value == 'defined':
+            self.pos += 1
+            return self._defined()
+        if kind == 'op' and value == '(':
+            self.pos += 1
+            node = self._ternary()
+            self._expect(')')
+            return node
+        if kind in ('num', 'var'):
+            self.pos += 1
+            return (kind, value)
+        raise SkipSyntaxError("Unexpected end of SKIP: " + self.expression)
+
+    def _defined(self):
+        """``defined $VAR`` or ``defined( $VAR )``"""
+        if self._peek() == ('op', '('):
+            self.pos += 1
+            node = self._defined()
+            self._expect(')')
+            return node
+        kind, value = self._peek()
+        if kind != 'var':
+            raise SkipSyntaxError("Expected a $variable after 'defined' in SKIP: " + self.expression)
+        self.pos += 1
+        return ('defined', value)
+
+
+def parse_skip(expression):
+    """
+    :param expression: A SKIP expression, e.g. ``$DETAIL && ( $LIGHTS > 2 )``
+    :return: Expression tree of nested tuples
+    """
+    return _Parser(expression).parse()
+
+
+def skip_variables(node, found=None):
+    """:return: Set of ``$VAR`` names whose value an expression tree uses, ``defined $VAR`` doesn't count"""
+    if found is None:
+        found = set()
+    if node[0] == 'var':
+        found.add(node[1])
+    elif node[0] not in ('num', 'defined'):
+        for child in node[1:]:
+            skip_variables(child, found)
+    return found
+
+
+def resolve_defined(node, names):
+    """
+    Replace every ``defined $VAR`` in an expression tree with 1 if ``VAR`` is in ``names``, 0 otherwise,
+    as the Perl scripts do for the shader's combos.
+
+    :return: New expression tree
+    """
+    if node[0] == 'defined':
+        return ('num', int(node[1] in names))
+    if node[0] in ('num', 'var'):
+        return node
+    return (node[0],) + tuple(resolve_defined(child, names) for child in node[1:])
+
+
+def _c_divide(a, b, modulo):
+    # C truncates towards zero, and a skip dividing by zero shouldn't take the build down with it
+    if numpy is not None and (isinstance(a, numpy.ndarray) or isinstance(b, numpy.ndarray)):
+        safe_b = numpy.where(b == 0, 1, b)
+        quotient = numpy.trunc(a / safe_b).astype(numpy.int64)
+        result = a - quotient * safe_b if modulo else quotient
+        return numpy.where(b == 0, 0, result)
+    if b == 0:
+        return 0
+    quotient = abs(a) // abs(b) * (1 if (a < 0) == (b < 0) else -1)
+    return a - quotient * b if modulo else quotient
+
+
+def evaluate(node, values):
+    """
+    Evaluate a tree from :func:`parse_skip`.
+
+    :param values: Dict of variable name to an int or a NumPy int64 array
+    :return: int or array, booleans as 0/1
+    """
+    kind = node[0]
+    if kind == 'num':
+        return node[1]
+    if kind == 'var':
+        return values.get(node[1], 0)
+    if kind == 'defined':
+        return int(node[1] in values)
+    if kind == 'u!':
+        return _as_int(evaluate(node[1], values) == 0)
+    if kind == 'u~':
+        return ~evaluate(node[1], values)
+    if kind == 'u-':
+        return -evaluate(node[1], values)
+    if kind == 'u+':
+        return evaluate(node[1], values)
+    if kind == '?':
+        condition = evaluate(node[1], values)
+        if_true = evaluate(node[2], values)
+        if_false = evaluate(node[3], values)
+        if numpy is not None and isinstance(condition, numpy.ndarray):
+            return numpy.where(condition != 0, if_true, if_false)
+        return if_true if condition else if_false
+
+    a = evaluate(node[1], values)
+    b = evaluate(node[2], values)
+    if kind == '&&':
+        return _as_int((a != 0) & (b != 0))
+    if kind == '||':
+        return _as_int((a != 0) | (b != 0))
+    if kind == '==':
+        return _as_int(a == b)
+    if kind == '!=':
+        return _as_int(a != b)
+    if kind == '<':
+        return _as_int(a < b)
+    if kind == '>':
+        return _as_int(a > b)
+    if kind == '<=':
+        return _as_int(a <= b)
+    if kind == '>=':
+        return _as_int(a >= b)
+    if kind == '/':
+        return _c_divide(a, b, False)
+    if kind == '%':
+        return _c_divide(a, b, True)
+    return {
+        '+': lambda: a + b, '-': lambda: a - b, '*': lambda: a * b,
+        '<<': lambda: a << b, '>>': lambda: a >> b,
+        '&': lambda: a & b, '|': lambda: a | b, '^': lambda: a ^ b,
+    }[kind]()
+
+
+def _as_int(value):
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        return value.astype(numpy.int64)
+    return int(value)
+
+
+class SkipEvaluator:
+    """
+    Works out which combos of a shader survive its SKIP expressions.
+
+    Only variables that appear in a SKIP can change the result, so counting is done over that much
+    smaller space and scaled up by the ranges of every other combo.
+    """
+
+    def __init__(self, static_combos, dynamic_combos, skips: [str]):
+        """
+        :param static_combos: List of :class:`Combo`, as found by :meth:`ParsedSource.specialize`
+        :param dynamic_combos: List of combos
+        :param skips: SKIP expressions
+        """
+        # name -> (min, range, stride) in the full combo space
+        self.layout = {}
+        self.total = 1
+        for combo in list(dynamic_combos) + list(static_combos):
+            self.layout[combo.name] = (combo.min, combo.count, combo.stride)
+            self.total *= combo.count
+        # Every combo is defined, whatever its value, so ``defined`` is known before anything is enumerated
+        self.trees = [resolve_defined(parse_skip(skip), self.layout) for skip in skips]
+
+        used = set()
+        for tree in self.trees:
+            skip_variables(tree, used)
+        # Variables a SKIP uses that the shader doesn't have are always 0
+        self.unknown_variables = sorted(used - set(self.layout))
+        self.variables = [name for name in self.layout if name in used]
+
+    def _values(self, indices, variables):
+        """Decode combo indices (ints or an array) into a dict of variable values."""
+        return {
+            name: self.layout[name][0] + (indices // self.layout[name][2]) % self.layout[name][1]
+            for name in variables
+        }
+
+    def _skipped(self, values, shape=None):
+        """
+        :param shape: Shape of the arrays in ``values``, with NumPy
+        :return: Nonzero for skipped combos, an array of ``shape`` if given
+        """
+        result = 0
+        for tree in self.trees:
+            result = result | (evaluate(tree, values) != 0)
+        if shape is not None and not isinstance(result, numpy.ndarray):
+            # No SKIP uses a variable the shader has, so the same result holds for the whole batch
+            result = numpy.broadcast_to(result, shape)
+        return result
+
+    def count_live(self, batch_size=DEFAULT_BATCH_SIZE):
+        """:return: Number of combos that aren't skipped"""
+        load_numpy()
+        if not self.trees:
+            return self.total
+        # Enumerate just the variables the skips use, every other combo multiplies the result
+        sub_layout = {}
+        sub_total = 1
+        for name in self.variables:
+            min_val, value_range, _ = self.layout[name]
+            sub_layout[name] = (min_val, value_range, sub_total)
+            sub_total *= value_range
+        multiplier = self.total // sub_total
+
+        skipped = 0
+        for start in range(0, sub_total, batch_size):
+            stop = min(sub_total, start + batch_size)
+            if numpy is not None:
+                indices = numpy.arange(start, stop, dtype=numpy.int64)
+                values = {n: m + (indices // s) % r for n, (m, r, s) in sub_layout.items()}
+                skipped += int(numpy.count_nonzero(self._skipped(values, indices.shape)))
+            else:
+                for index in range(start, stop):
+                    values = {n: m + (index // s) % r for n, (m, r, s) in sub_layout.items()}
+                    skipped += bool(self._skipped(values))
+        return (sub_total - skipped) * multiplier
+
+    def live_indices(self, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Yield the indices of every combo that isn't skipped, in ascending order.
+
+        With NumPy each item is an int64 array covering up to ``batch_size`` combos, otherwise a list.
+        """
+        load_numpy()
+        for start in range(0, self.total, batch_size):
+            stop = min(self.total, start + batch_size)
+            if numpy is not None:
+                indices = numpy.arange(start, stop, dtype=numpy.int64)
+                if self.trees:
+                    indices = indices[self._skipped(self._values(indices, self.variables), indices.shape) == 0]
+                yield indices
+            else:
+                yield [index for index in range(start, stop)
+                       if not self.trees or not self._skipped(self._values(index, self.variables))]
+
+    def live_ranges(self, batch_size=DEFAULT_BATCH_SIZE):
+        """Yield ``(first, last)`` runs of consecutive live combo indices."""
+        run_start = run_end = None
+        for indices in self.live_indices(batch_size):
+            if len(indices) == 0:
+                continue
+            if numpy is not None:
+                breaks = numpy.flatnonzero(numpy.diff(indices) != 1)
+                starts = numpy.concatenate(([indices[0]], indices[breaks + 1])).tolist()
+                ends = numpy.concatenate((indices[breaks], [indices[-1]])).tolist()
+            else:
+                starts = [i for n, i in enumerate(indices) if n == 0 or indices[n - 1] != i - 1]
+                ends = [i for n, i in enumerate(indices) if n == len(indices) - 1 or indices[n + 1] != i + 1]
+            for first, last in zip(starts, ends):
+                if run_end is not None and first == run_end + 1:
+                    run_end = last
+                    continue
+                if run_start is not None:
+                    yield run_start, run_end
+                run_start, run_end = first, last
+        if run_start is not None:
+            yield run_start, run_end
+
+    def write_live_ranges(self, path, batch_size=DEFAULT_BATCH_SIZE):
+        """Write every run of live combos to ``path``, one ``first..last`` per line."""
+        with open(path, "w") as out_file:
+            for first, last in self.live_ranges(batch_size):
+                out_file.write("{}..{}\n".format(first, last))
+
+    def decode(self, index):
+        """:return: Dict of every combo's value for a single combo index"""
+        return self._values(index, self.layout)
+
+    def is_skipped(self, index):
+        """:return: Whether a single combo index is skipped"""
+        return bool(self.trees) and bool(self._skipped(self._values(index, self.variables)))
@@ -0,0 +1,73 @@
+"""
+Compiles one combo of every shader before the full build, so a broken shader fails the build in
+seconds instead of somewhere in the middle of it.
+"""
+import time
+
+from . import fxc_file
+from .scheduler import CompileJob
+from .scheduler import Scheduler
+from .scheduler import ShaderCompileResult
+from .scheduler import combo_defines
+from .scheduler import source_digest
+from .skip_eval import SkipEvaluator
+
+
+def _default_value(combo, initial_value):
+    """:return: A static combo's ``[=...]`` value if it's a number in range, otherwise its minimum"""
+    try:
+        value = int(initial_value, 0)
+    except ValueError:
+        return combo.min
+    return value if combo.min <= value <= combo.max else combo.min
+
+
+def representative_combo(shader, evaluator):
+    """
+    Pick the combo a shader is most likely used with: static combos at their default values and
+    dynamic combos at their minimum. If a SKIP rules that out, the first live combo is used instead.
+
+    :return: Combo index, or ``None`` if every combo is skipped
+    """
+    # A collapsed combo is only compiled at its minimum, and its stride is shared with the next combo
+    index = sum((_default_value(combo, shader.static_defs.get(combo.name, "")) - combo.min) * combo.stride
+                for combo in shader.static_combos if not combo.dead)
+    if not evaluator.is_skipped(index):
+        return index
+    for batch in evaluator.live_indices():
+        for live_index in batch:
+            return int(live_index)
+    return None
+
+
+def smoke_jobs(shader_list):
+    """Yield a :class:`CompileJob` for the representative combo of every shader."""
+    for shader in shader_list:
+        evaluator = SkipEvaluator(shader.static_combos, shader.dynamic_combos, shader.skips)
+        index = representative_combo(shader, evaluator)
+        if index is not None:
+            yield CompileJob(shader.shader_name, shader.file_name, fxc_file.get_shader_type(shader.shader_name),
+                             index, combo_defines(shader, evaluator, index), source_digest=source_digest(shader))
+
+
+def _print_failure(result, shader_result):
+    if not result.ok:
+        defines = " ".join("{}={}".format(name, value) for name, value in result.job.defines)
+        print("FAILED: {}\n\t{}\n{}".format(result.job, defines, result.output.rstrip()), flush=True)
+
+
+def smoke_compile(shader_list, backend, threads):
+    """
+    Compile the representative combo of every shader, printing compiler output for each failure.
+
+    :param shader_list: Prepped :class:`DX9Shader` objects
+    :param backend: Compiler, as for :class:`Scheduler`
+    :return: List of failed :class:`CompileResult`
+    """
+    start = time.perf_counter()
+    results = {shader.shader_name: ShaderCompileResult(shader.shader_name, 1) for shader in shader_list}
+    Scheduler(backend, threads).run_jobs(smoke_jobs(shader_list), results, _print_failure)
+    failures = [failure for result in results.values() for failure in result.failures]
+    print("Smoke test: {} of {} shaders failed in {:.1f}s".format(
+        len(failures), sum(result.compiled for result in results.values()), time.perf_counter() - start))
+    return failures
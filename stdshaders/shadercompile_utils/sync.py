@@ -0,0 +1,187 @@
+"""
+Copies files only when they've changed, for staging sources into compile_temp and publishing shaders.
+
+What every destination was last synced from is kept in a manifest. A file is skipped when its size
+and modification time match, or when only the time changed and its hash still matches. Files are
+written under a temporary name and renamed into place, so a running game never loads a half written
+``.vcs``. Where the filesystem allows, sources are hard linked and shaders reflinked (copy on write)
+instead of copied.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MANIFEST_VERSION = 1
+# Files at least this big are copied on the thread pool, smaller ones aren't worth the handoff
+LARGE_FILE = 1024 * 1024
+# ioctl that clones a file's extents on Linux (btrfs, xfs, ...)
+_FICLONE = 0x40049409
+
+
+def _digest(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as in_file:
+        for block in iter(lambda: in_file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _copy_file(src, dst):
+    """Reflink ``src`` to ``dst`` if the filesystem can, otherwise copy it."""
+    if fcntl is not None and sys.platform.startswith("linux"):
+        try:
+            with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+                fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+            return
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+
+
+class SyncStats:
+    """Files and bytes copied and skipped by :class:`FileSync`."""
+
+    def __init__(self):
+        self.copied = 0
+        self.copied_bytes = 0
+        self.linked = 0
+        self.skipped = 0
+        self.skipped_bytes = 0
+
+    def __str__(self):
+        return "Copied {} files ({} KB, {} linked), skipped {} unchanged files ({} KB)".format(
+            self.copied, self.copied_bytes // 1024, self.linked, self.skipped, self.skipped_bytes // 1024)
+
+
+class FileSync:
+    """Copies files whose source changed since they were last synced, see the module docs."""
+
+    def __init__(self, path, threads=1):
+        """
+        :param path: Manifest file, created on the first :meth:`save`
+        :param threads: Number of large files copied at once
+        """
+        self.path = path
+        self.threads = threads
+        self.stats = SyncStats()
+        # destination -> {'source': [size, mtime_ns], 'dest': [size, mtime_ns], 'digest': source hash}
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.isfile(path):
+            try:
+                with open(path) as manifest_file:
+                    data = json.load(manifest_file)
+                if data.get('version') == MANIFEST_VERSION:
+                    self.entries = data.get('files', {})
+            except (OSError, ValueError):
+                print("Ignoring unreadable sync manifest: " + path)
+
+    def save(self):
+        with open(self.path, "w") as manifest_file:
+            json.dump({'version': MANIFEST_VERSION, 'files': self.entries}, manifest_file)
+
+    def take_stats(self):
+        """:return: The :class:`SyncStats` so far, starting a new count"""
+        stats, self.stats = self.stats, SyncStats()
+        return stats
+
+    def sync(self, pairs, link=False):
+        """
+        Bring every destination up to date with its source.
+
+        :param pairs: Iterable of ``(source, destination)`` paths, destination directories must exist
+        :param link: Hard link sources where possible. Only safe if nothing writes to the destinations
+            in place, as the source would change with them
+        """
+        large = []
+        for src, dst in pairs:
+            dst = os.path.abspath(dst)
+            src_stat = os.stat(src)
+            if self._is_current(src, dst, src_stat, link):
+                self.stats.skipped += 1
+                self.stats.skipped_bytes += src_stat.st_size
+            elif self.threads > 1 and src_stat.st_size >= LARGE_FILE:
+                large.append((src, dst, src_stat))
+            else:
+                self._copy(src, dst, src_stat, link)
+        if large:
+            with ThreadPoolExecutor(self.threads) as executor:
+                for future in [executor.submit(self._copy, src, dst, src_stat, link) for src, dst, src_stat in large]:
+                    future.result()
+
+    def _record(self, dst, src_stat, digest):
+        dst_stat = os.stat(dst)
+        with self._lock:
+            self.entries[dst] = {
+                'source': [src_stat.st_size, src_stat.st_mtime_ns],
+                'dest': [dst_stat.st_size, dst_stat.st_mtime_ns],
+                'digest': digest,
+            }
+
+    def _is_current(self, src, dst, src_stat, link):
+        try:
+            dst_stat = os.stat(dst)
+        except OSError:
+            return False
+        if link and os.path.samestat(src_stat, dst_stat):
+            # Already linked, renaming a new link over it would do nothing
+            self._record(dst, src_stat, self.entries.get(dst, {}).get('digest') or _digest(src))
+            return True
+        entry = self.entries.get(dst)
+        if entry is None or entry['dest'] != [dst_stat.st_size, dst_stat.st_mtime_ns]:
+            return False
+        if entry['source'] == [src_stat.st_size, src_stat.st_mtime_ns]:
+            return True
+        # Touched but maybe not changed, e.g. checked out again
+        if entry['source'][0] != src_stat.st_size or entry['digest'] != _digest(src):
+            return False
+        entry['source'] = [src_stat.st_size, src_stat.st_mtime_ns]
+        return True
+
+    def _copy(self, src, dst, src_stat, link):
+        digest = _digest(src)
+        temp_path = "{}.{}.{}.tmp".format(dst, os.getpid(), threading.get_ident())
+        linked = False
+        try:
+            if link:
+                try:
+                    os.link(src, temp_path)
+                    linked = True
+                except OSError:
+                    pass
+            if not linked:
+                _copy_file(src, temp_path)
+            os.replace(temp_path, dst)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._record(dst, src_stat, digest)
+        with self._lock:
+            self.stats.copied += 1
+            if linked:
+                self.stats.linked += 1
+            else:
+                self.stats.copied_bytes += src_stat.st_size
+
+
+def tree_pairs(src_dir, dst_dir):
+    """
+    :return: ``(source, destination)`` for every file under ``src_dir``, creating the directories
+        they need under ``dst_dir``
+    """
+    pairs = []
+    for root, _, files in os.walk(src_dir):
+        target = os.path.join(dst_dir, os.path.relpath(root, src_dir))
+        os.makedirs(target, exist_ok=True)
+        pairs.extend((os.path.join(root, name), os.path.join(target, name)) for name in files)
+    return pairs
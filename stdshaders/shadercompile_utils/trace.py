@@ -0,0 +1,146 @@
+"""
+Optional build instrumentation: timing spans and per shader stats.
+
+Tracing is off unless :func:`enable` is called. While it's off :func:`span` hands back a shared
+no-op context manager and :func:`record` returns straight away, so instrumented code costs a
+function call and nothing else. Results can be written as a Chrome trace (``chrome://tracing``,
+Perfetto) and summed up as text.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+
+_NULL_SPAN = contextlib.nullcontext()
+
+_tracer = None
+
+
+class Tracer:
+    """Collects spans and shader stats for one process."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.events = []
+        # shader name -> dict of stat name -> number
+        self.shader_stats = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name, category, args):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            event = {
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': start / 1000,
+                'dur': (end - start) / 1000,
+                'pid': self.pid,
+                'tid': threading.get_ident(),
+            }
+            if args:
+                event['args'] = args
+            self.events.append(event)
+
+    def record(self, shader_name, stats):
+        with self._lock:
+            shader = self.shader_stats.setdefault(shader_name, {})
+            for name, value in stats.items():
+                shader[name] = shader.get(name, 0) + value
+
+    def write_chrome_trace(self, path):
+        """Write every span as a Chrome trace event file, with the shader stats alongside."""
+        with open(path, "w") as trace_file:
+            json.dump({
+                'traceEvents': self.events,
+                'displayTimeUnit': 'ms',
+                'shaderStats': self.shader_stats,
+            }, trace_file)
+
+    def summary(self, top=20):
+        """
+        :param top: Number of shaders to list
+        :return: Spans summed up by name, slowest first, then the slowest shaders and their stats
+        """
+        phases = {}
+        shaders = {}
+        for event in self.events:
+            total, count, longest = phases.get(event['name'], (0, 0, 0))
+            phases[event['name']] = (total + event['dur'], count + 1, max(longest, event['dur']))
+            shader_name = event.get('args', {}).get('shader')
+            if shader_name is not None:
+                shaders[shader_name] = shaders.get(shader_name, 0) + event['dur']
+
+        lines = ["{:<24} {:>10} {:>8} {:>10}".format("phase", "total ms", "count", "max ms")]
+        for name, (total, count, longest) in sorted(phases.items(), key=lambda item: item[1][0], reverse=True):
+            lines.append("{:<24} {:>10.1f} {:>8} {:>10.1f}".format(name, total / 1000, count, longest / 1000))
+
+        if shaders:
+            stat_names = sorted({name for stats in self.shader_stats.values() for name in stats})
+            lines.append("")
+            lines.append("{:<32} {:>10}".format("shader", "ms") + "".join(" {:>14}".format(n) for n in stat_names))
+            for shader_name, total in sorted(shaders.items(), key=lambda item: item[1], reverse=True)[:top]:
+                stats = self.shader_stats.get(shader_name, {})
+                lines.append("{:<32} {:>10.1f}".format(shader_name, total / 1000) +
+                             "".join(" {:>14}".format(stats.get(n, "")) for n in stat_names))
+        return "\n".join(lines)
+
+
+def enable():
+    """Start tracing in this process."""
+    global _tracer
+    # A forked worker starts with a copy of its parent's tracer, and its spans
+    if _tracer is None or _tracer.pid != os.getpid():
+        _tracer = Tracer()
+    return _tracer
+
+
+def enabled():
+    return _tracer is not None
+
+
+def get_tracer():
+    """:return: The active :class:`Tracer`, or ``None`` if tracing is off"""
+    return _tracer
+
+
+def span(name, category="build", **args):
+    """
+    Time a block of code::
+
+        with trace.span("generate", shader=shader.shader_name):
+            ...
+
+    :param name: Phase name
+    :param category: Trace category
+    :param args: Extra values stored with the span, ``shader`` ties it to a shader in the summary
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, category, args)
+
+
+def record(shader_name, **stats):
+    """Add to a shader's stats, e.g. ``record(name, bytes_written=123)``."""
+    if _tracer is None:
+        return
+    _tracer.record(shader_name, stats)
+
+
+def take_events():
+    """Remove and return the spans recorded so far, to hand them to another process's tracer."""
+    if _tracer is None:
+        return []
+    events, _tracer.events = _tracer.events, []
+    return events
+
+
+def add_events(events):
+    """Merge in spans recorded by another process."""
+    if _tracer is not None:
+        _tracer.events.extend(events)
@@ -0,0 +1,292 @@
+"""
+Reads and writes Source engine ``.vcs`` shader archives (version 6).
+
+Layout, all values little endian uint32:
+
+* Header: version, total combos, dynamic combos, flags, centroid mask, static combo count (including
+  the sentinel) and the CRC32 of the source.
+* One ``(static combo id, file offset)`` record per stored static combo, sorted by id, followed by a
+  ``0xffffffff`` sentinel whose offset is the end of the combo data.
+* A count of duplicate static combos and their ``(static combo id, source static combo id)`` records.
+  Duplicates share the data of their source combo instead of being stored twice.
+* The data of each static combo: blocks of ``(dynamic combo index, size, bytecode)`` records. Every
+  block starts with its stored size, flagged as LZMA compressed (``0x40000000``) or uncompressed
+  (``0x80000000``), and the list of blocks ends with ``0xffffffff``. Compressed blocks use Valve's
+  ``LZMA`` header: id, uncompressed size, compressed size and the 5 LZMA property bytes.
+"""
+import lzma
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from . import fxc_file
+from .file_utils import write_bytes_atomic
+
+VCS_VERSION = 6
+BLOCK_UNCOMPRESSED = 0x80000000
+BLOCK_LZMA = 0x40000000
+BLOCK_SIZE_MASK = 0x3fffffff
+END_MARKER = 0xffffffff
+LZMA_ID = 0x414d5a4c  # "LZMA"
+
+# Uncompressed size at which a static combo is split into another block
+MAX_BLOCK_SIZE = 1 << 20
+
+# File header: version, total combos, dynamic combos, flags, centroid mask, static records, source CRC
+HEADER = struct.Struct("<iiiIIII")
+# A static combo's id and offset, an alias's static id and source id, or a dynamic combo's index and size
+RECORD = struct.Struct("<II")
+UINT = struct.Struct("<I")
+_lzma_header = struct.Struct("<III5s")
+
+_LZMA_PROPERTIES = {'lc': 3, 'lp': 0, 'pb': 2}
+
+
+def _lzma_compress(data):
+    dict_size = 1 << 16
+    while dict_size < len(data) and dict_size < (1 << 24):
+        dict_size <<= 1
+    compressor = lzma.LZMACompressor(format=lzma.FORMAT_RAW, filters=[
+        dict(_LZMA_PROPERTIES, id=lzma.FILTER_LZMA1, dict_size=dict_size)])
+    compressed = compressor.compress(data) + compressor.flush()
+    properties = bytes([(_LZMA_PROPERTIES['pb'] * 5 + _LZMA_PROPERTIES['lp']) * 9 + _LZMA_PROPERTIES['lc']])
+    properties += UINT.pack(dict_size)
+    return _lzma_header.pack(LZMA_ID, len(data), len(compressed), properties) + compressed
+
+
+def lzma_decompress(data):
+    """:return: The contents of an LZMA block, as Valve's tools write them"""
+    lzma_id, actual_size, lzma_size, properties = _lzma_header.unpack_from(data)
+    if lzma_id != LZMA_ID:
+        raise ValueError("Bad LZMA block id")
+    lc = properties[0] % 9
+    lp = properties[0] // 9 % 5
+    pb = properties[0] // 45
+    dict_size = UINT.unpack_from(properties, 1)[0]
+    decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=[
+        {'id': lzma.FILTER_LZMA1, 'dict_size': dict_size, 'lc': lc, 'lp': lp, 'pb': pb}])
+    start = _lzma_header.size
+    return decompressor.decompress(data[start:start + lzma_size], actual_size)
+
+
+def _pack_blocks(dynamic_combos):
+    """
+    Split one static combo's ``(dynamic index, bytecode)`` pairs into uncompressed blocks.
+
+    :return: List of ``bytes``
+    """
+    blocks = []
+    current = []
+    size = 0
+    for dynamic_index, bytecode in dynamic_combos:
+        record = RECORD.pack(dynamic_index, len(bytecode)) + bytecode
+        if current and size + len(record) > MAX_BLOCK_SIZE:
+            blocks.append(b"".join(current))
+            current = []
+            size = 0
+        current.append(record)
+        size += len(record)
+    if current:
+        blocks.append(b"".join(current))
+    return blocks
+
+
+def _encode_static_combo(dynamic_combos, compress):
+    """:return: The stored data of one static combo, block list terminator included"""
+    out = []
+    for block in _pack_blocks(dynamic_combos):
+        if compress:
+            packed = _lzma_compress(block)
+            if len(packed) < len(block):
+                out.append(UINT.pack(len(packed) | BLOCK_LZMA))
+                out.append(packed)
+                continue
+        out.append(UINT.pack(len(block) | BLOCK_UNCOMPRESSED))
+        out.append(block)
+    out.append(UINT.pack(END_MARKER))
+    return b"".join(out)
+
+
+class VcsStats:
+    """What went into a written ``.vcs`` file."""
+
+    def __init__(self):
+        self.combos = 0
+        self.unique_bytecode = 0
+        self.static_combos = 0
+        self.duplicate_static_combos = 0
+        self.uncompressed_size = 0
+        self.file_size = 0
+
+
+def write_vcs(path, bytecode, total_combos, dynamic_combos, centroid_mask=0, flags=0, source_crc=0,
+              compress=True, threads=None):
+    """
+    Pack compiled combos into a ``.vcs`` file.
+
+    Identical bytecode is only kept in memory once, and static combos whose dynamic combos are all
+    identical to another static combo are stored as duplicates of it. Static combos are compressed in
+    parallel, then the whole file is written in one go.
+
+    :param path: Output file
+    :param bytecode: Dict of combo index to compiled bytecode
+    :param total_combos: Size of the shader's whole combo space
+    :param dynamic_combos: Number of dynamic combos
+    :param centroid_mask: The shader's ``// CENTROID`` mask
+    :param flags: Shader flags
+    :param source_crc: CRC32 of the shader's source
+    :param compress: LZMA compress blocks that get smaller for it
+    :param threads: Number of threads to compress with, defaults to the number of cores
+    :return: :class:`VcsStats`
+    """
+    stats = VcsStats()
+    unique = {}
+    static_combos = {}
+    for index in sorted(bytecode):
+        blob = unique.setdefault(bytecode[index], bytecode[index])
+        static_combos.setdefault(index // dynamic_combos, []).append((index % dynamic_combos, blob))
+        stats.combos += 1
+    stats.unique_bytecode = len(unique)
+
+    # Static combos with exactly the same content become aliases of the first one
+    sources = {}
+    stored = []
+    aliases = []
+    for static_id, combos in static_combos.items():
+        signature = tuple((dynamic_index, id(blob)) for dynamic_index, blob in combos)
+        if signature in sources:
+            aliases.append((static_id, sources[signature]))
+        else:
+            sources[signature] = static_id
+            stored.append(static_id)
+    stats.static_combos = len(stored)
+    stats.duplicate_static_combos = len(aliases)
+
+    with ThreadPoolExecutor(threads) as executor:
+        encoded = list(executor.map(lambda static_id: _encode_static_combo(static_combos[static_id], compress),
+                                    stored))
+    stats.uncompressed_size = sum(len(blob) + RECORD.size for blob in bytecode.values())
+
+    data_start = HEADER.size + RECORD.size * (len(stored) + 1) + UINT.size + RECORD.size * len(aliases)
+    records = []
+    offset = data_start
+    for static_id, data in zip(stored, encoded):
+        records.append(RECORD.pack(static_id, offset))
+        offset += len(data)
+    records.append(RECORD.pack(END_MARKER, offset))
+
+    out = [HEADER.pack(VCS_VERSION, total_combos, dynamic_combos, flags, centroid_mask, len(stored) + 1,
+                        source_crc)]
+    out.extend(records)
+    out.append(UINT.pack(len(aliases)))
+    out.extend(RECORD.pack(static_id, source_id) for static_id, source_id in aliases)
+    out.extend(encoded)
+    data = b"".join(out)
+    stats.file_size = len(data)
+    write_bytes_atomic(path, data)
+    return stats
+
+
+class VcsFile:
+    """A ``.vcs`` file read back into memory."""
+
+    def __init__(self):
+        self.version = 0
+        self.total_combos = 0
+        self.dynamic_combos = 0
+        self.flags = 0
+        self.centroid_mask = 0
+        self.source_crc = 0
+        # static combo id -> list of (dynamic index, bytecode)
+        self.static_combos = {}
+        # static combo id -> static combo id it duplicates
+        self.aliases = {}
+
+    def combos(self):
+        """:return: Dict of combo index to bytecode, duplicates included"""
+        out = {}
+        static_combos = list(self.static_combos.items())
+        static_combos += [(alias, self.static_combos[source]) for alias, source in self.aliases.items()]
+        for static_id, dynamic_combos in static_combos:
+            for dynamic_index, bytecode in dynamic_combos:
+                out[static_id * self.dynamic_combos + dynamic_index] = bytecode
+        return out
+
+
+def decode_static_combo(data, offset, end):
+    """
+    Decode the blocks of one static combo.
+
+    :return: List of ``(dynamic index, bytecode)``
+    """
+    combos = []
+    while offset < end:
+        block_size = UINT.unpack_from(data, offset)[0]
+        offset += UINT.size
+        if block_size == END_MARKER:
+            break
+        size = block_size & BLOCK_SIZE_MASK
+        block = bytes(data[offset:offset + size])
+        offset += size
+        if block_size & BLOCK_LZMA:
+            block = lzma_decompress(block)
+        elif not block_size & BLOCK_UNCOMPRESSED:
+            raise ValueError("Unsupported block compression")
+        pos = 0
+        while pos < len(block):
+            dynamic_index, length = RECORD.unpack_from(block, pos)
+            pos += RECORD.size
+            combos.append((dynamic_index, block[pos:pos + length]))
+            pos += length
+    return combos
+
+
+def read_vcs(path):
+    """
+    Read a whole ``.vcs`` file.
+
+    :return: :class:`VcsFile`
+    """
+    with open(path, "rb") as vcs:
+        data = vcs.read()
+    vcs_file = VcsFile()
+    (vcs_file.version, vcs_file.total_combos, vcs_file.dynamic_combos, vcs_file.flags, vcs_file.centroid_mask,
+     num_static, vcs_file.source_crc) = HEADER.unpack_from(data)
+    if vcs_file.version != VCS_VERSION:
+        raise ValueError("{}: unsupported .vcs version {}".format(path, vcs_file.version))
+
+    records = [RECORD.unpack_from(data, HEADER.size + i * RECORD.size) for i in range(num_static)]
+    pos = HEADER.size + num_static * RECORD.size
+    num_aliases = UINT.unpack_from(data, pos)[0]
+    pos += UINT.size
+    for i in range(num_aliases):
+        static_id, source_id = RECORD.unpack_from(data, pos + i * RECORD.size)
+        vcs_file.aliases[static_id] = source_id
+
+    for (static_id, offset), (_, end) in zip(records, records[1:]):
+        vcs_file.static_combos[static_id] = decode_static_combo(data, offset, end)
+    return vcs_file
+
+
+def source_crc(source):
+    """CRC32 of a shader's source, as stored in the header."""
+    return zlib.crc32(source.encode()) & 0xffffffff
+
+
+def write_shader_vcs(shader, bytecode, path, threads=None):
+    """
+    Pack the compiled combos of a prepped :class:`DX9Shader`.
+
+    :param bytecode: Dict of combo index to compiled bytecode
+    :return: :class:`VcsStats`
+    """
+    source = "".join(fxc_file.read_input_file(shader.file_path + shader.file_name))
+    return write_vcs(
+        path,
+        bytecode,
+        fxc_file.num_combos(shader.static_combos, shader.dynamic_combos),
+        fxc_file.num_dynamic_combos(shader.dynamic_combos),
+        shader.centroid_mask,
+        source_crc=source_crc(source),
+        threads=threads
+    )
@@ -0,0 +1,292 @@
+"""
+Checks built ``.vcs`` files without reading them into memory.
+
+Each file is memory mapped and only its header, static combo table and block headers are walked.
+Uncompressed blocks are read in place; LZMA blocks are only decompressed when their combos have to be
+counted, which is most of the time a full check takes. Files are checked on a thread pool, against
+what the shader's combos and SKIPs say should be there, and two builds can be compared combo by combo.
+"""
+import lzma
+import mmap
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from . import fxc_file
+from .skip_eval import SkipEvaluator
+from .skip_eval import SkipSyntaxError
+from .vcs_file import BLOCK_LZMA
+from .vcs_file import BLOCK_SIZE_MASK
+from .vcs_file import BLOCK_UNCOMPRESSED
+from .vcs_file import END_MARKER
+from .vcs_file import HEADER
+from .vcs_file import RECORD
+from .vcs_file import UINT
+from .vcs_file import VCS_VERSION
+from .vcs_file import lzma_decompress
+
+# Missing or unexpected combos listed per file
+MAX_EXAMPLES = 5
+
+
+class VcsInfo:
+    """What :func:`inspect_vcs` found in one ``.vcs`` file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file_size = 0
+        self.version = 0
+        self.total_combos = 0
+        self.dynamic_combos = 0
+        self.flags = 0
+        self.centroid_mask = 0
+        self.source_crc = 0
+        # List of (static combo id, data offset, data end)
+        self.static_combos = []
+        # static combo id -> static combo id it duplicates
+        self.aliases = {}
+        self.blocks = 0
+        self.compressed_blocks = 0
+        # Combos stored, duplicates included, ``None`` if they weren't counted
+        self.combos = 0
+        # Combo index -> bytecode size, if asked for
+        self.sizes = None
+        self.errors = []
+
+    @property
+    def shader_name(self):
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+def _read_tables(info, data):
+    """Read the header, static combo table and duplicates, checking every offset stays in the file."""
+    (info.version, info.total_combos, info.dynamic_combos, info.flags, info.centroid_mask, num_static,
+     info.source_crc) = HEADER.unpack_from(data)
+    if info.version != VCS_VERSION:
+        raise ValueError("unsupported .vcs version {}".format(info.version))
+    if info.dynamic_combos <= 0:
+        raise ValueError("{} dynamic combos".format(info.dynamic_combos))
+
+    records = [RECORD.unpack_from(data, HEADER.size + i * RECORD.size) for i in range(num_static)]
+    if not records or records[-1][0] != END_MARKER:
+        raise ValueError("static combo table has no end marker")
+    previous_id = -1
+    for (static_id, offset), (_, end) in zip(records, records[1:]):
+        if static_id <= previous_id:
+            raise ValueError("static combo {} is out of order".format(static_id))
+        if not offset <= end <= len(data):
+            raise ValueError("static combo {} runs past the end of the file".format(static_id))
+        info.static_combos.append((static_id, offset, end))
+        previous_id = static_id
+
+    pos = HEADER.size + num_static * RECORD.size
+    num_aliases = UINT.unpack_from(data, pos)[0]
+    pos += UINT.size
+    stored = {static_id for static_id, _, _ in info.static_combos}
+    for i in range(num_aliases):
+        static_id, source_id = RECORD.unpack_from(data, pos + i * RECORD.size)
+        if source_id not in stored:
+            raise ValueError("static combo {} duplicates {}, which isn't stored".format(static_id, source_id))
+        info.aliases[static_id] = source_id
+
+
+def _walk_records(info, block, pos, end, static_id, sizes):
+    """:return: Number of ``(dynamic index, size, bytecode)`` records in ``block[pos:end]``"""
+    count = 0
+    while pos < end:
+        dynamic_index, length = RECORD.unpack_from(block, pos)
+        pos += RECORD.size + length
+        if dynamic_index >= info.dynamic_combos or pos > end:
+            raise ValueError("static combo {} has a bad record".format(static_id))
+        if sizes is not None:
+            sizes[static_id * info.dynamic_combos + dynamic_index] = length
+        count += 1
+    return count
+
+
+def _walk_static_combo(info, data, static_id, offset, end, sizes, count_combos):
+    """:return: Number of combos stored for one static combo, 0 without ``count_combos``"""
+    count = 0
+    while offset < end:
+        block_size = UINT.unpack_from(data, offset)[0]
+        offset += UINT.size
+        if block_size == END_MARKER:
+            return count
+        size = block_size & BLOCK_SIZE_MASK
+        if offset + size > end:
+            raise ValueError("static combo {} has a block running past its end".format(static_id))
+        info.blocks += 1
+        if block_size & BLOCK_LZMA:
+            info.compressed_blocks += 1
+            if count_combos:
+                block = lzma_decompress(data[offset:offset + size])
+                count += _walk_records(info, block, 0, len(block), static_id, sizes)
+        elif block_size & BLOCK_UNCOMPRESSED:
+            if count_combos:
+                count += _walk_records(info, data, offset, offset + size, static_id, sizes)
+        else:
+            raise ValueError("static combo {} has an unsupported block".format(static_id))
+        offset += size
+    raise ValueError("static combo {} has no end marker".format(static_id))
+
+
+def inspect_vcs(path, sizes=False, count_combos=True):
+    """
+    Walk one ``.vcs`` file. Problems with its structure end up in :attr:`VcsInfo.errors` rather than
+    being raised.
+
+    :param sizes: Also record the size of every combo, for :func:`diff_builds`
+    :param count_combos: Count the combos, decompressing blocks as needed. Otherwise only the tables
+        and block headers are checked
+    :return: :class:`VcsInfo`
+    """
+    info = VcsInfo(path)
+    try:
+        with open(path, "rb") as vcs, mmap.mmap(vcs.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            info.file_size = len(data)
+            _read_tables(info, data)
+            combo_sizes = {} if sizes else None
+            per_static = {}
+            for static_id, offset, end in info.static_combos:
+                per_static[static_id] = _walk_static_combo(info, data, static_id, offset, end, combo_sizes,
+                                                           count_combos or sizes)
+            for static_id, source_id in info.aliases.items():
+                per_static[static_id] = per_static[source_id]
+                if combo_sizes is not None:
+                    source_base = source_id * info.dynamic_combos
+                    for dynamic_index in range(info.dynamic_combos):
+                        size = combo_sizes.get(source_base + dynamic_index)
+                        if size is not None:
+                            combo_sizes[static_id * info.dynamic_combos + dynamic_index] = size
+            info.combos = sum(per_static.values()) if count_combos or sizes else None
+            info.sizes = combo_sizes
+    except struct.error:
+        info.errors.append("truncated")
+    except (OSError, ValueError, lzma.LZMAError) as error:
+        info.errors.append(str(error))
+    return info
+
+
+def inspect_many(paths, sizes=False, threads=None, count_combos=True):
+    """:return: List of :class:`VcsInfo` for ``paths``, inspected on a thread pool, see :func:`inspect_vcs`"""
+    with ThreadPoolExecutor(threads) as executor:
+        return list(executor.map(lambda path: inspect_vcs(path, sizes, count_combos), paths))
+
+
+def find_vcs(directory):
+    """:return: Sorted paths of every ``.vcs`` file under ``directory``"""
+    return sorted(os.path.join(root, name) for root, _, files in os.walk(directory)
+                  for name in files if name.lower().endswith(".vcs"))
+
+
+def verify_vcs(info, shader):
+    """
+    Cross-check a ``.vcs`` against its shader.
+
+    :param info: :class:`VcsInfo`, with sizes to list which combos are missing or unexpected
+    :param shader: :class:`DX9Shader` after ``generate``, as it was built
+    :return: List of problems
+    """
+    if info.errors:
+        return list(info.errors)
+    problems = []
+    total = fxc_file.num_combos(shader.static_combos, shader.dynamic_combos)
+    dynamic = fxc_file.num_dynamic_combos(shader.dynamic_combos)
+    if info.total_combos != total:
+        problems.append("header has {} combos, the shader has {}".format(info.total_combos, total))
+    if info.dynamic_combos != dynamic:
+        problems.append("header has {} dynamic combos, the shader has {}".format(info.dynamic_combos, dynamic))
+    if info.centroid_mask != shader.centroid_mask:
+        problems.append("centroid mask is {:#x}, the shader's is {:#x}".format(info.centroid_mask,
+                                                                             shader.centroid_mask))
+    if problems:
+        return problems
+
+    try:
+        evaluator = SkipEvaluator(shader.static_combos, shader.dynamic_combos, shader.skips)
+        live = evaluator.count_live()
+    except SkipSyntaxError as error:
+        return ["can't evaluate SKIPs: {}".format(error)]
+    if info.combos == live:
+        return problems
+    problems.append("{} combos stored, {} expected after SKIPs".format(info.combos, live))
+    if info.sizes is not None:
+        missing = []
+        stored = set(info.sizes)
+        for batch in evaluator.live_indices():
+            for index in map(int, batch):
+                if index in stored:
+                    stored.discard(index)
+                elif len(missing) < MAX_EXAMPLES:
+                    missing.append(index)
+        if missing:
+            problems.append("missing combos " + ", ".join(map(str, missing)))
+        if stored:
+            problems.append("skipped combos stored " + ", ".join(map(str, sorted(stored)[:MAX_EXAMPLES])))
+    return problems
+
+
+def verify_shaders(shader_list, vcs_dir, threads=None):
+    """
+    Inspect and cross-check the ``.vcs`` of every fxc shader in ``shader_list``.
+
+    :param vcs_dir: Directory holding the ``.vcs`` files, e.g. ``game/shaders/fxc``
+    :return: Dict of shader name to its list of problems, for shaders that have any
+    """
+    shaders = [shader for shader in shader_list if shader.type == "fxc" and shader.compile_vcs]
+    infos = inspect_many([os.path.join(vcs_dir, shader.shader_name + ".vcs") for shader in shaders], True, threads)
+    problems = {}
+    for shader, info in zip(shaders, infos):
+        shader_problems = verify_vcs(info, shader)
+        if shader_problems:
+            problems[shader.shader_name] = shader_problems
+    return problems
+
+
+class ComboChange:
+    """One combo whose size differs between two builds."""
+
+    def __init__(self, shader_name, combo_index, old_size, new_size):
+        self.shader_name = shader_name
+        self.combo_index = combo_index
+        self.old_size = old_size
+        self.new_size = new_size
+
+    @property
+    def growth(self):
+        return (self.new_size or 0) - (self.old_size or 0)
+
+    def __str__(self):
+        return "{} combo {}: {} -> {} bytes ({:+d})".format(
+            self.shader_name, self.combo_index, "none" if self.old_size is None else self.old_size,
+            "none" if self.new_size is None else self.new_size, self.growth)
+
+
+def diff_builds(old_infos, new_infos):
+    """
+    Compare two builds combo by combo.
+
+    :param old_infos: List of :class:`VcsInfo` with sizes
+    :param new_infos: List of :class:`VcsInfo` with sizes
+    :return: ``(dict of shader name to (old file size, new file size), list of changed
+        :class:`ComboChange`, biggest growth first)``. A file missing from one build has ``None`` as its size
+    """
+    old = {info.shader_name: info for info in old_infos}
+    new = {info.shader_name: info for info in new_infos}
+    files = {}
+    changes = []
+    for name in sorted(set(old) | set(new)):
+        old_info = old.get(name)
+        new_info = new.get(name)
+        files[name] = (old_info.file_size if old_info else None, new_info.file_size if new_info else None)
+        old_sizes = old_info.sizes or {} if old_info else {}
+        new_sizes = new_info.sizes or {} if new_info else {}
+        for index in old_sizes.keys() | new_sizes.keys():
+            if old_sizes.get(index) != new_sizes.get(index):
+                changes.append(ComboChange(name, index, old_sizes.get(index), new_sizes.get(index)))
+    changes.sort(key=lambda change: change.growth, reverse=True)
+    return files, changes
@@ -0,0 +1,61 @@
+"""Polls shader sources for changes, keeping everything parsed so far in memory."""
+import os
+import time
+
+from .include_graph import file_state
+from .include_graph import get_graph
+
+
+class ShaderWatcher:
+    """
+    Watches the sources of a shader list, and every file they include.
+
+    Changes are mapped back to the shaders they affect through the include graph, so editing a header
+    only rebuilds the shaders that include it.
+    """
+
+    def __init__(self, shader_list):
+        """
+        :param shader_list: List of :class:`BaseShader`
+        """
+        self.shader_list = shader_list
+        self.graph = get_graph()
+        self.states = self._snapshot()
+
+    def _snapshot(self):
+        states = {}
+        for shader in self.shader_list:
+            for path in [shader.file_path + shader.file_name] + shader.dependencies:
+                path = os.path.normpath(path)
+                if path not in states:
+                    states[path] = file_state(path)
+        return states
+
+    def poll(self):
+        """
+        Check every watched file once.
+
+        :return: List of shaders affected by files that changed since the last poll
+        """
+        changed = [path for path, state in self.states.items() if file_state(path) != state]
+        if not changed:
+            return []
+
+        affected = self.graph.invalidate(changed)
+        shaders = []
+        for shader in self.shader_list:
+            if os.path.normpath(shader.file_path + shader.file_name) in affected:
+                shader.invalidate()
+                shaders.append(shader)
+        # Includes may have been added or removed, start watching whatever the shaders use now
+        self.states = self._snapshot()
+        return shaders
+
+    def changes(self, interval):
+        """Yield the list of affected shaders every time something changes, forever."""
+        while True:
+            shaders = self.poll()
+            if shaders:
+                yield shaders
+            else:
+                time.sleep(interval)
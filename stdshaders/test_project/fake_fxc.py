@@ -0,0 +1,47 @@
+"""
+Stand-in for fxc.exe, used to test the native compile path without a shader compiler.
+
+Takes fxc style arguments and writes bytecode that only depends on the target profile, the defines
+and the source, so identical inputs always give identical output. Sources containing
+FAKE_COMPILE_ERROR fail to compile.
+"""
+import hashlib
+import sys
+
+
+def main(argv):
+    profile = ""
+    output = None
+    source = None
+    defines = []
+    for argument in argv:
+        if argument.startswith("/T"):
+            profile = argument[2:]
+        elif argument.startswith("/D"):
+            defines.append(argument[2:])
+        elif argument.startswith("/Fo"):
+            output = argument[3:]
+        elif not argument.startswith("/"):
+            source = argument
+
+    if output is None or source is None:
+        print("usage: fake_fxc.py /T<profile> [/D<name>=<value> ...] /Fo<output> <source>")
+        return 1
+
+    with open(source, "rb") as source_file:
+        code = source_file.read()
+    if b"FAKE_COMPILE_ERROR" in code:
+        print("{}(1,1): error X3000: FAKE_COMPILE_ERROR".format(source))
+        return 1
+
+    digest = hashlib.sha1(code)
+    digest.update(profile.encode())
+    for define in sorted(defines):
+        digest.update(define.encode())
+    with open(output, "wb") as out_file:
+        out_file.write(b"FXC\0" + profile.encode().ljust(8, b"\0") + digest.digest())
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main(sys.argv[1:]))
@@ -0,0 +1,54 @@
+import os
+
+from shadercompile_utils.amalgamate import assign_headers
+from shadercompile_utils.amalgamate import header_name
+from shadercompile_utils.amalgamate import write_amalgamated
+
+
+class FakeShader:
+    type = "fxc"
+
+    def __init__(self, shader_name):
+        self.shader_name = shader_name
+        self.amalgam_header = None
+        self.index_code = ""
+
+    def generate(self, write):
+        self.index_code = "class {}_Index {{}};".format(self.shader_name)
+
+
+def read_headers(include_dir):
+    headers = {}
+    for name in os.listdir(include_dir):
+        if name.startswith("shader_indices_"):
+            with open(os.path.join(include_dir, name)) as header_file:
+                headers[name] = header_file.read()
+    return headers
+
+
+def build(include_dir, names, prepped, parts=1):
+    shaders = [FakeShader(name) for name in names]
+    assign_headers(shaders, parts)
+    write_amalgamated(shaders, [shader for shader in shaders if shader.shader_name in prepped], include_dir)
+    return read_headers(include_dir)
+
+
+def test_removed_shader(tmp_path):
+    include_dir = str(tmp_path)
+    headers = build(include_dir, ["a_ps20", "b_ps20"], {"a_ps20", "b_ps20"})
+    assert list(headers) == [header_name("a_ps20", 1)]
+    assert "b_ps20_Index" in headers[header_name("a_ps20", 1)]
+    # Nothing prepped, only the list changed
+    headers = build(include_dir, ["a_ps20"], set())
+    assert "a_ps20_Index" in headers[header_name("a_ps20", 1)]
+    assert "b_ps20_Index" not in headers[header_name("a_ps20", 1)]
+
+
+def test_emptied_header_removed(tmp_path):
+    include_dir = str(tmp_path)
+    names = ["a_ps20", "b_ps20", "c_vs20", "d_vs20"]
+    assert len(build(include_dir, names, set(names), parts=4)) > 1
+    headers = build(include_dir, ["a_ps20"], set(), parts=4)
+    assert list(headers) == [header_name("a_ps20", 4)]
+    with open(os.path.join(include_dir, "shader_indices.h")) as umbrella:
+        assert umbrella.read().count("#include") == 1
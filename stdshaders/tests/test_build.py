@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+import shadercompile_utils
+from shadercompile_utils import ShaderBuild
+from shadercompile_utils.scheduler import split_command
+from shadercompile_utils.watch import ShaderWatcher
+
+SHADER = """#include "common.h"
+// STATIC: "MODE" "0..1"
+{}float4 main() : COLOR {{ return C; }}
+"""
+
+
+@pytest.fixture
+def project(tmp_path):
+    """A project whose shaders include a header from the project directory rather than next to them."""
+    os.mkdir(str(tmp_path / "src"))
+    (tmp_path / "list.txt").write_text("src/a_ps2x.fxc\nsrc/b_ps2x.fxc\n")
+    (tmp_path / "common.h").write_text("#define C 1\n")
+    for name in ("a_ps2x.fxc", "b_ps2x.fxc"):
+        (tmp_path / "src" / name).write_text(SHADER.format(""))
+    return tmp_path
+
+
+def build(project, **options):
+    return shadercompile_utils.build(["list"], str(project / "game"), str(project), str(project / "bin"),
+                                     str(project), dynamic=True, **options)
+
+
+def test_rebuild_after_edit(project):
+    assert build(project).success
+    (project / "src" / "a_ps2x.fxc").write_text(SHADER.format('// DYNAMIC: "FOG" "0..1"\n'))
+    result = build(project)
+    assert result.success
+    assert sorted(name for name, shader in result.shaders.items() if shader.prepped) == ["a_ps20", "a_ps20b"]
+    assert "FOG" in (project / "include" / "a_ps20.inc").read_text()
+
+
+def test_spawned_jobs(project):
+    start_method = multiprocessing.get_start_method()
+    multiprocessing.set_start_method("spawn", force=True)
+    try:
+        result = build(project, jobs=2)
+    finally:
+        multiprocessing.set_start_method(start_method, force=True)
+    assert result.success
+    assert sorted(os.listdir(str(project / "include"))) == ["a_ps20.inc", "a_ps20b.inc", "b_ps20.inc", "b_ps20b.inc"]
+
+
+def test_watch_after_jobs(project):
+    shader_build = ShaderBuild(["list"], str(project / "game"), str(project), str(project / "bin"), str(project),
+                               dynamic=True, jobs=2)
+    assert shader_build.run().success
+    watcher = ShaderWatcher(shader_build.shader_list)
+    (project / "common.h").write_text("#define C 2.0\n")
+    assert sorted(shader.shader_name for shader in watcher.poll()) == ["a_ps20", "a_ps20b", "b_ps20", "b_ps20b"]
+
+
+def test_smoke_command(tmp_path):
+    source_dir = tmp_path / "sdk src"
+    shader_build = ShaderBuild(["list"], str(tmp_path / "game"), str(source_dir), str(tmp_path / "bin"), str(tmp_path))
+    assert shader_build.smoke_command() is None
+    fxc = source_dir / "dx9sdk" / "utilities" / "fxc.exe"
+    os.makedirs(str(fxc.parent))
+    fxc.write_bytes(b"")
+    assert split_command(shader_build.smoke_command())[:2] == [str(fxc), "/nologo"]
+    assert ShaderBuild(["list"], str(tmp_path / "game"), str(source_dir), str(tmp_path / "bin"), str(tmp_path),
+                       compiler="fxc.exe /T{profile}").smoke_command() == "fxc.exe /T{profile}"
+
+
+def read_outputs(project):
+    """:return: Dict of relative path to contents, for every .inc, .vcs and filelist.txt the build wrote"""
+    outputs = {}
+    for directory in ("include", os.path.join("game", "shaders", "fxc"), "compile_temp"):
+        for name in sorted(os.listdir(str(project / directory))):
+            if name.endswith((".inc", ".vcs")) or name == "filelist.txt":
+                outputs[os.path.join(directory, name)] = (project / directory / name).read_bytes()
+    return outputs
+
+
+def test_jobs_match(project):
+    fake_fxc = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_project",
+                            "fake_fxc.py")
+    command = '"{}" "{}" /T{{profile}} {{defines}} /Fo{{output}} {{source}}'.format(sys.executable, fake_fxc)
+    (project / "src" / "b_ps2x.fxc").write_text(SHADER.format('// DYNAMIC: "FOG" "0..1"\n// SKIP: $MODE && $FOG\n'))
+    outputs = []
+    for jobs in (1, 2):
+        result = shadercompile_utils.build(["list"], str(project / "game"), str(project), str(project / "bin"),
+                                           str(project), jobs=jobs, rebuild=True, compiler=command, no_history=True)
+        assert result.success
+        outputs.append(read_outputs(project))
+    assert len(outputs[0]) == 9 and outputs[0] == outputs[1]
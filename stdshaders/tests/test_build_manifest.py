@@ -0,0 +1,45 @@
+import os
+
+import shadercompile_utils
+
+SHADER = """#include "{}"
+// STATIC: "MODE" "0..1"
+float4 main() : COLOR {{ return C; }}
+"""
+
+
+def make_project(tmp_path):
+    (tmp_path / "list.txt").write_text("a_ps2x.fxc\nb_ps2x.fxc\n")
+    (tmp_path / "a.h").write_text("#define C 1\n")
+    (tmp_path / "b.h").write_text("#include \"common.h\"\n")
+    (tmp_path / "common.h").write_text("#define C 2\n")
+    (tmp_path / "a_ps2x.fxc").write_text(SHADER.format("a.h"))
+    (tmp_path / "b_ps2x.fxc").write_text(SHADER.format("b.h"))
+    return tmp_path
+
+
+def prepped(project, **options):
+    """:return: Names of the shaders a dynamic build of ``project`` had to prep"""
+    result = shadercompile_utils.build(["list"], str(project / "game"), str(project), str(project / "bin"),
+                                       str(project), dynamic=True, **options)
+    assert result.success
+    return sorted(name for name, shader in result.shaders.items() if shader.prepped)
+
+
+def test_include_edit(tmp_path):
+    project = make_project(tmp_path)
+    assert prepped(project) == ["a_ps20", "a_ps20b", "b_ps20", "b_ps20b"]
+    assert prepped(project) == []
+    # Only the shaders that include it, directly or not
+    (project / "common.h").write_text("#define C 3\n")
+    assert prepped(project) == ["b_ps20", "b_ps20b"]
+    (project / "a.h").write_text("#define C 4\n")
+    assert prepped(project) == ["a_ps20", "a_ps20b"]
+
+
+def test_missing_output(tmp_path):
+    project = make_project(tmp_path)
+    prepped(project)
+    os.remove(str(project / "include" / "b_ps20.inc"))
+    assert prepped(project) == ["b_ps20"]
+    assert prepped(project, rebuild=True) == ["a_ps20", "a_ps20b", "b_ps20", "b_ps20b"]
@@ -0,0 +1,63 @@
+import threading
+
+from shadercompile_utils.combo_cache import CachedCompiler
+from shadercompile_utils.combo_cache import ComboCache
+from shadercompile_utils.combo_cache import combo_key
+from shadercompile_utils.scheduler import CompileJob
+from shadercompile_utils.scheduler import CompileResult
+
+DEFINES = [("TOTALSHADERCOMBOS", 8), ("MODE", 1), ("FOG", 0)]
+
+
+def test_combo_key():
+    key = combo_key("source", DEFINES, "ps_2_0", "fxc")
+    assert len(key) == 64 and key == combo_key("source", list(DEFINES), "ps_2_0", "fxc")
+    others = {
+        combo_key("other source", DEFINES, "ps_2_0", "fxc"),
+        combo_key("source", DEFINES[:1] + [("MODE", 2)] + DEFINES[2:], "ps_2_0", "fxc"),
+        combo_key("source", DEFINES, "ps_2_b", "fxc"),
+        combo_key("source", DEFINES, "ps_2_0", "newer fxc"),
+        # Parts can't run into each other
+        combo_key("sourceps_2_0", DEFINES, "", "fxc"),
+        combo_key("source", [("MODE", 11)], "ps_2_0", "fxc"),
+        combo_key("source", [("MODE", 1), ("1", 1)], "ps_2_0", "fxc"),
+    }
+    assert key not in others and len(others) == 7
+
+
+class CountingCompiler:
+    def __init__(self):
+        self.compiled = 0
+
+    def compile(self, job):
+        self.compiled += 1
+        return CompileResult(job, "{}:{}".format(job.shader_name, job.combo_index).encode(), "", 0, 0.5)
+
+
+def test_cached_compiler(tmp_path):
+    backend = CountingCompiler()
+    compiler = CachedCompiler(backend, ComboCache(str(tmp_path), 1 << 20), "fxc")
+    job = CompileJob("a_ps20", "a_ps2x.fxc", "ps_2_0", 3, DEFINES, source_digest="source")
+    first = compiler.compile(job)
+    second = compiler.compile(CompileJob("a_ps20", "a_ps2x.fxc", "ps_2_0", 3, DEFINES, source_digest="source"))
+    assert backend.compiled == 1 and not first.cached and second.cached
+    assert second.bytecode == first.bytecode == b"a_ps20:3"
+    compiler.compile(CompileJob("a_ps20", "a_ps2x.fxc", "ps_2_0", 3, DEFINES, source_digest="edited"))
+    assert backend.compiled == 2
+
+
+def test_size_accounting(tmp_path):
+    cache = ComboCache(str(tmp_path), 1000)
+    cache.put("ab" * 32, b"x" * 300)
+    cache.put("ab" * 32, b"x" * 200)
+    assert cache.size == 200
+    threads = [threading.Thread(target=cache.put, args=("cd" * 32, b"y" * 300)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.size == 500 and cache.evicted == 0
+    assert ComboCache(str(tmp_path), 1000).size == 500
+    # Only evicts once the files really go over the cap
+    cache.put("ef" * 32, b"z" * 600)
+    assert cache.evicted == 1 and cache.size <= 900
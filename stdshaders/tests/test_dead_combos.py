@@ -0,0 +1,63 @@
+import itertools
+import re
+
+from shadercompile_utils import fxc_file
+from shadercompile_utils.dead_combos import NOT_USED
+from shadercompile_utils.dead_combos import ONLY_IN_SKIPS
+from shadercompile_utils.dead_combos import find_dead_combos
+from shadercompile_utils.preprocessor import Preprocessor
+from shadercompile_utils.shader_type import DX9Shader
+from shadercompile_utils.skip_eval import SkipEvaluator
+
+SOURCE = """// STATIC: "MODE" "0..2"
+// STATIC: "UNUSED" "0..1"
+// DYNAMIC: "FOG" "0..1"
+// DYNAMIC: "ONLYSKIP" "0..1"
+// SKIP: $ONLYSKIP && $MODE == 2
+#if MODE == 1
+float4 main() : COLOR { return FOG; }
+#else
+float4 main() : COLOR { return MODE; }
+#endif
+"""
+
+_get_index_re = re.compile(r"\( 0x([0-9A-F]+) \* m_n(\w+) \)")
+
+
+def make_shader(tmp_path, collapse_dead):
+    path = tmp_path / "a_ps2x.fxc"
+    path.write_text(SOURCE)
+    shader = DX9Shader(str(path), "a_ps20")
+    shader.collapse_dead = collapse_dead
+    shader.generate(False)
+    return shader
+
+
+def test_find_dead_combos(tmp_path):
+    assert find_dead_combos(make_shader(tmp_path, False)) == {"UNUSED": NOT_USED, "ONLYSKIP": ONLY_IN_SKIPS}
+    # Only checked from the source once there are too many live combos to preprocess
+    assert find_dead_combos(make_shader(tmp_path, False), max_live_combos=4) == {"UNUSED": NOT_USED}
+
+
+def test_collapsed_get_index(tmp_path):
+    full = make_shader(tmp_path, False)
+    shader = make_shader(tmp_path, True)
+    assert sorted(shader.dead_combos) == ["ONLYSKIP", "UNUSED"]
+    assert "UNUSED=0..0" in shader.file_list_code and "MODE=0..2" in shader.file_list_code
+    strides = {name: int(stride, 16) for stride, name in _get_index_re.findall(shader.index_code)}
+    assert sorted(strides) == ["FOG", "MODE"]
+
+    collapsed = SkipEvaluator(shader.static_combos, shader.dynamic_combos, shader.skips)
+    assert collapsed.total == fxc_file.num_combos(shader.static_combos, shader.dynamic_combos) == 6
+    preprocessor = Preprocessor(fxc_file.read_input_file(shader.file_path + shader.file_name))
+    original = SkipEvaluator(full.static_combos, full.dynamic_combos, full.skips)
+    for index in range(original.total):
+        if original.is_skipped(index):
+            continue
+        values = original.decode(index)
+        # What the game's GetIndex picks, and the combo that was compiled there
+        collapsed_index = sum(stride * values[name] for name, stride in strides.items())
+        assert 0 <= collapsed_index < collapsed.total and not collapsed.is_skipped(collapsed_index)
+        compiled = collapsed.decode(collapsed_index)
+        assert all(compiled[name] == values[name] for name in strides)
+        assert preprocessor.digest(sorted(compiled.items())) == preprocessor.digest(sorted(values.items()))
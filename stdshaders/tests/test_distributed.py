@@ -0,0 +1,83 @@
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+
+import pytest
+
+from shadercompile_utils.distributed import Coordinator
+from shadercompile_utils.distributed import Worker
+from shadercompile_utils.distributed import worker_path
+from shadercompile_utils.scheduler import CompileJob
+from shadercompile_utils.scheduler import ShaderCompileResult
+
+FAKE_FXC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_project", "fake_fxc.py")
+COMMAND = '"{}" "{}" /T{{profile}} {{defines}} /Fo{{output}} {{source}}'.format(sys.executable, FAKE_FXC)
+
+
+def test_worker_path(tmp_path):
+    work_dir = str(tmp_path)
+    assert worker_path(work_dir, "common.h") == os.path.join(work_dir, "common.h")
+    for name in ("../common.h", "sub/../../common.h", os.path.abspath("/etc/passwd"), "sub/common.h", ".."):
+        with pytest.raises(ValueError):
+            worker_path(work_dir, name)
+
+
+def compile_with_workers(coordinator, workers, combos=4):
+    """Run ``combos`` jobs through ``coordinator`` on ``workers``, each in its own thread."""
+    jobs = [CompileJob("a_ps20", "a.fxc", "ps_2_0", index, [("MODE", index)]) for index in range(combos)]
+    results = {"a_ps20": ShaderCompileResult("a_ps20", combos)}
+    runner = threading.Thread(target=coordinator.run_jobs, args=(jobs, results), daemon=True)
+    runner.start()
+    threads = [threading.Thread(target=worker.run, args=(5.0,), daemon=True) for worker in workers]
+    try:
+        for thread in threads:
+            thread.start()
+        runner.join(10)
+        assert not runner.is_alive()
+    finally:
+        coordinator.close()
+    for thread in threads:
+        thread.join(10)
+        assert not thread.is_alive()
+    return results["a_ps20"]
+
+
+def test_token():
+    with pytest.raises(ValueError):
+        Coordinator({}, 0, "")
+    coordinator = Coordinator({"a.fxc": b"float4 main() : COLOR { return 0; }"}, 0, token="secret")
+    intruder = Worker("127.0.0.1", coordinator.port, COMMAND, token="guess")
+    result = compile_with_workers(coordinator, [intruder, Worker("127.0.0.1", coordinator.port, COMMAND,
+                                                                 token="secret")])
+    assert result.completed == 4 and not result.failures
+
+
+def test_worker_errors_are_reported():
+    coordinator = Coordinator({"a.fxc": b""}, 0)
+    result = compile_with_workers(coordinator, [Worker("127.0.0.1", coordinator.port, "fxc {unknown_field}")])
+    assert result.completed == 4 and len(result.failures) == 4
+    assert "unknown_field" in result.failures[0].output
+
+
+def test_bad_peers():
+    coordinator = Coordinator({"a.fxc": b""}, 0, heartbeat_timeout=2.0)
+    peers = []
+    for message in (json.dumps([]).encode(), json.dumps({'threads': 4}).encode(), b"not json",
+                    json.dumps({'type': 'result', 'chunk': 0}).encode()):
+        peer = socket.create_connection(("127.0.0.1", coordinator.port))
+        peer.sendall(struct.pack("!II", len(message), 0) + message)
+        peers.append(peer)
+    # Claims a 4 GiB payload before saying hello
+    huge = socket.create_connection(("127.0.0.1", coordinator.port))
+    huge.sendall(struct.pack("!II", 16, 0xffffffff))
+    # Never says anything
+    silent = socket.create_connection(("127.0.0.1", coordinator.port))
+    result = compile_with_workers(coordinator, [Worker("127.0.0.1", coordinator.port, COMMAND)])
+    assert result.completed == 4 and not result.failures
+    silent.settimeout(10)
+    assert silent.recv(1) == b""
+    for peer in peers + [huge, silent]:
+        peer.close()
@@ -0,0 +1,29 @@
+import os
+import stat
+
+import pytest
+
+from shadercompile_utils.file_utils import write_bytes_atomic
+from shadercompile_utils.file_utils import write_if_changed
+
+
+def test_write_if_changed(tmp_path):
+    path = str(tmp_path / "a_ps20.inc")
+    assert write_if_changed(path, "one\n")
+    assert not write_if_changed(path, "one\n")
+    assert write_if_changed(path, "two\n")
+    assert open(path).read() == "two\n"
+    assert os.listdir(str(tmp_path)) == ["a_ps20.inc"]
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="No umask on Windows")
+@pytest.mark.parametrize("umask", [0o022, 0o077, 0o002])
+def test_umask(tmp_path, umask):
+    old_umask = os.umask(umask)
+    try:
+        write_bytes_atomic(str(tmp_path / "a.vcs"), b"data")
+        write_if_changed(str(tmp_path / "a.inc"), "data")
+    finally:
+        os.umask(old_umask)
+    for name in ("a.vcs", "a.inc"):
+        assert stat.S_IMODE(os.stat(str(tmp_path / name)).st_mode) == 0o666 & ~umask
@@ -0,0 +1,43 @@
+from shadercompile_utils.fxc_file import ParsedSource
+from shadercompile_utils.fxc_file import parse_input_file
+
+SOURCE = """// STATIC: "CONVERT_TO_SRGB" "0..1" [ps20b] [=1]
+// STATIC: "MODE" "0..3" [=2]
+//  DYNAMIC: "FOG" "0..1"
+// DYNAMIC: "LIGHTS" "0..4" [ps20b]
+// DYNAMIC: "XBOX_ONLY" "0..1" [XBOX]
+// SKIP: $MODE == 3 && $FOG
+// SKIP: $CONVERT_TO_SRGB [ps20]
+// CENTROID: TEXCOORD1
+// CENTROID: TEXCOORD3
+// STATIC "NOT_A_DIRECTIVE" "0..1"
+float4 main() : COLOR { return 0; } // SKIP: not at the start of the line
+"""
+
+
+def test_specialize():
+    parsed = ParsedSource(SOURCE.splitlines(True))
+    static_combos, dynamic_combos, static_defs, skips, centroid_mask = parsed.specialize("a_ps20")
+    assert [repr(combo) for combo in dynamic_combos + static_combos] == [
+        "Combo('FOG', 0, 1, 1)", "Combo('MODE', 0, 3, 2)"]
+    assert static_defs == {"MODE": "2"}
+    assert skips == ["$MODE == 3 && $FOG", "$CONVERT_TO_SRGB"]
+    assert centroid_mask == 2 | 8
+
+    static_combos, dynamic_combos, static_defs, skips, centroid_mask = parsed.specialize("a_ps20b")
+    assert [repr(combo) for combo in dynamic_combos + static_combos] == [
+        "Combo('FOG', 0, 1, 1)", "Combo('LIGHTS', 0, 4, 2)", "Combo('CONVERT_TO_SRGB', 0, 1, 10)",
+        "Combo('MODE', 0, 3, 20)"]
+    assert static_defs == {"CONVERT_TO_SRGB": "1", "MODE": "2"}
+    assert skips == ["$MODE == 3 && $FOG"]
+    assert centroid_mask == 2 | 8
+
+    # Annotations only name pixel shader versions, a vertex shader gets everything else
+    static_combos, dynamic_combos, _, _, _ = parsed.specialize("a_vs20")
+    assert [combo.name for combo in dynamic_combos + static_combos] == ["FOG", "LIGHTS", "CONVERT_TO_SRGB", "MODE"]
+
+
+def test_parsed_once(tmp_path):
+    path = tmp_path / "a_ps2x.fxc"
+    path.write_text(SOURCE)
+    assert parse_input_file(str(path)) is parse_input_file(str(path))
@@ -0,0 +1,45 @@
+import os
+
+from shadercompile_utils.fxc_file import Combo
+from shadercompile_utils.history import BuildHistory
+from shadercompile_utils.history import estimate_costs
+from shadercompile_utils.history import record_vcs_times
+
+
+class FakeShader:
+    type = "fxc"
+    compile_vcs = True
+
+    def __init__(self, shader_name, skips):
+        self.shader_name = shader_name
+        self.static_combos = [Combo("MODE", 0, 3, 2)]
+        self.dynamic_combos = [Combo("FOG", 0, 1)]
+        self.skips = skips
+
+
+def test_estimate_costs(tmp_path):
+    history = BuildHistory(str(tmp_path / "history.db"))
+    history.record("a_ps20", "ps_2_0", 8, 8, 4.0)
+    shaders = [FakeShader("a_ps20", ["defined $MODE && $MODE == 3"]), FakeShader("b_ps20", ["$MODE @ 1"])]
+    estimates = estimate_costs(shaders, history)
+    assert estimates["a_ps20"].combos == 6
+    assert estimates["a_ps20"].seconds == 3.0
+    # Unparsable SKIPs count every combo rather than failing the build
+    assert estimates["b_ps20"].combos == 8
+    assert estimates["b_ps20"].seconds == 4.0
+    history.close()
+
+
+def test_record_vcs_times(tmp_path):
+    history = BuildHistory(str(tmp_path / "history.db"))
+    shaders = [FakeShader("a_ps20", []), FakeShader("b_ps20", []), FakeShader("c_ps20", [])]
+    for name, mtime in (("a_ps20", 110), ("b_ps20", 104), ("c_ps20", 90)):
+        path = str(tmp_path / (name + ".vcs"))
+        open(path, "wb").close()
+        os.utime(path, (mtime, mtime))
+    record_vcs_times(history, shaders, str(tmp_path), 100, 2)
+    assert history.per_combo_seconds("b_ps20", "ps_2_0") == 1.0
+    assert history.per_combo_seconds("a_ps20", "ps_2_0") == 1.5
+    # Left over from an earlier build
+    assert history.last_combos("c_ps20") is None
+    history.close()
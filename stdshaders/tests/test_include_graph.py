@@ -0,0 +1,45 @@
+import os
+
+from shadercompile_utils.include_graph import IncludeGraph
+
+
+def write(path, *lines):
+    path.write_text("".join(line + "\n" for line in lines))
+    return os.path.normpath(str(path))
+
+
+def test_include_once(tmp_path):
+    guarded = write(tmp_path / "guarded.h", "// comment", "#ifndef GUARDED_H", "#define GUARDED_H", "guarded", "#endif")
+    once = write(tmp_path / "once.h", "#pragma once", "once")
+    write(tmp_path / "plain.h", "plain")
+    write(tmp_path / "both.h", '#include "guarded.h"', '#include "once.h"', '#include "plain.h"')
+    root = write(tmp_path / "a.fxc", '#include "both.h"', '#include "guarded.h"', '#include "once.h"',
+                 '#include "plain.h"', "main")
+    graph = IncludeGraph()
+    assert [line.strip() for line in graph.flatten(root)] == [
+        "// comment", "#ifndef GUARDED_H", "#define GUARDED_H", "guarded", "#endif", "#pragma once", "once",
+        "plain", "plain", "main"]
+    assert graph.get(guarded).include_once and graph.get(once).include_once
+    assert not graph.get(str(tmp_path / "plain.h")).include_once
+    # Not a guard, the #endif doesn't close the whole file
+    write(tmp_path / "partial.h", "#ifndef A", "#define A", "#endif", "after")
+    assert not graph.get(str(tmp_path / "partial.h")).include_once
+
+
+def test_dependents(tmp_path):
+    os.mkdir(str(tmp_path / "shared"))
+    common = write(tmp_path / "shared" / "common.h", "#pragma once", "common")
+    write(tmp_path / "a.h", '#include "common.h"')
+    a = write(tmp_path / "a.fxc", '#include "a.h"', "a")
+    b = write(tmp_path / "b.fxc", "b")
+    graph = IncludeGraph()
+    # common.h isn't next to a.h, it's found in the search directories
+    graph.search_dirs = [str(tmp_path / "shared")]
+    assert graph.dependencies(a) == [os.path.normpath(str(tmp_path / "a.h")), common]
+    graph.dependencies(b)
+    assert graph.dependents(common) == {a}
+    assert graph.affected([common, b]) == {a, b}
+
+    write(tmp_path / "shared" / "common.h", "#pragma once", "changed")
+    assert graph.invalidate([common]) == {a}
+    assert "changed\n" in graph.flatten(a)
@@ -0,0 +1,106 @@
+import os
+
+from shadercompile_utils.fxc_file import Combo
+from shadercompile_utils.include_graph import get_graph
+from shadercompile_utils.journal import BuildJournal
+from shadercompile_utils.scheduler import CompileJob
+from shadercompile_utils.scheduler import CompileResult
+from shadercompile_utils.skip_eval import SkipEvaluator
+
+
+class FakeShader:
+    def __init__(self, directory, skips):
+        self.shader_name = "a_ps20"
+        self.file_path = directory + os.sep
+        self.file_name = "a.fxc"
+        self.file_list_code = ""
+        self.static_defs = {}
+        self.centroid_mask = 0
+        # Strides as generate() sets them, dynamic combos first
+        self.static_combos = [Combo("MODE", 0, 3, 2)]
+        self.dynamic_combos = [Combo("FOG", 0, 1)]
+        self.skips = skips
+
+
+def make_shader(tmp_path, skips=("$MODE == 3 && $FOG",)):
+    with open(str(tmp_path / "a.fxc"), "w") as source_file:
+        source_file.write("float4 main() : COLOR { return 0; }\n")
+    return FakeShader(str(tmp_path), list(skips))
+
+
+def open_journal(journal_dir, shader, resume):
+    journal = BuildJournal(journal_dir, "fxc 1", resume)
+    evaluator = SkipEvaluator(shader.static_combos, shader.dynamic_combos, shader.skips)
+    return journal, journal.open(shader, evaluator)
+
+
+def record(journal, shader, indices):
+    for index in indices:
+        job = CompileJob(shader.shader_name, shader.file_name, "ps_2_0", index, [])
+        journal.record(CompileResult(job, "combo {}".format(index).encode(), "", 0, 0.0))
+
+
+def shard_files(journal_dir):
+    return sorted(name for name in os.listdir(journal_dir) if name.endswith(".journal"))
+
+
+def test_resume_after_partial_shard(tmp_path):
+    journal_dir = str(tmp_path / "journal")
+    shader = make_shader(tmp_path)
+    journal, done = open_journal(journal_dir, shader, False)
+    assert done == {}
+    # Static combos 0 and 3 complete, 3 only has one live combo; 1 is halfway
+    record(journal, shader, [0, 1, 6, 2])
+    journal.close()
+    path = os.path.join(journal_dir, shard_files(journal_dir)[0])
+    complete_size = os.path.getsize(path)
+    # Killed while writing static combo 2
+    with open(path, "ab") as shard_file:
+        shard_file.write(b"\0\0\0\2\0\0\0\2\0\0")
+
+    journal, done = open_journal(journal_dir, shader, True)
+    assert done == {index: "combo {}".format(index).encode() for index in (0, 1, 6)}
+    assert os.path.getsize(path) == complete_size
+    # Carries on in the same shard
+    record(journal, shader, [2, 3, 4, 5])
+    journal.close()
+    journal, done = open_journal(journal_dir, shader, True)
+    assert sorted(done) == [0, 1, 2, 3, 4, 5, 6]
+    journal.finish(shader.shader_name)
+    assert shard_files(journal_dir) == []
+
+
+def test_skip_edit_invalidates(tmp_path):
+    journal_dir = str(tmp_path / "journal")
+    shader = make_shader(tmp_path)
+    journal, _ = open_journal(journal_dir, shader, False)
+    record(journal, shader, [0, 1])
+    journal.close()
+
+    shader.skips = ["$MODE == 2"]
+    journal, done = open_journal(journal_dir, shader, True)
+    assert done == {} and shard_files(journal_dir) == []
+    record(journal, shader, [0, 1])
+    journal.close()
+
+    # So does a source edit
+    with open(str(tmp_path / "a.fxc"), "a") as source_file:
+        source_file.write("// edited\n")
+    # As the next build would
+    get_graph().refresh(get_graph().search_dirs)
+    journal, done = open_journal(journal_dir, shader, True)
+    assert done == {}
+    journal.close()
+
+
+def test_fresh_build_discards_shards(tmp_path):
+    journal_dir = str(tmp_path / "journal")
+    shader = make_shader(tmp_path)
+    journal, _ = open_journal(journal_dir, shader, False)
+    record(journal, shader, [0, 1])
+    journal.close()
+    assert shard_files(journal_dir)
+
+    journal, done = open_journal(journal_dir, shader, False)
+    assert done == {} and shard_files(journal_dir) == []
+    journal.close()
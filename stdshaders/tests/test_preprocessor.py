@@ -0,0 +1,50 @@
+import pytest
+
+from shadercompile_utils.preprocessor import Preprocessor
+from shadercompile_utils.preprocessor import parse_integer
+from shadercompile_utils.skip_eval import SkipSyntaxError
+
+
+def preprocess(*lines):
+    return Preprocessor([line + "\n" for line in lines])
+
+
+def test_parse_integer():
+    assert parse_integer("0") == 0
+    assert parse_integer("42") == 42
+    assert parse_integer("0x1F") == parse_integer("0X1f") == 31
+    assert parse_integer("017") == 15
+    assert parse_integer("10u") == parse_integer("10UL") == parse_integer("10lu") == parse_integer("10ull") == 10
+    assert parse_integer("0xFFul") == 255
+    for literal in ("08", "019", "1.5", "1e3", "0x", "10lul", "10uu", "0xG"):
+        with pytest.raises(SkipSyntaxError):
+            parse_integer(literal)
+
+
+def test_if_literals():
+    source = preprocess("#if MODE == 0x10 || MODE == 010 || MODE == 3u", "on", "#endif")
+    assert source.digest([("MODE", 16)]) == source.digest([("MODE", 8)]) == source.digest([("MODE", "3")])
+    assert source.digest([("MODE", 16)]) != source.digest([("MODE", 10)]) == source.digest([])
+
+
+def test_if_defined_and_elif():
+    source = preprocess("#if defined( A ) && !defined B", "a", "#elif B + 1 > 1", "b", "#else", "c", "#endif")
+    digests = {source.digest(defines) for defines in ([("A", 1)], [("A", 1), ("B", 0)], [("B", 1)], [])}
+    assert len(digests) == 3
+    assert source.digest([("A", 1), ("B", 0)]) == source.digest([])
+    assert source.digest([("A", 1), ("B", 1)]) == source.digest([("B", 1)])
+
+
+def test_macros_used_in_code():
+    source = preprocess("#define SCALE FACTOR * 2", "x = SCALE;")
+    assert source.digest([("FACTOR", 1)]) != source.digest([("FACTOR", 2)])
+    # A define the code never reaches doesn't change it
+    assert source.digest([("FACTOR", 1), ("OTHER", 1)]) == source.digest([("FACTOR", 1), ("OTHER", 2)])
+
+
+def test_invalid_literal():
+    source = preprocess("#if MODE == 08", "on", "#endif")
+    with pytest.raises(SkipSyntaxError):
+        source.digest([("MODE", 8)])
+    # Only branches that are evaluated matter
+    assert preprocess("#if 0", "#if 08", "#endif", "#endif").digest([]) == preprocess().digest([])
@@ -0,0 +1,48 @@
+import socket
+import threading
+
+import pytest
+
+from shadercompile_utils.remote_cache import MAX_BODY
+from shadercompile_utils.remote_cache import RemoteCache
+from shadercompile_utils.remote_cache import RemoteCacheServer
+
+KEY = "ab" * 32
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = RemoteCacheServer(str(tmp_path), 1 << 20, 0, token="secret")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_uploads_need_the_token(server):
+    url = "127.0.0.1:{}".format(server.port)
+    anonymous = RemoteCache(url)
+    anonymous.put(KEY, b"bytecode")
+    anonymous.flush()
+    assert anonymous.uploaded == 0 and anonymous.refused and anonymous.available
+    assert not server.cache.contains(KEY)
+
+    client = RemoteCache(url, token="secret")
+    client.put(KEY, b"bytecode")
+    client.flush()
+    assert client.uploaded == 1
+    # Lookups don't need it
+    assert RemoteCache(url).get_many([KEY, "cd" * 32]) == {KEY: b"bytecode"}
+
+
+def test_refused_before_the_body(server):
+    # A stranger announcing the largest body allowed is turned away without the server waiting for it
+    with socket.create_connection(("127.0.0.1", server.port), timeout=5) as sock:
+        sock.sendall("POST /v1/put HTTP/1.1\r\nHost: cache\r\nContent-Length: {}\r\n\r\n".format(MAX_BODY).encode())
+        assert sock.recv(1024).startswith(b"HTTP/1.1 403")
+
+
+def test_token_required_beyond_loopback(tmp_path):
+    with pytest.raises(ValueError):
+        RemoteCacheServer(str(tmp_path), 1 << 20, 0, "")
@@ -0,0 +1,105 @@
+import threading
+import time
+
+from shadercompile_utils.scheduler import CompileResult
+from shadercompile_utils.scheduler import Scheduler
+from shadercompile_utils.scheduler import combo_defines
+from shadercompile_utils.scheduler import group_combos
+from shadercompile_utils.scheduler import shader_jobs
+from shadercompile_utils.shader_type import DX9Shader
+from shadercompile_utils.skip_eval import SkipEvaluator
+
+SOURCE = """// STATIC: "MODE" "0..2"
+// DYNAMIC: "FOG" "0..1"
+// SKIP: $MODE == 2 && $FOG
+float4 main() : COLOR { return MODE + FOG; }
+"""
+
+
+def make_shader(tmp_path, shader_name, source=SOURCE):
+    path = tmp_path / (shader_name[:-2] + "2x.fxc")
+    path.write_text(source)
+    shader = DX9Shader(str(path), shader_name)
+    shader.generate(True)
+    return shader
+
+
+class FakeBackend:
+    """Bytecode made of the defines, finishing out of order."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.compiled = []
+        self._lock = threading.Lock()
+
+    def compile(self, job):
+        time.sleep(0.002 * (job.combo_index % 3))
+        with self._lock:
+            self.compiled.append((job.shader_name, job.combo_index))
+        if (job.shader_name, job.combo_index) in self.fail:
+            return CompileResult(job, None, "error X3000", 1, 0.0)
+        return CompileResult(job, repr(job.defines).encode(), "", 0, 0.0)
+
+
+def test_threads_match(tmp_path):
+    shaders = [make_shader(tmp_path, "a_ps20"), make_shader(tmp_path, "b_ps20b")]
+    one = Scheduler(FakeBackend(), 1).run(shaders)
+    many = Scheduler(FakeBackend(), 4).run(shaders)
+    for name in ("a_ps20", "b_ps20b"):
+        assert one[name].done and many[name].done
+        assert one[name].expected == one[name].completed == 5
+        assert sorted(one[name].bytecode) == [0, 1, 2, 3, 4]
+        assert one[name].bytecode == many[name].bytecode
+
+
+def test_defines(tmp_path):
+    shader = make_shader(tmp_path, "a_ps20")
+    evaluator = SkipEvaluator(shader.static_combos, shader.dynamic_combos, shader.skips)
+    assert combo_defines(shader, evaluator, 3) == [
+        ("TOTALSHADERCOMBOS", 6), ("CENTROIDMASK", 0), ("NUMDYNAMICCOMBOS", 2), ("FLAGS", "0x0"), ("main", "main"),
+        ("SHADER_MODEL_PS_2_0", 1), ("FOG", 1), ("MODE", 1)]
+
+
+def test_plan_and_failures(tmp_path):
+    small = make_shader(tmp_path, "a_ps20")
+    big = make_shader(tmp_path, "big_ps20", SOURCE + "// padding\n" * 100)
+    scheduler = Scheduler(FakeBackend(fail=[("a_ps20", 1)]), 1)
+    assert [shader for shader, _, _ in scheduler.plan([small, big])] == [big, small]
+    results = scheduler.run([small, big])
+    # Longest first
+    assert scheduler.backend.compiled[0][0] == "big_ps20"
+    assert [failure.job.combo_index for failure in results["a_ps20"].failures] == [1]
+    assert results["a_ps20"].done and sorted(results["a_ps20"].bytecode) == [0, 2, 3, 4]
+
+
+DEDUP_SOURCE = """// STATIC: "MODE" "0..2"
+// DYNAMIC: "FOG" "0..1"
+#if MODE == 1
+float4 main() : COLOR { return FOG; }
+#else
+float4 main() : COLOR { return 0; }
+#endif
+"""
+
+
+def test_group_combos(tmp_path):
+    shader = make_shader(tmp_path, "a_ps20", DEDUP_SOURCE)
+    evaluator = SkipEvaluator(shader.static_combos, shader.dynamic_combos, shader.skips)
+    # FOG only matters with MODE 1
+    assert group_combos(shader, evaluator, range(6)) == [[0, 1, 4, 5], [2], [3]]
+    jobs = list(shader_jobs(shader, evaluator, 0, dedup=True))
+    assert [(job.combo_index, job.aliases) for job in jobs] == [(0, [1, 4, 5]), (2, []), (3, [])]
+
+    backend = FakeBackend()
+    results = Scheduler(backend, 2, dedup=True).run([shader])["a_ps20"]
+    assert len(backend.compiled) == results.compiled == 3
+    assert results.done and results.completed == 6
+    assert results.bytecode[5] == results.bytecode[0] != results.bytecode[2]
+
+
+def test_group_combos_fallback(tmp_path):
+    shader = make_shader(tmp_path, "a_ps20", DEDUP_SOURCE.replace("MODE == 1", "MODE == 08"))
+    evaluator = SkipEvaluator(shader.static_combos, shader.dynamic_combos, shader.skips)
+    # Can't be preprocessed, so every combo is compiled
+    jobs = list(shader_jobs(shader, evaluator, 0, dedup=True))
+    assert [(job.combo_index, job.aliases) for job in jobs] == [(index, []) for index in range(6)]
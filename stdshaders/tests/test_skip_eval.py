@@ -0,0 +1,117 @@
+import itertools
+
+import pytest
+
+from shadercompile_utils.fxc_file import Combo
+from shadercompile_utils.skip_eval import SkipEvaluator
+from shadercompile_utils.skip_eval import SkipSyntaxError
+from shadercompile_utils.skip_eval import parse_skip
+from shadercompile_utils.skip_eval import skip_variables
+
+
+def make_combos(*ranges, stride=1):
+    """
+    :param stride: Stride of the first combo, the number of dynamic combos for static ones
+    :return: List of :class:`Combo` from ``(name, min, max)``, strides laid out as ``GetIndex`` does
+    """
+    combos = []
+    for name, min_value, max_value in ranges:
+        combos.append(Combo(name, min_value, max_value, stride))
+        stride *= max_value - min_value + 1
+    return combos
+
+
+def brute_force_live(static_combos, dynamic_combos, skip):
+    """Count live combos by evaluating ``skip`` as Python, one combo at a time."""
+    combos = dynamic_combos + static_combos
+    expression = skip.replace("&&", " and ").replace("||", " or ").replace("!", " not ").replace(" not =", "!=")
+    live = 0
+    for values in itertools.product(*[range(combo.min, combo.max + 1) for combo in combos]):
+        names = dict(zip(("_" + combo.name for combo in combos), values))
+        if not eval(expression.replace("$", "_"), {}, names):
+            live += 1
+    return live
+
+
+# SKIPs as they appear in the SDK's stock shaders
+STOCK_SKIPS = [
+    "$LIGHTING_PREVIEW && $FASTPATH",
+    "( $FLASHLIGHT == 0 ) && ( $FLASHLIGHTSHADOWS == 1 )",
+    "!$FASTPATH && $FASTPATHENVMAPCONTRAST",
+    "$FASTPATH && $NUM_LIGHTS > 2",
+    "( $DETAILTEXTURE == 0 ) && ( $DETAIL_BLEND_MODE != 0 )",
+    "$SEAMLESS && $DETAILTEXTURE",
+]
+
+
+@pytest.mark.parametrize("skip", STOCK_SKIPS)
+def test_stock_skips(skip):
+    dynamic_combos = make_combos(("NUM_LIGHTS", 0, 4))
+    static_combos = make_combos(("LIGHTING_PREVIEW", 0, 2), ("FASTPATH", 0, 1), ("FLASHLIGHT", 0, 1),
+                                ("FLASHLIGHTSHADOWS", 0, 1), ("FASTPATHENVMAPCONTRAST", 0, 1),
+                                ("DETAILTEXTURE", 0, 1), ("DETAIL_BLEND_MODE", 0, 6), ("SEAMLESS", 0, 1), stride=5)
+    evaluator = SkipEvaluator(static_combos, dynamic_combos, [skip])
+    live = brute_force_live(static_combos, dynamic_combos, skip)
+    assert evaluator.count_live() == live
+    assert sum(len(batch) for batch in evaluator.live_indices()) == live
+
+
+def test_defined():
+    static_combos = make_combos(("LIGHTING_PREVIEW", 0, 2), ("FASTPATH", 0, 1))
+    skip = "defined $LIGHTING_PREVIEW && defined $FASTPATH && $LIGHTING_PREVIEW && $FASTPATH"
+    evaluator = SkipEvaluator(static_combos, [], [skip])
+    assert evaluator.count_live() == 4
+    assert evaluator.unknown_variables == []
+
+    # Not a combo of this shader, so never defined
+    assert SkipEvaluator(static_combos, [], ["defined $FLASHLIGHT"]).count_live() == 6
+    assert SkipEvaluator(static_combos, [], ["defined( $FASTPATH )"]).count_live() == 0
+    assert SkipEvaluator(static_combos, [], ["!defined $FLASHLIGHT && $FASTPATH"]).count_live() == 3
+
+
+def test_defined_needs_a_variable():
+    with pytest.raises(SkipSyntaxError):
+        parse_skip("defined 1")
+    with pytest.raises(SkipSyntaxError):
+        parse_skip("defined( $A")
+
+
+def test_c_semantics():
+    static_combos = make_combos(("A", -3, 3), ("B", 0, 2))
+    evaluator = SkipEvaluator(static_combos, [], ["$A / 2 == -1", "$B ? $A % 2 == -1 : 0", "$A / $B == 3"])
+    skipped = [values for values in map(evaluator.decode, range(evaluator.total))
+               if int(values['A'] / 2) == -1 or (values['B'] and values['A'] % 2 and values['A'] < 0)
+               or (values['B'] and int(values['A'] / values['B']) == 3)]
+    assert evaluator.count_live() == evaluator.total - len(skipped)
+    assert all(evaluator.is_skipped(index) for index in range(evaluator.total)
+               if evaluator.decode(index) in skipped)
+
+
+def test_precedence():
+    assert parse_skip("$A || $B && $C") == ('||', ('var', 'A'), ('&&', ('var', 'B'), ('var', 'C')))
+    assert parse_skip("$A + 1 << 2") == ('<<', ('+', ('var', 'A'), ('num', 1)), ('num', 2))
+    assert skip_variables(parse_skip("defined $A && $B ? $C : 0")) == {'B', 'C'}
+
+
+def test_live_ranges():
+    dynamic_combos = make_combos(("B", 0, 3))
+    static_combos = make_combos(("A", 0, 1), stride=4)
+    evaluator = SkipEvaluator(static_combos, dynamic_combos, ["$A && $B >= 2"])
+    assert list(evaluator.live_ranges()) == [(0, 5)]
+    assert list(SkipEvaluator(static_combos, dynamic_combos, ["$B == 1"]).live_ranges()) == [(0, 0), (2, 4), (6, 7)]
+
+
+def test_constant_skips():
+    static_combos = make_combos(("A", 0, 2), ("B", 0, 1))
+    # $X is a combo of another target only, so the SKIP doesn't depend on any combo of this one
+    for skip, live in (("$X", list(range(6))), ("!$X", []), ("1", []), ("$X || $A == 1", [0, 2, 3, 5])):
+        evaluator = SkipEvaluator(static_combos, [], [skip])
+        assert evaluator.count_live() == len(live)
+        indices = [int(index) for batch in evaluator.live_indices(batch_size=4) for index in batch]
+        assert indices == live
+
+
+def test_syntax_errors():
+    for skip in ("$A &&", "($A", "$A $B", "$A @ 1"):
+        with pytest.raises(SkipSyntaxError):
+            parse_skip(skip)
@@ -0,0 +1,31 @@
+from shadercompile_utils.fxc_file import Combo
+from shadercompile_utils.fxc_file import collapse_combos
+from shadercompile_utils.skip_eval import SkipEvaluator
+from shadercompile_utils.smoke import representative_combo
+
+
+class FakeShader:
+    def __init__(self, dead=(), skips=()):
+        self.dynamic_combos = [Combo("FOG", 0, 1)]
+        self.static_combos = [Combo("MODE", 0, 1), Combo("LIGHTS", 0, 2), Combo("SRGB", 0, 1)]
+        self.static_defs = {"MODE": "1", "LIGHTS": "2", "SRGB": "1"}
+        self.skips = list(skips)
+        collapse_combos(self.static_combos, self.dynamic_combos, set(dead))
+
+
+def representative_values(shader):
+    evaluator = SkipEvaluator(shader.static_combos, shader.dynamic_combos, shader.skips)
+    index = representative_combo(shader, evaluator)
+    assert 0 <= index < evaluator.total
+    return evaluator.decode(index)
+
+
+def test_defaults():
+    assert representative_values(FakeShader()) == {"FOG": 0, "MODE": 1, "LIGHTS": 2, "SRGB": 1}
+    # Ruled out by a SKIP, the first live combo is used instead
+    assert representative_values(FakeShader(skips=["$LIGHTS == 2"])) == {"FOG": 0, "MODE": 0, "LIGHTS": 0,
+                                                                         "SRGB": 0}
+
+
+def test_collapsed_combos():
+    assert representative_values(FakeShader(dead=["LIGHTS"])) == {"FOG": 0, "MODE": 1, "LIGHTS": 0, "SRGB": 1}
@@ -0,0 +1,78 @@
+import os
+
+from shadercompile_utils import sync
+from shadercompile_utils.sync import FileSync
+
+
+def write(path, data):
+    with open(str(path), "wb") as out_file:
+        out_file.write(data)
+
+
+def read(path):
+    with open(str(path), "rb") as in_file:
+        return in_file.read()
+
+
+def test_unchanged_skipped(tmp_path):
+    src, dst = tmp_path / "a.vcs", tmp_path / "out.vcs"
+    write(src, b"combos")
+    syncer = FileSync(str(tmp_path / "sync.json"))
+    syncer.sync([(str(src), str(dst))])
+    assert syncer.take_stats().copied == 1
+    syncer.save()
+
+    syncer = FileSync(str(tmp_path / "sync.json"))
+    syncer.sync([(str(src), str(dst))])
+    # Touched but the same, e.g. checked out again
+    os.utime(str(src), ns=(1, 1))
+    syncer.sync([(str(src), str(dst))])
+    stats = syncer.take_stats()
+    assert stats.copied == 0 and stats.skipped == 2 and stats.skipped_bytes == 12
+
+
+def test_changed_replaced(tmp_path):
+    src, dst = tmp_path / "a.vcs", tmp_path / "out.vcs"
+    write(src, b"combos")
+    syncer = FileSync(str(tmp_path / "sync.json"))
+    syncer.sync([(str(src), str(dst))])
+    # The second edit keeps the size, only its time and hash give it away
+    for mtime, data in ((1000, b"more combos"), (2000, b"less combos")):
+        write(src, data)
+        os.utime(str(src), ns=(mtime, mtime))
+        syncer.sync([(str(src), str(dst))])
+        assert read(dst) == data
+    # Edited at the destination
+    write(dst, b"edited")
+    syncer.sync([(str(src), str(dst))])
+    assert read(dst) == b"less combos"
+    assert syncer.take_stats().copied == 4
+    assert sorted(os.listdir(str(tmp_path))) == ["a.vcs", "out.vcs"]
+
+
+def test_link(tmp_path):
+    src, dst = tmp_path / "a.h", tmp_path / "out.h"
+    write(src, b"#define A 1\n")
+    syncer = FileSync(str(tmp_path / "sync.json"))
+    syncer.sync([(str(src), str(dst))], link=True)
+    assert syncer.take_stats().linked == 1 and os.path.samefile(str(src), str(dst))
+    syncer.sync([(str(src), str(dst))], link=True)
+    assert syncer.take_stats().skipped == 1
+
+
+def test_copy_when_linking_fails(tmp_path, monkeypatch):
+    def refuse(*args):
+        raise OSError("Not supported")
+
+    class NoReflink:
+        ioctl = staticmethod(refuse)
+
+    monkeypatch.setattr(os, "link", refuse)
+    monkeypatch.setattr(sync, "fcntl", NoReflink)
+    src, dst = tmp_path / "a.h", tmp_path / "out.h"
+    write(src, b"#define A 1\n")
+    syncer = FileSync(str(tmp_path / "sync.json"))
+    syncer.sync([(str(src), str(dst))], link=True)
+    stats = syncer.take_stats()
+    assert stats.copied == 1 and stats.linked == 0 and stats.copied_bytes == 12
+    assert read(dst) == b"#define A 1\n" and not os.path.samefile(str(src), str(dst))
@@ -0,0 +1,27 @@
+from shadercompile_utils.vcs_file import read_vcs
+from shadercompile_utils.vcs_file import write_vcs
+
+# Compresses well, so its blocks are stored as LZMA
+LONG = b"mov r0, c0\n" * 200
+
+
+def test_roundtrip(tmp_path):
+    path = str(tmp_path / "a_ps20.vcs")
+    # Static combo 2 has the same code as 0, so it's stored as an alias of it
+    bytecode = {0: LONG, 1: b"short", 2: b"other", 4: LONG, 5: b"short"}
+    stats = write_vcs(path, bytecode, 6, 2, centroid_mask=3, source_crc=1234, threads=1)
+    assert stats.combos == 5 and stats.unique_bytecode == 3
+    assert stats.static_combos == 2 and stats.duplicate_static_combos == 1
+    assert stats.file_size < stats.uncompressed_size
+    vcs = read_vcs(path)
+    assert (vcs.total_combos, vcs.dynamic_combos, vcs.centroid_mask, vcs.source_crc) == (6, 2, 3, 1234)
+    assert vcs.aliases == {2: 0}
+    assert vcs.combos() == bytecode
+
+
+def test_uncompressed(tmp_path):
+    path = str(tmp_path / "a_ps20.vcs")
+    bytecode = {0: LONG, 3: b"short"}
+    stats = write_vcs(path, bytecode, 4, 2, compress=False, threads=1)
+    assert stats.file_size > len(LONG)
+    assert read_vcs(path).combos() == bytecode
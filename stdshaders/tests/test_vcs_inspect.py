@@ -0,0 +1,63 @@
+from shadercompile_utils.fxc_file import Combo
+from shadercompile_utils.vcs_file import HEADER
+from shadercompile_utils.vcs_file import write_vcs
+from shadercompile_utils.vcs_inspect import diff_builds
+from shadercompile_utils.vcs_inspect import inspect_vcs
+from shadercompile_utils.vcs_inspect import verify_vcs
+
+# Compresses well, so its blocks are stored as LZMA
+LONG = b"mov r0, c0\n" * 200
+
+
+class FakeShader:
+    def __init__(self, skips=()):
+        # Strides as generate() sets them, dynamic combos first
+        self.static_combos = [Combo("MODE", 0, 2, 2)]
+        self.dynamic_combos = [Combo("FOG", 0, 1)]
+        self.skips = list(skips)
+        self.centroid_mask = 0
+
+
+def test_inspect(tmp_path):
+    path = str(tmp_path / "a_ps20.vcs")
+    bytecode = {0: LONG, 1: b"short", 2: b"other", 4: LONG, 5: b"short"}
+    write_vcs(path, bytecode, 6, 2, threads=1)
+    info = inspect_vcs(path, sizes=True)
+    assert info.ok and info.shader_name == "a_ps20"
+    assert info.combos == 5 and info.compressed_blocks > 0
+    assert info.sizes == {index: len(blob) for index, blob in bytecode.items()}
+    assert inspect_vcs(path, count_combos=False).combos is None
+
+    with open(path, "rb") as vcs:
+        data = vcs.read()
+    with open(path, "wb") as vcs:
+        vcs.write(data[:HEADER.size + 4])
+    assert inspect_vcs(path).errors == ["truncated"]
+
+
+def test_verify(tmp_path):
+    path = str(tmp_path / "a_ps20.vcs")
+    write_vcs(path, {index: b"code" for index in (0, 1, 2, 3)}, 6, 2, threads=1)
+    assert verify_vcs(inspect_vcs(path, sizes=True), FakeShader(["$MODE == 2"])) == []
+    write_vcs(path, {index: b"code" for index in (0, 1, 2, 3, 4)}, 6, 2, threads=1)
+    assert verify_vcs(inspect_vcs(path, sizes=True), FakeShader(["$MODE == 1"])) == [
+        "5 combos stored, 4 expected after SKIPs", "missing combos 5", "skipped combos stored 2, 3"]
+    # Without sizes only the count is checked
+    assert verify_vcs(inspect_vcs(path), FakeShader(["$MODE == 1"])) == ["5 combos stored, 4 expected after SKIPs"]
+
+    write_vcs(path, {0: b"code"}, 4, 2, threads=1)
+    assert verify_vcs(inspect_vcs(path), FakeShader()) == ["header has 4 combos, the shader has 6"]
+
+
+def test_diff_builds(tmp_path):
+    (tmp_path / "old").mkdir()
+    (tmp_path / "new").mkdir()
+    write_vcs(str(tmp_path / "old" / "a_ps20.vcs"), {0: b"code", 1: b"code"}, 2, 2, threads=1)
+    write_vcs(str(tmp_path / "new" / "a_ps20.vcs"), {0: b"longer code", 1: b"code"}, 2, 2, threads=1)
+    write_vcs(str(tmp_path / "new" / "b_ps20.vcs"), {0: b"code"}, 1, 1, threads=1)
+    old = [inspect_vcs(str(tmp_path / "old" / "a_ps20.vcs"), sizes=True)]
+    new = [inspect_vcs(str(tmp_path / "new" / name), sizes=True) for name in ("a_ps20.vcs", "b_ps20.vcs")]
+    files, changes = diff_builds(old, new)
+    assert files["b_ps20"][0] is None and files["a_ps20"][0] < files["a_ps20"][1]
+    assert [(change.shader_name, change.combo_index, change.growth) for change in changes] == [
+        ("a_ps20", 0, 7), ("b_ps20", 0, 4)]